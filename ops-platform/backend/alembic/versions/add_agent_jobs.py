@@ -0,0 +1,54 @@
+"""Add agent jobs table
+
+Revision ID: add_agent_jobs
+Revises: add_alert_list_index
+Create Date: 2024-03-15
+
+Agent deploys and uninstalls run as background jobs; each row tracks one
+job and the progress of its steps.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers
+revision = 'add_agent_jobs'
+down_revision = 'add_alert_list_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'agent_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.Enum('DEPLOY', 'UNINSTALL', name='agentjobaction'), nullable=False),
+        sa.Column('resource_id', sa.Integer()),
+        sa.Column('host', sa.String(length=255), nullable=False),
+        sa.Column(
+            'status',
+            # Shared with the tasks table
+            postgresql.ENUM(
+                'PENDING', 'RUNNING', 'SUCCESS', 'FAILED', 'CANCELLED', name='taskstatus', create_type=False
+            ),
+            nullable=False
+        ),
+        sa.Column('steps', sa.JSON(), nullable=False),
+        sa.Column('current_step', sa.String(length=20)),
+        sa.Column('error', sa.Text()),
+        sa.Column('secrets_enc', sa.Text()),
+        sa.Column('parameters', sa.JSON()),
+        sa.Column('created_by', sa.String(length=100)),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        sa.Column('started_at', sa.DateTime(timezone=True)),
+        sa.Column('finished_at', sa.DateTime(timezone=True)),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_agent_jobs_id', 'agent_jobs', ['id'])
+    op.create_index('ix_agent_jobs_resource_id', 'agent_jobs', ['resource_id'])
+
+
+def downgrade():
+    op.drop_table('agent_jobs')
+    sa.Enum(name='agentjobaction').drop(op.get_bind(), checkfirst=True)
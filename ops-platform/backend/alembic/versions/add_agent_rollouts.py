@@ -0,0 +1,60 @@
+"""Add agent rollouts
+
+Revision ID: add_agent_rollouts
+Revises: add_agent_jobs
+Create Date: 2024-03-18
+
+Fleet-wide agent rollouts: one row per rollout, whose per-host agent jobs
+are tied to it with the batch they run in.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers
+revision = 'add_agent_rollouts'
+down_revision = 'add_agent_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'agent_rollouts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column(
+            'status',
+            # Shared with the tasks table
+            postgresql.ENUM(
+                'PENDING', 'RUNNING', 'SUCCESS', 'FAILED', 'CANCELLED', name='taskstatus', create_type=False
+            ),
+            nullable=False
+        ),
+        sa.Column('selector', sa.JSON(), nullable=False),
+        sa.Column('parallelism', sa.Integer(), nullable=False),
+        sa.Column('canary_size', sa.Integer(), nullable=False),
+        sa.Column('batch_size', sa.Integer(), nullable=False),
+        sa.Column('max_failure_rate', sa.Float(), nullable=False),
+        sa.Column('total_hosts', sa.Integer(), nullable=False),
+        sa.Column('batches', sa.Integer(), nullable=False),
+        sa.Column('current_batch', sa.Integer()),
+        sa.Column('skipped', sa.JSON()),
+        sa.Column('stop_reason', sa.Text()),
+        sa.Column('created_by', sa.String(length=100)),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        sa.Column('started_at', sa.DateTime(timezone=True)),
+        sa.Column('finished_at', sa.DateTime(timezone=True)),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_agent_rollouts_id', 'agent_rollouts', ['id'])
+    op.add_column('agent_jobs', sa.Column('rollout_id', sa.Integer()))
+    op.add_column('agent_jobs', sa.Column('batch', sa.Integer()))
+    op.create_index('ix_agent_jobs_rollout_id', 'agent_jobs', ['rollout_id'])
+
+
+def downgrade():
+    op.drop_index('ix_agent_jobs_rollout_id', table_name='agent_jobs')
+    op.drop_column('agent_jobs', 'batch')
+    op.drop_column('agent_jobs', 'rollout_id')
+    op.drop_table('agent_rollouts')
@@ -0,0 +1,74 @@
+"""Alert fingerprints and deduplication
+
+Revision ID: add_alert_fingerprint
+Revises: seed_alert_rules
+Create Date: 2024-03-06
+
+Adds `fingerprint`, `occurrences` and `last_seen_at` to alerts and a unique
+partial index allowing one open (firing/acknowledged) alert per fingerprint.
+Open alerts are fingerprinted the way app.services.alert_engine does
+(sha256 of "rule_id:resource_id:metric=<rule metric>"), and duplicate open
+rows left by the old per-sample inserts are folded into the newest one.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_alert_fingerprint'
+down_revision = 'seed_alert_rules'
+branch_labels = None
+depends_on = None
+
+OPEN = "('FIRING', 'ACKNOWLEDGED')"
+
+
+def upgrade():
+    op.add_column('alerts', sa.Column('fingerprint', sa.String(64), nullable=True))
+    op.add_column('alerts', sa.Column('occurrences', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('alerts', sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute(f"""
+        UPDATE alerts a
+        SET fingerprint = encode(sha256(convert_to(
+                a.rule_id::text || ':' || coalesce(a.resource_id::text, '') || ':metric=' || r.metric,
+                'UTF8')), 'hex'),
+            last_seen_at = coalesce(a.fired_at, now())
+        FROM alert_rules r
+        WHERE r.id = a.rule_id AND a.status IN {OPEN}
+    """)
+
+    # Keep the newest open row per fingerprint, counting the duplicates into it
+    op.execute(f"""
+        WITH ranked AS (
+            SELECT id,
+                   row_number() OVER (PARTITION BY fingerprint ORDER BY fired_at DESC, id DESC) AS rn,
+                   count(*) OVER (PARTITION BY fingerprint) AS n
+            FROM alerts
+            WHERE status IN {OPEN} AND fingerprint IS NOT NULL
+        )
+        UPDATE alerts SET occurrences = ranked.n
+        FROM ranked WHERE alerts.id = ranked.id AND ranked.rn = 1
+    """)
+    op.execute(f"""
+        WITH ranked AS (
+            SELECT id,
+                   row_number() OVER (PARTITION BY fingerprint ORDER BY fired_at DESC, id DESC) AS rn
+            FROM alerts
+            WHERE status IN {OPEN} AND fingerprint IS NOT NULL
+        )
+        UPDATE alerts SET status = 'RESOLVED', resolved_at = now()
+        FROM ranked WHERE alerts.id = ranked.id AND ranked.rn > 1
+    """)
+
+    op.create_index(
+        'uq_alerts_open_fingerprint', 'alerts', ['fingerprint'],
+        unique=True, postgresql_where=sa.text(f"status IN {OPEN}")
+    )
+
+
+def downgrade():
+    op.drop_index('uq_alerts_open_fingerprint', table_name='alerts')
+    op.drop_column('alerts', 'last_seen_at')
+    op.drop_column('alerts', 'occurrences')
+    op.drop_column('alerts', 'fingerprint')
@@ -0,0 +1,25 @@
+"""Alert list keyset index
+
+Revision ID: add_alert_list_index
+Revises: add_resource_heartbeat
+Create Date: 2024-03-12
+
+Adds a (fired_at, id) index so the alert list is paginated with a keyset
+condition on its sort key instead of OFFSET.
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = 'add_alert_list_index'
+down_revision = 'add_resource_heartbeat'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_alerts_fired_at_id', 'alerts', ['fired_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_alerts_fired_at_id', table_name='alerts')
@@ -0,0 +1,49 @@
+"""Composite and BRIN indexes for metric tables
+
+Revision ID: add_metric_indexes
+Revises: add_metric_rollups
+Create Date: 2024-03-01
+
+History and top-process reads filter on resource_id and a time range and
+order by time. With separate single-column indexes the planner has to
+bitmap-AND both and sort; a (resource_id, timestamp DESC) index answers them
+with one ordered index scan. A BRIN index on `timestamp` replaces the btree
+for fleet-wide range scans (rollup refresh) at a fraction of its size, since
+rows arrive in time order.
+
+Indexes created on the partitioned parent cascade to every daily partition,
+including the ones made later by `maintain_metric_partitions`.
+
+"""
+from alembic import op
+
+# revision identifiers
+revision = 'add_metric_indexes'
+down_revision = 'add_metric_rollups'
+branch_labels = None
+depends_on = None
+
+TABLES = ('metrics', 'process_metrics')
+
+
+def upgrade():
+    for table in TABLES:
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_resource_id_timestamp "
+            f"ON {table} (resource_id, timestamp DESC)"
+        )
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_timestamp_brin "
+            f"ON {table} USING brin (timestamp)"
+        )
+        # Both are covered by the new indexes
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_resource_id")
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_timestamp")
+
+
+def downgrade():
+    for table in TABLES:
+        op.create_index(f'ix_{table}_resource_id', table, ['resource_id'])
+        op.create_index(f'ix_{table}_timestamp', table, ['timestamp'])
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_timestamp_brin")
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_resource_id_timestamp")
@@ -0,0 +1,45 @@
+"""Add metric rollup tables
+
+Revision ID: add_metric_rollups
+Revises: partition_metrics
+Create Date: 2024-02-26
+
+1m / 5m / 1h rollups holding min/avg/max/p95 per resource per bucket,
+refreshed by the `refresh_metric_rollups` beat task.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_metric_rollups'
+down_revision = 'partition_metrics'
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ('metric_rollups_1m', 'metric_rollups_5m', 'metric_rollups_1h')
+ROLLUP_METRICS = ('cpu_usage', 'memory_usage', 'disk_usage', 'network_in', 'network_out')
+ROLLUP_STATS = ('min', 'avg', 'max', 'p95')
+
+
+def upgrade():
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column('resource_id', sa.Integer(), nullable=False),
+            sa.Column('bucket', sa.DateTime(), nullable=False),
+            sa.Column('samples', sa.Integer(), nullable=False, server_default='0'),
+            *[
+                sa.Column(f'{metric}_{stat}', sa.Float())
+                for metric in ROLLUP_METRICS
+                for stat in ROLLUP_STATS
+            ],
+            sa.ForeignKeyConstraint(['resource_id'], ['resources.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('resource_id', 'bucket')
+        )
+        op.create_index(f'ix_{table}_bucket', table, ['bucket'])
+
+
+def downgrade():
+    for table in ROLLUP_TABLES:
+        op.drop_table(table)
@@ -0,0 +1,52 @@
+"""Stale-resource reaper index and heartbeat rule
+
+Revision ID: add_resource_heartbeat
+Revises: add_alert_fingerprint
+Create Date: 2024-03-08
+
+Adds a partial index on the last_seen of active resources, used by the
+stale-resource reaper to find hosts that stopped reporting, and seeds the
+"Heartbeat lost" rule that fires on the heartbeat samples it submits.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'add_resource_heartbeat'
+down_revision = 'add_alert_fingerprint'
+branch_labels = None
+depends_on = None
+
+RULE_NAME = 'Heartbeat lost'
+
+
+def upgrade():
+    op.create_index(
+        'ix_resources_active_last_seen', 'resources', ['last_seen'],
+        postgresql_where=sa.text("status = 'ACTIVE'")
+    )
+    # Healthy samples carry heartbeat_age = 0, the reaper submits the real age
+    op.get_bind().execute(
+        sa.text("""
+            INSERT INTO alert_rules
+                (name, description, metric, condition, threshold, duration, severity,
+                 enabled, notification_channels)
+            VALUES (:name, 'No metrics received for several heartbeat intervals',
+                    'heartbeat_age', '>', 0, 0, 'CRITICAL', true, '[]')
+            ON CONFLICT (name) DO NOTHING
+        """),
+        {'name': RULE_NAME}
+    )
+
+
+def downgrade():
+    op.get_bind().execute(
+        sa.text("""
+            DELETE FROM alert_rules
+            WHERE name = :name
+              AND NOT EXISTS (SELECT 1 FROM alerts WHERE alerts.rule_id = alert_rules.id)
+        """),
+        {'name': RULE_NAME}
+    )
+    op.drop_index('ix_resources_active_last_seen', table_name='resources')
@@ -0,0 +1,119 @@
+"""Partition metrics tables by day
+
+Revision ID: partition_metrics
+Revises: add_metrics
+Create Date: 2024-02-20
+
+Converts `metrics` and `process_metrics` into tables range partitioned by day
+on `timestamp`. Existing rows are copied into daily partitions; partitions for
+upcoming days are then kept ahead by the `maintain_metric_partitions` beat task,
+which also drops partitions older than METRIC_RETENTION_DAYS.
+
+"""
+from datetime import date, timedelta
+from alembic import op
+
+# revision identifiers
+revision = 'partition_metrics'
+down_revision = 'add_metrics'
+branch_labels = None
+depends_on = None
+
+PREMAKE_DAYS = 7
+
+TABLES = {
+    'metrics': {
+        'columns': """
+            id BIGSERIAL NOT NULL,
+            resource_id INTEGER NOT NULL REFERENCES resources (id) ON DELETE CASCADE,
+            cpu_usage FLOAT NOT NULL,
+            memory_usage FLOAT NOT NULL,
+            disk_usage FLOAT NOT NULL,
+            network_in FLOAT DEFAULT 0.0,
+            network_out FLOAT DEFAULT 0.0,
+            extra_data JSON DEFAULT '{}',
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        """,
+        'copy': "id, resource_id, cpu_usage, memory_usage, disk_usage, network_in, network_out, extra_data, timestamp",
+    },
+    'process_metrics': {
+        'columns': """
+            id BIGSERIAL NOT NULL,
+            resource_id INTEGER NOT NULL REFERENCES resources (id) ON DELETE CASCADE,
+            process_name VARCHAR(255) NOT NULL,
+            process_pid INTEGER NOT NULL,
+            cpu_percent FLOAT DEFAULT 0.0,
+            memory_percent FLOAT DEFAULT 0.0,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        """,
+        'copy': "id, resource_id, process_name, process_pid, cpu_percent, memory_percent, timestamp",
+    },
+}
+
+
+def _rename_legacy(table):
+    """Move the heap table and its named objects out of the way"""
+    op.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+    op.execute(f"ALTER TABLE {table}_legacy RENAME CONSTRAINT {table}_pkey TO {table}_legacy_pkey")
+    op.execute(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {table}_legacy_id_seq")
+    op.execute(f"ALTER INDEX IF EXISTS ix_{table}_resource_id RENAME TO ix_{table}_legacy_resource_id")
+    op.execute(f"ALTER INDEX IF EXISTS ix_{table}_timestamp RENAME TO ix_{table}_legacy_timestamp")
+
+
+def upgrade():
+    conn = op.get_bind()
+    today = date.today()
+
+    for table, spec in TABLES.items():
+        _rename_legacy(table)
+
+        op.execute(f"""
+            CREATE TABLE {table} (
+                {spec['columns']},
+                PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        """)
+        op.create_index(f'ix_{table}_resource_id', table, ['resource_id'])
+        op.create_index(f'ix_{table}_timestamp', table, ['timestamp'])
+
+        # One partition per day from the oldest existing row up to PREMAKE_DAYS ahead
+        oldest = conn.exec_driver_sql(f"SELECT min(timestamp)::date FROM {table}_legacy").scalar()
+        day = min(oldest or today, today)
+        while day <= today + timedelta(days=PREMAKE_DAYS):
+            op.execute(
+                f"CREATE TABLE {table}_p{day:%Y%m%d} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            )
+            day += timedelta(days=1)
+
+        op.execute(f"INSERT INTO {table} ({spec['copy']}) SELECT {spec['copy']} FROM {table}_legacy")
+        op.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)"
+        )
+        op.execute(f"DROP TABLE {table}_legacy")
+
+
+def downgrade():
+    for table, spec in TABLES.items():
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+        op.execute(f"ALTER TABLE {table}_partitioned RENAME CONSTRAINT {table}_pkey TO {table}_partitioned_pkey")
+        op.execute(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {table}_partitioned_id_seq")
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_resource_id")
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_timestamp")
+
+        op.execute(f"""
+            CREATE TABLE {table} (
+                {spec['columns'].replace('BIGSERIAL', 'SERIAL')},
+                PRIMARY KEY (id)
+            )
+        """)
+        op.create_index(f'ix_{table}_resource_id', table, ['resource_id'])
+        op.create_index(f'ix_{table}_timestamp', table, ['timestamp'])
+
+        op.execute(f"INSERT INTO {table} ({spec['copy']}) SELECT {spec['copy']} FROM {table}_partitioned")
+        op.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT max(id) FROM {table}), 0) + 1, false)"
+        )
+        op.execute(f"DROP TABLE {table}_partitioned CASCADE")
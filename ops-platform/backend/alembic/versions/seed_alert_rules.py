@@ -0,0 +1,62 @@
+"""Seed default alert rules
+
+Revision ID: seed_alert_rules
+Revises: add_metric_indexes
+Create Date: 2024-03-04
+
+Alerts are now evaluated from the alert_rules table instead of thresholds
+hard-coded in the ingest endpoint. These rules carry the previous thresholds
+over so a fresh install keeps alerting the same way; they can be edited or
+disabled through /api/v1/alerts/rules.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = 'seed_alert_rules'
+down_revision = 'add_metric_indexes'
+branch_labels = None
+depends_on = None
+
+# (name, description, metric, condition, threshold, duration, severity)
+DEFAULT_RULES = [
+    ('High CPU usage', 'CPU usage above 80%', 'cpu_usage', '>', 80.0, 60, 'WARNING'),
+    ('Critical CPU usage', 'CPU usage above 90%', 'cpu_usage', '>', 90.0, 60, 'CRITICAL'),
+    ('High memory usage', 'Memory usage above 80%', 'memory_usage', '>', 80.0, 60, 'WARNING'),
+    ('Critical memory usage', 'Memory usage above 90%', 'memory_usage', '>', 90.0, 60, 'CRITICAL'),
+    ('High disk usage', 'Disk usage above 85%', 'disk_usage', '>', 85.0, 60, 'WARNING'),
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    for name, description, metric, condition, threshold, duration, severity in DEFAULT_RULES:
+        # Severity is stored by enum name (SQLEnum default)
+        conn.execute(
+            sa.text("""
+                INSERT INTO alert_rules
+                    (name, description, metric, condition, threshold, duration, severity,
+                     enabled, notification_channels)
+                VALUES (:name, :description, :metric, :condition, :threshold, :duration, :severity,
+                        true, '[]')
+                ON CONFLICT (name) DO NOTHING
+            """),
+            {
+                'name': name, 'description': description, 'metric': metric, 'condition': condition,
+                'threshold': threshold, 'duration': duration, 'severity': severity
+            }
+        )
+
+
+def downgrade():
+    conn = op.get_bind()
+    for name, *_ in DEFAULT_RULES:
+        conn.execute(
+            sa.text("""
+                DELETE FROM alert_rules
+                WHERE name = :name
+                  AND NOT EXISTS (SELECT 1 FROM alerts WHERE alerts.rule_id = alert_rules.id)
+            """),
+            {'name': name}
+        )
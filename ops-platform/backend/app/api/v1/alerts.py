@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-from app.core.database import get_db
+from app.core.database import get_async_db, get_db
 from app.models.user import User
 from app.models.alert import Alert, AlertRule, AlertStatus, AlertSeverity
 from app.schemas.alert import (
@@ -10,6 +12,10 @@ from app.schemas.alert import (
     AlertInDB, AlertAcknowledge, AlertStats, MessageResponse
 )
 from app.api.v1.auth import get_current_active_user
+from app.core.pagination import estimate_count, keyset_page_async
+from app.schemas.page import Page
+from app.services.alert_engine import alert_engine
+from app.services.stats import alert_stats
 
 router = APIRouter()
 
@@ -57,6 +63,7 @@ async def create_alert_rule(
     db.add(db_rule)
     db.commit()
     db.refresh(db_rule)
+    alert_engine.invalidate()
     
     return db_rule
 
@@ -88,6 +95,7 @@ async def update_alert_rule(
     
     db.commit()
     db.refresh(rule)
+    alert_engine.invalidate()
     
     return rule
 
@@ -114,41 +122,46 @@ async def delete_alert_rule(
     
     db.delete(rule)
     db.commit()
+    alert_engine.invalidate()
     
     return {"message": "Alert rule deleted successfully"}
 
 
 # Alerts endpoints
-@router.get("/", response_model=List[AlertInDB])
+@router.get("/", response_model=Page[AlertInDB])
 async def list_alerts(
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
+    with_total: bool = False,
     status: Optional[AlertStatus] = None,
     severity: Optional[AlertSeverity] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """List all alerts"""
-    query = db.query(Alert)
+    """List alerts, newest first, a page at a time (pass next_cursor as cursor)"""
+    query = select(Alert)
     
     if status:
-        query = query.filter(Alert.status == status)
+        query = query.where(Alert.status == status)
     
     if severity:
-        query = query.filter(Alert.severity == severity)
+        query = query.where(Alert.severity == severity)
     
-    alerts = query.order_by(Alert.fired_at.desc()).offset(skip).limit(limit).all()
-    return alerts
+    total = await db.run_sync(estimate_count, query) if with_total else None
+    alerts, next_cursor = await keyset_page_async(
+        db, query, [(Alert.fired_at, True), (Alert.id, True)], cursor, limit
+    )
+    return {"items": alerts, "next_cursor": next_cursor, "total_estimate": total}
 
 
 @router.get("/{alert_id}", response_model=AlertInDB)
 async def get_alert(
     alert_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get alert by ID"""
-    alert = db.query(Alert).filter(Alert.id == alert_id).first()
+    alert = await db.get(Alert, alert_id)
     if not alert:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -163,10 +176,10 @@ async def acknowledge_alert(
     alert_id: int,
     ack_data: AlertAcknowledge,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Acknowledge an alert"""
-    alert = db.query(Alert).filter(Alert.id == alert_id).first()
+    alert = await db.get(Alert, alert_id)
     if not alert:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -177,7 +190,7 @@ async def acknowledge_alert(
     alert.acknowledged_at = datetime.utcnow()
     alert.acknowledged_by = ack_data.acknowledged_by
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Alert acknowledged successfully"}
 
@@ -186,10 +199,10 @@ async def acknowledge_alert(
 async def resolve_alert(
     alert_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Resolve an alert"""
-    alert = db.query(Alert).filter(Alert.id == alert_id).first()
+    alert = await db.get(Alert, alert_id)
     if not alert:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -199,7 +212,7 @@ async def resolve_alert(
     alert.status = AlertStatus.RESOLVED
     alert.resolved_at = datetime.utcnow()
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Alert resolved successfully"}
 
@@ -207,23 +220,7 @@ async def resolve_alert(
 @router.get("/stats/summary", response_model=AlertStats)
 async def get_alert_stats(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get alert statistics summary"""
-    total = db.query(Alert).count()
-    firing = db.query(Alert).filter(Alert.status == AlertStatus.FIRING).count()
-    acknowledged = db.query(Alert).filter(Alert.status == AlertStatus.ACKNOWLEDGED).count()
-    resolved = db.query(Alert).filter(Alert.status == AlertStatus.RESOLVED).count()
-    
-    by_severity = {}
-    for severity in AlertSeverity:
-        count = db.query(Alert).filter(Alert.severity == severity).count()
-        by_severity[severity.value] = count
-    
-    return {
-        "total": total,
-        "firing": firing,
-        "acknowledged": acknowledged,
-        "resolved": resolved,
-        "by_severity": by_severity
-    }
+    return await alert_stats(db)
@@ -1,12 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+import logging
+import secrets
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 from datetime import datetime
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_async_db, get_db
+from app.core.redis import async_redis_client
 from app.core.security import verify_password, create_access_token, decode_access_token, get_password_hash, validate_password_length
 from app.core.rate_limit import limiter
 from app.models.user import User
-from app.schemas.user import Token, UserCreate, UserInDB
+from app.schemas.user import StreamTicket, Token, UserCreate, UserInDB
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
@@ -14,7 +23,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Get current authenticated user"""
     credentials_exception = HTTPException(
@@ -31,7 +40,7 @@ async def get_current_user(
     if username is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.username == username).first()
+    user = await db.scalar(select(User).where(User.username == username))
     if user is None:
         raise credentials_exception
     
@@ -45,6 +54,46 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     return current_user
 
 
+STREAM_TICKET_PREFIX = "opspro:stream:ticket"
+
+
+async def get_stream_user(ticket: str = Query(...)) -> User:
+    """
+    Authenticate long-lived streams (EventSource cannot send headers) from a
+    single-use `ticket` query parameter (POST /auth/stream-ticket), so the
+    access token never appears in URLs, access logs or browser history. The
+    session is closed right away instead of being held for the lifetime of
+    the stream.
+    """
+    try:
+        username = await async_redis_client.getdel(f"{STREAM_TICKET_PREFIX}:{ticket}")
+    except RedisError as e:
+        logger.warning(f"Stream tickets unavailable: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stream tickets unavailable")
+    if username is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired stream ticket")
+
+    async with AsyncSessionLocal() as db:
+        user = await db.scalar(select(User).where(User.username == username))
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired stream ticket")
+    return await get_current_active_user(user)
+
+
+@router.post("/stream-ticket", response_model=StreamTicket)
+async def create_stream_ticket(current_user: User = Depends(get_current_active_user)):
+    """Issue a short-lived, single-use ticket for opening a live stream"""
+    ticket = secrets.token_urlsafe(32)
+    try:
+        await async_redis_client.set(
+            f"{STREAM_TICKET_PREFIX}:{ticket}", current_user.username, ex=settings.STREAM_TICKET_TTL_SECONDS
+        )
+    except RedisError as e:
+        logger.warning(f"Could not issue a stream ticket: {e}")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Stream tickets unavailable")
+    return {"ticket": ticket, "expires_in": settings.STREAM_TICKET_TTL_SECONDS}
+
+
 @router.post("/register", response_model=UserInDB, status_code=status.HTTP_201_CREATED)
 @limiter.limit("5 per minute")
 async def register(request: Request, user_data: UserCreate, db: Session = Depends(get_db)):
@@ -1,22 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import timedelta
 from app.core.database import get_db
+from app.core.security import create_access_token
+from app.core.pagination import estimate_count, keyset_page
 from app.models.user import User
 from app.models.task import Task
+from app.models.agent_job import AgentJob, AgentRollout
+from app.schemas.agent_job import AgentJobInDB, RolloutCreate, RolloutInDB, RolloutReport
+from app.schemas.page import Page
+from app.schemas.task import TaskInDB
 from app.api.v1.auth import get_current_active_user
+from app.services.agent_rollout import cancel_rollout, create_rollout, rollout_report, submit_rollout
 
 router = APIRouter()
 
 
-@router.get("/tasks")
+@router.get("/tasks", response_model=Page[TaskInDB])
 async def list_tasks(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    with_total: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """List all automation tasks"""
-    tasks = db.query(Task).all()
-    return tasks
+    """List automation tasks by id, a page at a time (pass next_cursor as cursor)"""
+    query = db.query(Task)
+    total = estimate_count(db, query) if with_total else None
+    tasks, next_cursor = keyset_page(query, [(Task.id, False)], cursor, limit)
+    return {"items": tasks, "next_cursor": next_cursor, "total_estimate": total}
 
 
 @router.get("/tasks/{task_id}")
@@ -58,3 +71,124 @@ async def execute_task(
     
     # TODO: Implement task execution via Celery
     return {"message": "Task execution queued", "task_id": task_id}
+
+
+@router.get("/agent-jobs", response_model=Page[AgentJobInDB])
+async def list_agent_jobs(
+    resource_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """List agent deploy/uninstall jobs, newest first (pass next_cursor as cursor)"""
+    query = db.query(AgentJob)
+    if resource_id is not None:
+        query = query.filter(AgentJob.resource_id == resource_id)
+    jobs, next_cursor = keyset_page(query, [(AgentJob.id, True)], cursor, limit)
+    return {"items": jobs, "next_cursor": next_cursor}
+
+
+@router.get("/agent-jobs/{job_id}", response_model=AgentJobInDB)
+async def get_agent_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Get an agent job and the progress of its steps (poll until success or failed)"""
+    job = db.query(AgentJob).filter(AgentJob.id == job_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Agent job not found"
+        )
+    
+    return job
+
+
+# The rollout endpoints are sync: creating a rollout encrypts and inserts a job
+# per host, which must not run on the event loop
+@router.post("/rollouts", response_model=RolloutInDB, status_code=status.HTTP_202_ACCEPTED)
+def start_rollout(
+    rollout_request: RolloutCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Deploy the agent to every resource matched by the selector, in the
+    background: a canary batch first, then batches of batch_size with up to
+    `parallelism` hosts at once, stopping when failures exceed
+    max_failure_rate. Hosts use the request's SSH credentials, else their
+    stored ones; hosts without any are skipped.
+    Poll /automation/rollouts/{id} for the report.
+    """
+    if current_user.role not in ["admin", "operator"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    
+    # Long-lived token for the deployed agents (10 years)
+    api_token = create_access_token(
+        data={"sub": current_user.username},
+        expires_delta=timedelta(days=365*10)
+    )
+    backend_url = rollout_request.backend_url or "http://ops-nginx/api/v1"
+    
+    rollout = create_rollout(db, rollout_request, current_user.username, api_token, backend_url)
+    if not rollout.total_hosts:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"No deployable resources match the selector ({len(rollout.skipped)} skipped)"
+        )
+    db.commit()
+    return submit_rollout(db, rollout)
+
+
+@router.get("/rollouts", response_model=Page[RolloutInDB])
+def list_rollouts(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """List agent rollouts, newest first (pass next_cursor as cursor)"""
+    rollouts, next_cursor = keyset_page(db.query(AgentRollout), [(AgentRollout.id, True)], cursor, limit)
+    return {"items": rollouts, "next_cursor": next_cursor}
+
+
+def _get_rollout(db: Session, rollout_id: int) -> AgentRollout:
+    rollout = db.query(AgentRollout).filter(AgentRollout.id == rollout_id).first()
+    if not rollout:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Rollout not found"
+        )
+    return rollout
+
+
+@router.get("/rollouts/{rollout_id}", response_model=RolloutReport)
+def get_rollout(
+    rollout_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Rollout report: job counts overall and per batch, failure rate, throughput and failed hosts"""
+    return rollout_report(db, _get_rollout(db, rollout_id))
+
+
+@router.post("/rollouts/{rollout_id}/cancel", response_model=RolloutInDB)
+def cancel_agent_rollout(
+    rollout_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel a rollout: hosts being deployed to finish, the others are not started"""
+    if current_user.role not in ["admin", "operator"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+    
+    return cancel_rollout(db, _get_rollout(db, rollout_id))
@@ -1,18 +1,23 @@
 import logging
+import math
+from time import time as clock
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from app.core.database import get_db
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_db
 from app.models.user import User
-from app.models.resource import Resource
-from app.api.v1.auth import get_current_active_user
-import httpx
-import os
+from app.api.v1.auth import get_current_active_user, get_stream_user
+from app.services import query_frontend
+from app.services.dashboard import fallback_dashboard, get_dashboard
+from app.services.fleet_stream import fleet_broadcaster, stream_events
+from app.services.prometheus import PrometheusUnavailable, prometheus
+from app.services.query_guard import (
+    QueryRejected, check_instant, check_range, coalesce, normalize_query, user_slot
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus:9090")
-
 # --- Prometheus Proxy Endpoints ---
 
 @router.get("/query")
@@ -24,143 +29,105 @@ async def query_prometheus(
     """
     Proxy query to Prometheus (Instant Query)
     Example: query=opspro_cpu_usage_percent
+
+    Identical concurrent queries share one Prometheus request; expensive
+    queries are rejected.
     """
-    params = {"query": query}
-    if time:
-        params["time"] = time
-        
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(f"{PROMETHEUS_URL}/api/v1/query", params=params)
-            return resp.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=503, detail=f"Prometheus connection failed: {e}")
+    query = normalize_query(query)
+    # Pin "now" to the second so concurrent requests share an evaluation;
+    # an explicit time is passed through as given
+    params = {"query": query, "time": time if time is not None else math.floor(clock())}
+
+    try:
+        await check_instant(query)
+        async with user_slot(current_user.id):
+            return await coalesce(
+                "query", f"{params['time']}:{query}",
+                lambda: prometheus.get("query", params)
+            )
+    except QueryRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    except PrometheusUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 @router.get("/query_range")
 async def query_range_prometheus(
     query: str,
     start: float,
     end: float,
-    step: int = 60,
+    step: int = Query(60, ge=1),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Proxy query to Prometheus (Range Query)
     Example: query=opspro_cpu_usage_percent&start=1700000000&end=1700003600&step=60
+
+    The step of queries over the cost limit is raised (reported in
+    "warnings"), or the query is rejected when clamping is disabled.
     """
-    params = {
-        "query": query,
-        "start": start,
-        "end": end,
-        "step": step
-    }
-        
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(f"{PROMETHEUS_URL}/api/v1/query_range", params=params)
-            return resp.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=503, detail=f"Prometheus connection failed: {e}")
+    query = normalize_query(query)
+    try:
+        step, warning = await check_range(query, start, end, step)
+        start, end = query_frontend.align(start, end, step)
+        async with user_slot(current_user.id):
+            # Aligned, split and partially served from cache by the query frontend
+            response = await coalesce(
+                "query_range", f"{start}:{end}:{step}:{query}",
+                lambda: query_frontend.query_range(query, start, end, step)
+            )
+    except QueryRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers=e.headers)
+    except PrometheusUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    if warning:
+        # The coalesced response is shared, so copy before adding to it
+        response = dict(response, warnings=response.get("warnings", []) + [warning])
+    return response
 
 # --- Existing Dashboard Endpoint (Legacy/Hybrid) ---
 
 @router.get("/dashboard")
 async def get_dashboard_data(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get dashboard monitoring data from Prometheus
     """
-    async with httpx.AsyncClient() as client:
-        try:
-            # Prepare queries
-            queries = {
-                "total_online": "count(opspro_cpu_usage_percent)",
-                "avg_cpu": "avg(opspro_cpu_usage_percent)",
-                "avg_mem": "avg(opspro_memory_usage_percent)",
-                "total_net_in": "sum(opspro_network_in_mb)",
-                "total_net_out": "sum(opspro_network_out_mb)",
-                "top_cpu": "topk(5, opspro_cpu_usage_percent)",
-                "all_nodes": "opspro_cpu_usage_percent"
-            }
-            
-            results = {}
-            for key, q in queries.items():
-                resp = await client.get(f"{PROMETHEUS_URL}/api/v1/query", params={"query": q})
-                data = resp.json()
-                if data["status"] == "success" and data["data"]["result"]:
-                    results[key] = data["data"]["result"]
-                else:
-                    results[key] = []
-
-            # Process results
-            # Helper to get scalar value
-            def get_scalar(key, default=0.0):
-                if results.get(key) and len(results[key]) > 0:
-                    return float(results[key][0]["value"][1])
-                return default
-
-            # Process All Nodes for Heatmap
-            all_resources_status = []
-            if results.get("all_nodes"):
-                for item in results["all_nodes"]:
-                    metric = item["metric"]
-                    cpu_val = float(item["value"][1])
-                    
-                    status = "normal"
-                    if cpu_val > 80: status = "critical"
-                    elif cpu_val > 50: status = "warning"
-                    
-                    all_resources_status.append({
-                        "id": metric.get("resource_id", "0"),
-                        "name": metric.get("resource_name", "Unknown"),
-                        "ip": metric.get("ip_address", ""),
-                        "cpu": round(cpu_val, 1),
-                        "status": status
-                    })
+    try:
+        return await get_dashboard(db)
+    except PrometheusUnavailable as e:
+        # Breaker open or Prometheus down: serve the DB view right away
+        logger.warning(f"Dashboard served from the database: {e}")
+        return await fallback_dashboard(db, e)
+    except Exception as e:
+        logger.error(f"Dashboard data fetch failed: {e}", exc_info=True)
+        # Fallback to DB if Prometheus fails
+        return await fallback_dashboard(db, e)
 
-            # Process Top 5
-            top_cpu_resources = []
-            if results.get("top_cpu"):
-                for item in results["top_cpu"]:
-                    # item = {"metric": {"resource_id": "1", "resource_name": "foo", ...}, "value": [ts, "12.3"]}
-                    metric = item["metric"]
-                    value = float(item["value"][1])
-                    top_cpu_resources.append({
-                        "id": metric.get("resource_id", "0"),
-                        "name": metric.get("resource_name", "Unknown"),
-                        "cpu_usage": round(value, 1),
-                        # Memory usage is tricky to map without a join, we skip it for now or query separately
-                        "memory_usage": 0 
-                    })
-                # Sort again because Prometheus topk sort might be unstable or we want to be sure
-                top_cpu_resources.sort(key=lambda x: x["cpu_usage"], reverse=True)
 
-            # Get database total count (including offline)
-            total_db_resources = db.query(Resource).count()
+@router.get("/stream")
+async def stream_dashboard(current_user: User = Depends(get_stream_user)):
+    """
+    Live fleet heatmap as server-sent events: a `snapshot` event, then
+    `delta` events with only the resources whose state changed.
+    Authenticate with ?ticket=<ticket from POST /auth/stream-ticket>.
+    """
+    if not fleet_broadcaster.running:
+        raise HTTPException(status_code=503, detail="Live fleet stream is disabled")
 
-            return {
-                "total_resources": total_db_resources,
-                "online_resources": int(get_scalar("total_online")),
-                "average_cpu_usage": round(get_scalar("avg_cpu"), 1),
-                "average_memory_usage": round(get_scalar("avg_mem"), 1),
-                "total_network_traffic": round(get_scalar("total_net_in") + get_scalar("total_net_out"), 1),
-                "top_cpu_resources": top_cpu_resources,
-                "all_resources_status": all_resources_status
-            }
+    async def events():
+        # Subscribe before the snapshot is read, so no delta falls in between
+        queue = fleet_broadcaster.subscribe()
+        try:
+            async for event in stream_events(queue):
+                yield event
+        finally:
+            fleet_broadcaster.unsubscribe(queue)
 
-        except Exception as e:
-            logger.error(f"Dashboard data fetch failed: {e}", exc_info=True)
-            # Fallback to DB if Prometheus fails
-            resources = db.query(Resource).all()
-            if resources:
-                avg_cpu = sum(r.cpu_usage for r in resources) / len(resources)
-            else:
-                avg_cpu = 0
-            return {
-                "total_resources": len(resources),
-                "online_resources": 0,
-                "average_cpu_usage": round(avg_cpu, 1),
-                "error": str(e)
-            }
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,67 +1,96 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_async_db, get_db
+from app.core.pagination import estimate_count, keyset_page_async
 from app.models.user import User
 from app.models.resource import Resource, ResourceType, ResourceStatus
 from app.schemas.resource import (
     ResourceCreate, ResourceUpdate, ResourceInDB,
     ResourceMetrics, ResourceProbeRequest, ResourceProbeResponse,
-    ResourceDeleteRequest, ResourceStats, MessageResponse, MetricResponse
+    ResourceDeleteRequest, ResourceDeleteResponse, ResourceStats, ResourceCreated,
+    MetricResponse, MetricBatchRequest, MetricBatchResponse, MetricHistoryResponse
 )
+from app.schemas.agent_job import AgentJobInDB
+from app.schemas.page import Page
+from app.models.agent_job import AgentJobAction
 from app.api.v1.auth import get_current_active_user
 from app.services.resource_detector import probe_server, SSHCredentials
-from app.services.agent_deployer import deploy_agent, uninstall_agent
+from app.services.agent_jobs import create_job, submit_job
+from app.services.ssh_executor import SSHBusy, ssh_executor
 from app.core.security import create_access_token
 from app.core.encryption import encrypt_string
-from app.core.monitoring import update_metrics, clear_metrics, update_resource_status
+from app.core.monitoring import export_resources, unexport_resource, update_metrics
+from app.services.alert_engine import metric_values
+from app.services.alert_stream import submit_samples
+from app.services.resource_reaper import mark_online
+from app.services.stats import resource_stats
+from app.services.metric_buffer import metric_buffer
+from app.services.metric_history import fetch_history
+from app.services.metric_rollups import mark_touched_async
+from app.services.resource_state import build_state, store_latest, overlay_live_state, forget_resource
+from app.services.metric_ingest import (
+    validate_batch, load_resources, latest_per_resource, drop_stale_latest,
+    build_metric_row, build_process_rows, store_metric_rows, update_resource_latest
+)
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.get("/", response_model=List[ResourceInDB])
+@router.get("/", response_model=Page[ResourceInDB])
 async def list_resources(
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
+    with_total: bool = False,
     resource_type: Optional[ResourceType] = None,
     status: Optional[ResourceStatus] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """List all resources"""
-    query = db.query(Resource)
+    """List resources by id, a page at a time (pass next_cursor as cursor)"""
+    query = select(Resource)
     
     if resource_type:
-        query = query.filter(Resource.type == resource_type)
+        query = query.where(Resource.type == resource_type)
     
     if status:
-        query = query.filter(Resource.status == status)
+        query = query.where(Resource.status == status)
     
-    resources = query.offset(skip).limit(limit).all()
-    return resources
+    total = await db.run_sync(estimate_count, query) if with_total else None
+    resources, next_cursor = await keyset_page_async(db, query, [(Resource.id, False)], cursor, limit)
+    return {
+        "items": await overlay_live_state(resources),
+        "next_cursor": next_cursor,
+        "total_estimate": total
+    }
 
 
 @router.get("/{resource_id}", response_model=ResourceInDB)
 async def get_resource(
     resource_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get resource by ID"""
-    resource = db.query(Resource).filter(Resource.id == resource_id).first()
+    resource = await db.get(Resource, resource_id)
     if not resource:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Resource not found"
         )
     
+    await overlay_live_state([resource])
     return resource
 
 
-@router.post("/", response_model=ResourceInDB, status_code=status.HTTP_201_CREATED)
+@router.post("/", response_model=ResourceCreated, status_code=status.HTTP_201_CREATED)
 async def create_resource(
     resource_data: ResourceCreate,
     current_user: User = Depends(get_current_active_user),
@@ -73,7 +102,8 @@ async def create_resource(
     If SSH credentials (password or key) are provided:
     1. Probes the server to auto-detect hardware info (CPU, Memory, Disk, OS).
     2. Encrypts and saves credentials.
-    3. Auto-deploys the monitoring agent.
+    3. Starts a background job deploying the monitoring agent (returned as
+       agent_job; poll /automation/agent-jobs/{id} for its progress).
     """
     # Check if resource name already exists
     if db.query(Resource).filter(Resource.name == resource_data.name).first():
@@ -98,7 +128,7 @@ async def create_resource(
                 password=resource_data.ssh_password,
                 private_key=resource_data.ssh_private_key
             )
-            probe_info = probe_server(credentials)
+            probe_info = await ssh_executor.run("probe", credentials.host, probe_server, credentials)
             
             # Update resource data with probed info
             if not resource_data.hostname: resource_data.hostname = probe_info.hostname
@@ -107,6 +137,12 @@ async def create_resource(
             if not resource_data.disk_gb: resource_data.disk_gb = probe_info.disk_gb
             if not resource_data.os_type: resource_data.os_type = f"{probe_info.os_type} {probe_info.os_version}"
             
+        except SSHBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": "30"}
+            )
         except Exception as e:
             # If probing fails, we abort creation because the credentials might be wrong
             raise HTTPException(
@@ -134,36 +170,31 @@ async def create_resource(
     db.commit()
     db.refresh(db_resource)
     
-    # 3. Deploy Agent (Async/Background ideally, but doing sync for simplicity now)
+    # 3. Deploy Agent in the background; a failed deploy does not undo the creation
+    agent_job = None
     if auto_discovery:
-        try:
-            logger.info(f"Auto-deploying agent to {db_resource.name}...")
-            # Generate Token
-            access_token_expires = timedelta(days=365*10)
-            api_token = create_access_token(
-                data={"sub": current_user.username},
-                expires_delta=access_token_expires
-            )
-            
-            # Use provided backend URL or default
-            backend_url = resource_data.backend_url or "http://ops-nginx/api/v1"
-            
-            success = deploy_agent(
-                credentials=credentials,
-                resource_id=db_resource.id,
-                api_token=api_token,
-                backend_url=backend_url
-            )
-            
-            if success:
-                logger.info(f"Agent deployed successfully to {db_resource.name}")
-            else:
-                logger.warning(f"Agent deployment failed for {db_resource.name}")
-                # We don't rollback creation, just warn
-        except Exception as e:
-            logger.error(f"Error deploying agent: {e}", exc_info=True)
+        logger.info(f"Queueing agent deployment to {db_resource.name}...")
+        # Generate Token
+        access_token_expires = timedelta(days=365*10)
+        api_token = create_access_token(
+            data={"sub": current_user.username},
+            expires_delta=access_token_expires
+        )
+        
+        # Use provided backend URL or default
+        backend_url = resource_data.backend_url or "http://ops-nginx/api/v1"
+        
+        agent_job = create_job(
+            db, AgentJobAction.DEPLOY, credentials, db_resource.id, current_user.username,
+            api_token=api_token, backend_url=backend_url
+        )
+        db.commit()
+        submit_job(db, agent_job)
     
-    return db_resource
+    response = ResourceCreated.model_validate(db_resource)
+    if agent_job is not None:
+        response.agent_job = AgentJobInDB.model_validate(agent_job)
+    return response
 
 
 @router.put("/{resource_id}", response_model=ResourceInDB)
@@ -192,7 +223,7 @@ async def update_resource(
     return resource
 
 
-@router.delete("/{resource_id}", response_model=MessageResponse)
+@router.delete("/{resource_id}", response_model=ResourceDeleteResponse)
 async def delete_resource(
     resource_id: int,
     delete_request: Optional[ResourceDeleteRequest] = None,
@@ -202,8 +233,9 @@ async def delete_resource(
     """
     Delete resource and optionally uninstall agent
     
-    If delete_request is provided with SSH credentials, the agent will be uninstalled
-    from the remote server before deleting the resource from the database.
+    If delete_request is provided with SSH credentials, a background job
+    uninstalling the agent from the remote server is started (returned as
+    agent_job) and the resource is deleted right away.
     """
     if current_user.role not in ["admin", "operator"]:
         raise HTTPException(
@@ -218,8 +250,8 @@ async def delete_resource(
             detail="Resource not found"
         )
     
-    # Try to uninstall agent if requested and credentials provided
-    agent_uninstalled = False
+    # Uninstall the agent in the background if requested and credentials provided
+    agent_job = None
     uninstall_error = None
     
     logger.info(f"收到删除请求: resource_id={resource_id}, payload={delete_request}")
@@ -235,34 +267,28 @@ async def delete_resource(
                 private_key=delete_request.ssh_private_key
             )
             
-            logger.info(f"正在从 {resource.ip_address} 卸载 Agent...")
-            agent_uninstalled = uninstall_agent(credentials)
-            
-            if agent_uninstalled:
-                logger.info(f"✓ Agent 已从 {resource.ip_address} 卸载")
-            else:
-                logger.warning(f"Agent 卸载失败，但继续删除资源")
-                uninstall_error = "Agent 卸载失败（可能已被手动删除）"
+            logger.info(f"提交 Agent 卸载任务: {resource.ip_address}")
+            agent_job = create_job(
+                db, AgentJobAction.UNINSTALL, credentials, resource.id, current_user.username
+            )
                 
         except Exception as e:
-            logger.error(f"卸载 Agent 时出错: {e}")
+            logger.error(f"创建 Agent 卸载任务时出错: {e}")
             uninstall_error = str(e)
             # 继续删除资源，即使 Agent 卸载失败
     
-    # Clear Prometheus metrics for this resource before deletion
-    clear_metrics(
-        resource_id=str(resource.id),
-        resource_name=resource.name,
-        ip_address=resource.ip_address or ""
-    )
-    
-    # Delete resource from database
+    # Delete resource from database (with the uninstall job, if any)
     db.delete(resource)
     db.commit()
+    await forget_resource(resource_id)
+    # Stop exporting its Prometheus series
+    await unexport_resource(resource_id)
+    if agent_job is not None:
+        submit_job(db, agent_job)
     
     response = {
         "message": "资源已成功删除",
-        "agent_uninstalled": agent_uninstalled
+        "agent_job": AgentJobInDB.model_validate(agent_job) if agent_job is not None else None
     }
     
     if uninstall_error:
@@ -271,119 +297,173 @@ async def delete_resource(
     return response
 
 
+@router.post("/metrics/batch", response_model=MetricBatchResponse)
+async def ingest_metrics_batch(
+    batch: MetricBatchRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ingest many metric samples, possibly for many resources, in one call.
+
+    Samples are validated one by one and reported with a per-item status.
+    Accepted rows go to the write-behind buffer (or, when it is disabled, are
+    stored in a single transaction using bulk inserts).
+    """
+    if len(batch.samples) > settings.METRIC_BATCH_MAX_SAMPLES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many samples, at most {settings.METRIC_BATCH_MAX_SAMPLES} per batch"
+        )
+    
+    now = datetime.utcnow()
+    valid, results = validate_batch(batch.samples, now)
+    resources = await db.run_sync(load_resources, [sample.resource_id for _, sample in valid])
+    
+    accepted = []
+    for index, sample in valid:
+        if sample.resource_id not in resources:
+            results[index].update(status="rejected", error="Resource not found")
+            continue
+        accepted.append((index, sample))
+    
+    if accepted:
+        buffered = [
+            (
+                build_metric_row(sample.resource_id, sample, sample.timestamp),
+                build_process_rows(sample.resource_id, sample.top_processes, sample.timestamp)
+            )
+            for _, sample in accepted
+        ]
+        
+        use_buffer = metric_buffer.running
+        if use_buffer:
+            # Write-behind: rows are flushed in bulk by the buffer, only the
+            # resources' current values are written on the request path
+            queued = await metric_buffer.put_many(buffered)
+            for index, _ in accepted[queued:]:
+                results[index].update(status="rejected", error="Ingest queue is full, please retry later")
+            accepted = accepted[:queued]
+        
+        latest = drop_stale_latest(latest_per_resource(sample for _, sample in accepted), resources)
+        
+        # Current values go to the live state cache; rows are synced in bulk
+        cached = await store_latest({
+            resource_id: build_state(sample, sample.timestamp) for resource_id, sample in latest.items()
+        })
+        
+        def persist(session: Session):
+            if not use_buffer:
+                store_metric_rows(
+                    session,
+                    [metric for metric, _ in buffered],
+                    [proc for _, procs in buffered for proc in procs]
+                )
+            if not cached:
+                update_resource_latest(session, latest)
+            mark_online(session, [resources[resource_id] for resource_id in latest])
+        
+        try:
+            await db.run_sync(persist)
+            await db.commit()
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"Batch metric ingest failed ({len(accepted)} samples): {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Metric storage failed, please retry the batch"
+            )
+        if not use_buffer:
+            await mark_touched_async(metric["timestamp"] for metric, _ in buffered)
+        
+        await export_resources(
+            (resource.id, resource.name, resource.ip_address)
+            for resource in (resources[resource_id] for resource_id in latest)
+        )
+        
+        await submit_samples(db, [
+            (sample.resource_id, resources[sample.resource_id].name, metric_values(sample), sample.timestamp)
+            for _, sample in accepted
+        ])
+    
+    accepted_count = sum(1 for r in results if r["status"] == "accepted")
+    return {
+        "accepted": accepted_count,
+        "rejected": len(results) - accepted_count,
+        "results": results
+    }
+
+
 @router.post("/{resource_id}/metrics", response_model=ResourceInDB)
 async def update_resource_metrics(
     resource_id: int,
     metrics: ResourceMetrics,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update resource metrics and store historical data"""
-    from app.models.metric import Metric, ProcessMetric
-    
-    resource = db.query(Resource).filter(Resource.id == resource_id).first()
+    resource = await db.get(Resource, resource_id)
     if not resource:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Resource not found"
         )
     
-    # Update current metrics on resource
-    resource.cpu_usage = metrics.cpu_usage
-    resource.memory_usage = metrics.memory_usage
-    resource.disk_usage = metrics.disk_usage
-    resource.last_seen = datetime.utcnow()
+    now = datetime.utcnow()
+    metric_row = build_metric_row(resource_id, metrics, now)
+    process_rows = build_process_rows(resource_id, metrics.top_processes, now)
+    
+    if metric_buffer.running:
+        # Historical rows are written by the write-behind buffer
+        if not await metric_buffer.put_many([(metric_row, process_rows)]):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Ingest queue is full, please retry later",
+                headers={"Retry-After": "5"}
+            )
+    else:
+        await db.run_sync(store_metric_rows, [metric_row], process_rows)
+    
+    # Update current metrics (live state cache, or the row if it is unavailable)
+    if not await store_latest({resource.id: build_state(metrics, now)}):
+        resource.cpu_usage = metrics.cpu_usage
+        resource.memory_usage = metrics.memory_usage
+        resource.disk_usage = metrics.disk_usage
+        resource.last_seen = now
+    await db.run_sync(mark_online, [resource])
     
     # Update Prometheus metrics
-    update_metrics(
+    await update_metrics(
         resource_id=str(resource.id),
         resource_name=resource.name,
         ip_address=resource.ip_address,
         metrics=metrics.dict()
     )
     
-    # Store historical metrics
-    metric_record = Metric(
-        resource_id=resource_id,
-        cpu_usage=metrics.cpu_usage,
-        memory_usage=metrics.memory_usage,
-        disk_usage=metrics.disk_usage,
-        network_in=metrics.network_in or 0,
-        network_out=metrics.network_out or 0
-    )
-    db.add(metric_record)
-    
-    # Store top processes if provided
-    if metrics.top_processes:
-        for proc in metrics.top_processes[:5]:  # Limit to top 5
-            process_record = ProcessMetric(
-                resource_id=resource_id,
-                process_name=proc.get('name', 'unknown'),
-                process_pid=proc.get('pid', 0),
-                cpu_percent=proc.get('cpu_percent', 0),
-                memory_percent=proc.get('memory_percent', 0)
-            )
-            db.add(process_record)
-    
-    db.commit()
+    await db.commit()
+    if not metric_buffer.running:
+        await mark_touched_async([now])
     
-    # Check for alert thresholds
-    await check_alert_thresholds(resource, metrics, db)
+    # Alert rules are evaluated by the alert worker
+    await submit_samples(db, [(resource.id, resource.name, metric_values(metrics), now)])
     
     return {"message": "Metrics updated successfully"}
 
 
-async def check_alert_thresholds(resource: Resource, metrics: ResourceMetrics, db: Session):
-    """Check if metrics exceed alert thresholds"""
-    from app.models.alert import Alert, AlertSeverity, AlertStatus
-    
-    # Query active alert rules for this resource
-    # For now, use simple thresholds
-    alerts_to_create = []
-    
-    if metrics.cpu_usage > 80:
-        alerts_to_create.append({
-            "resource_id": resource.id,
-            "severity": AlertSeverity.CRITICAL if metrics.cpu_usage > 90 else AlertSeverity.WARNING,
-            "message": f"High CPU usage on {resource.name}: {metrics.cpu_usage:.1f}%",
-            "status": AlertStatus.FIRING
-        })
-    
-    if metrics.memory_usage > 80:
-        alerts_to_create.append({
-            "resource_id": resource.id,
-            "severity": AlertSeverity.CRITICAL if metrics.memory_usage > 90 else AlertSeverity.WARNING,
-            "message": f"High memory usage on {resource.name}: {metrics.memory_usage:.1f}%",
-            "status": AlertStatus.FIRING
-        })
-    
-    if metrics.disk_usage > 85:
-        alerts_to_create.append({
-            "resource_id": resource.id,
-            "severity": AlertSeverity.WARNING,
-            "message": f"High disk usage on {resource.name}: {metrics.disk_usage:.1f}%",
-            "status": AlertStatus.FIRING
-        })
-    
-    for alert_data in alerts_to_create:
-        alert = Alert(**alert_data)
-        db.add(alert)
-    
-    if alerts_to_create:
-        db.commit()
-
-
-@router.get("/{resource_id}/metrics/history", response_model=MetricResponse)
+@router.get("/{resource_id}/metrics/history", response_model=MetricHistoryResponse)
 async def get_metrics_history(
     resource_id: int,
-    hours: int = Query(24, ge=1, le=168),  # Last 24 hours by default, max 1 week
+    hours: int = Query(24, ge=1, le=settings.METRIC_HISTORY_MAX_HOURS),  # Last 24 hours by default
+    max_points: Optional[int] = Query(None, ge=10, le=settings.METRIC_HISTORY_MAX_POINTS),
+    agg: str = Query("avg", pattern="^(avg|min|max|lttb)$"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get historical metrics for a resource"""
-    from app.models.metric import Metric
-    from datetime import timedelta
-    
+    """
+    Get historical metrics for a resource.
+    Short windows return raw samples, longer ones the 1m/5m/1h rollups.
+    With max_points the series is downsampled server-side using `agg`.
+    """
     resource = db.query(Resource).filter(Resource.id == resource_id).first()
     if not resource:
         raise HTTPException(
@@ -391,29 +471,19 @@ async def get_metrics_history(
             detail="Resource not found"
         )
     
-    # Query metrics from last N hours
-    since = datetime.utcnow() - timedelta(hours=hours)
-    metrics = db.query(Metric).filter(
-        Metric.resource_id == resource_id,
-        Metric.timestamp >= since
-    ).order_by(Metric.timestamp.asc()).all()
+    until = datetime.utcnow()
+    since = until - timedelta(hours=hours)
+    history = fetch_history(db, resource_id, since, until, max_points=max_points, agg=agg)
     
     return {
         "resource_id": resource_id,
         "resource_name": resource.name,
         "period_hours": hours,
-        "data_points": len(metrics),
-        "metrics": [
-            {
-                "timestamp": m.timestamp.isoformat(),
-                "cpu_usage": m.cpu_usage,
-                "memory_usage": m.memory_usage,
-                "disk_usage": m.disk_usage,
-                "network_in": m.network_in,
-                "network_out": m.network_out
-            }
-            for m in metrics
-        ]
+        "resolution": history.resolution,
+        "agg": agg if max_points else None,
+        "bucket_seconds": history.bucket_seconds,
+        "data_points": len(history.points),
+        "metrics": history.points
     }
 
 
@@ -427,11 +497,13 @@ async def get_top_processes(
     from app.models.metric import ProcessMetric
     from datetime import timedelta
     
-    # Get processes from last 5 minutes
-    since = datetime.utcnow() - timedelta(minutes=5)
+    # Get processes from last 5 minutes (bounded on both sides for partition pruning)
+    until = datetime.utcnow()
+    since = until - timedelta(minutes=5)
     processes = db.query(ProcessMetric).filter(
         ProcessMetric.resource_id == resource_id,
-        ProcessMetric.timestamp >= since
+        ProcessMetric.timestamp >= since,
+        ProcessMetric.timestamp <= until
     ).order_by(ProcessMetric.timestamp.desc()).limit(10).all()
     
     return {
@@ -452,24 +524,10 @@ async def get_top_processes(
 @router.get("/stats/summary", response_model=ResourceStats)
 async def get_resource_stats(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get resource statistics summary"""
-    total = db.query(Resource).count()
-    active = db.query(Resource).filter(Resource.status == ResourceStatus.ACTIVE).count()
-    inactive = db.query(Resource).filter(Resource.status == ResourceStatus.INACTIVE).count()
-    
-    by_type = {}
-    for resource_type in ResourceType:
-        count = db.query(Resource).filter(Resource.type == resource_type).count()
-        by_type[resource_type.value] = count
-    
-    return {
-        "total": total,
-        "active": active,
-        "inactive": inactive,
-        "by_type": by_type
-    }
+    return await resource_stats(db)
 
 
 @router.post("/probe", response_model=ResourceProbeResponse)
@@ -491,7 +549,7 @@ async def probe_resource(
         )
         
         # Execute probe
-        server_info = probe_server(credentials)
+        server_info = await ssh_executor.run("probe", credentials.host, probe_server, credentials)
         
         return ResourceProbeResponse(
             hostname=server_info.hostname,
@@ -502,6 +560,12 @@ async def probe_resource(
             os_version=server_info.os_version,
             kernel_version=server_info.kernel_version
         )
+    except SSHBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "30"}
+        )
     except ConnectionError as e:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
@@ -514,7 +578,9 @@ async def probe_resource(
         )
 
 
-@router.post("/{resource_id}/deploy-agent", response_model=MessageResponse)
+@router.post(
+    "/{resource_id}/deploy-agent", response_model=AgentJobInDB, status_code=status.HTTP_202_ACCEPTED
+)
 async def deploy_monitoring_agent(
     resource_id: int,
     probe_request: ResourceProbeRequest,
@@ -523,7 +589,9 @@ async def deploy_monitoring_agent(
 ):
     """
     Deploy monitoring agent to remote server
-    The agent will continuously report metrics to backend
+    The agent will continuously report metrics to backend.
+    The deployment runs as a background job: poll /automation/agent-jobs/{id}
+    for its step progress. The resource is marked active once it succeeds.
     """
     # Verify resource exists
     resource = db.query(Resource).filter(Resource.id == resource_id).first()
@@ -533,47 +601,28 @@ async def deploy_monitoring_agent(
             detail="Resource not found"
         )
     
-    try:
-        credentials = SSHCredentials(
-            host=probe_request.ip_address,
-            port=probe_request.ssh_port,
-            username=probe_request.ssh_username,
-            password=probe_request.ssh_password,
-            private_key=probe_request.ssh_private_key
-        )
-        
-        # Deploy agent
-        # Generate a long-lived token for the agent (10 years)
-        access_token_expires = timedelta(days=365*10)
-        api_token = create_access_token(
-            data={"sub": current_user.username},
-            expires_delta=access_token_expires
-        )
-        
-        # Use provided backend URL or default to internal network
-        # If the request comes from frontend, it should provide the external URL
-        backend_url = probe_request.backend_url or "http://ops-nginx/api/v1"
-        
-        success = deploy_agent(
-            credentials=credentials,
-            resource_id=resource_id,
-            api_token=api_token,
-            backend_url=backend_url
-        )
-        
-        if success:
-            # Update resource status
-            resource.status = ResourceStatus.ACTIVE
-            db.commit()
-            
-            return {"message": "Monitoring agent deployed successfully"}
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Agent deployment failed"
-            )
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"部署失败: {str(e)}"
-        )
+    credentials = SSHCredentials(
+        host=probe_request.ip_address,
+        port=probe_request.ssh_port,
+        username=probe_request.ssh_username,
+        password=probe_request.ssh_password,
+        private_key=probe_request.ssh_private_key
+    )
+    
+    # Generate a long-lived token for the agent (10 years)
+    access_token_expires = timedelta(days=365*10)
+    api_token = create_access_token(
+        data={"sub": current_user.username},
+        expires_delta=access_token_expires
+    )
+    
+    # Use provided backend URL or default to internal network
+    # If the request comes from frontend, it should provide the external URL
+    backend_url = probe_request.backend_url or "http://ops-nginx/api/v1"
+    
+    job = create_job(
+        db, AgentJobAction.DEPLOY, credentials, resource_id, current_user.username,
+        api_token=api_token, backend_url=backend_url
+    )
+    db.commit()
+    return submit_job(db, job)
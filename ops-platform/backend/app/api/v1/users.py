@@ -5,14 +5,17 @@ from app.core.database import get_db
 from app.models.user import User
 from app.schemas.user import UserInDB, UserUpdate
 from app.api.v1.auth import get_current_active_user
+from app.core.pagination import estimate_count, keyset_page
+from app.schemas.page import Page
 
 router = APIRouter()
 
 
-@router.get("/", response_model=List[UserInDB])
+@router.get("/", response_model=Page[UserInDB])
 async def list_users(
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     limit: int = Query(20, ge=1, le=100),
+    with_total: bool = False,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -23,8 +26,10 @@ async def list_users(
             detail="Not enough permissions"
         )
     
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    query = db.query(User)
+    total = estimate_count(db, query) if with_total else None
+    users, next_cursor = keyset_page(query, [(User.id, False)], cursor, limit)
+    return {"items": users, "next_cursor": next_cursor, "total_estimate": total}
 
 
 @router.get("/{user_id}", response_model=UserInDB)
@@ -0,0 +1,126 @@
+"""
+Shared response cache with singleflight
+JSON payloads are cached in Redis for a short TTL so every API worker serves
+the same copy. Concurrent misses for a key are collapsed twice: within a
+process onto one asyncio task, and across processes through a short Redis
+lock whose holder computes while the others wait for its result.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from redis.exceptions import RedisError
+from app.core.monitoring import CACHE_REQUESTS
+from app.core.redis import async_redis_client
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = "opspro:cache"
+
+# Delete the lock only if we still hold it
+RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_release_lock = async_redis_client.register_script(RELEASE_LOCK)
+
+# How often processes waiting on another one's computation poll for its result
+POLL_INTERVAL = 0.05
+
+
+class SingleFlight:
+    """Run at most one call per key at a time in this process; callers share its result"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._calls
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Await fn() or the call already in flight for `key`. Returns the result
+        and whether it was shared. The call is shielded, so a cancelled caller
+        does not cancel it for the others.
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), shared
+
+
+_flights = SingleFlight()
+
+
+def cache_key(name: str, *parts: Any) -> str:
+    return ":".join([CACHE_PREFIX, name, *map(str, parts)])
+
+
+async def _fill(key: str, ttl: float, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+    """Compute under the cross-process lock, or wait for the process holding it"""
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    # The lock outlives a slow computation by a margin, but never forever
+    lock_ms = int(max(ttl, 5.0) * 2000)
+    try:
+        acquired = await async_redis_client.set(lock_key, token, nx=True, px=lock_ms)
+    except RedisError:
+        return await compute(), False
+
+    if not acquired:
+        deadline = time.monotonic() + lock_ms / 1000
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(POLL_INTERVAL)
+                cached = await async_redis_client.get(key)
+                if cached is not None:
+                    return json.loads(cached), True
+                if not await async_redis_client.exists(lock_key):
+                    break
+        except RedisError:
+            pass
+        # The holder failed or vanished; compute ourselves
+        return await compute(), False
+
+    try:
+        value = await compute()
+        try:
+            await async_redis_client.set(key, json.dumps(value), px=int(ttl * 1000))
+        except (RedisError, TypeError, ValueError) as e:
+            logger.warning(f"Could not cache {key}: {e}")
+        return value, False
+    finally:
+        try:
+            await _release_lock(keys=[lock_key], args=[token])
+        except RedisError:
+            pass
+
+
+async def cached(name: str, key: str, ttl: float, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Return the cached JSON value of `key`, computing it on a miss.
+
+    `name` labels the cache in opspro_cache_requests_total. Exceptions of
+    `compute` are not cached and reach every caller sharing the computation.
+    When Redis is unavailable values are computed (and still coalesced
+    within the process).
+    """
+    try:
+        value: Optional[str] = await async_redis_client.get(key)
+    except RedisError as e:
+        logger.warning(f"Cache {name} unavailable: {e}")
+        value = None
+    if value is not None:
+        CACHE_REQUESTS.labels(cache=name, result="hit").inc()
+        return json.loads(value)
+
+    (result, waited), shared = await _flights.do(key, lambda: _fill(key, ttl, compute))
+    CACHE_REQUESTS.labels(cache=name, result="coalesced" if shared or waited else "miss").inc()
+    return result
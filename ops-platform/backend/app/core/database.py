@@ -1,4 +1,6 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -7,8 +9,8 @@ from app.core.config import settings
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,      # Verify connections before using
-    pool_size=10,            # Base pool size
-    max_overflow=20,         # Max extra connections under load
+    pool_size=settings.DB_POOL_SIZE,        # Base pool size
+    max_overflow=settings.DB_MAX_OVERFLOW,  # Max extra connections under load
     pool_recycle=3600,       # Recycle connections after 1 hour
     pool_timeout=30,         # Wait up to 30s for available connection
     echo=settings.DEBUG      # Log SQL in debug mode
@@ -17,6 +19,31 @@ engine = create_engine(
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_database_url(url: str) -> str:
+    """The DATABASE_URL with the asyncpg driver"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed.render_as_string(hide_password=False)
+
+
+# Async engine for the API's request path (asyncpg); queries do not block
+# the event loop. Celery tasks and scripts keep using the sync engine.
+async_engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=settings.DB_ASYNC_POOL_SIZE,
+    max_overflow=settings.DB_ASYNC_MAX_OVERFLOW,
+    pool_recycle=3600,
+    pool_timeout=30,
+    echo=settings.DEBUG
+)
+
+# Objects stay usable after commit: with an async session, reloading an
+# expired attribute outside of an await would fail
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -28,3 +55,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
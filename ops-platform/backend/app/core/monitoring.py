@@ -1,66 +1,180 @@
 import logging
-from prometheus_client import Gauge
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from prometheus_client import Gauge, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.core.redis import async_redis_client, redis_client
+from app.core.snapshot_store import ResourceSnapshotStore
+from app.services.resource_state import state_key
 
 logger = logging.getLogger(__name__)
 
-# Define Prometheus Metrics
+# Per-resource metrics
+# Rendered by SnapshotCollector from the shared live state in Redis
+# (app/services/resource_state.py), so every uvicorn worker serves the same
+# fleet-wide view no matter which worker received a host's last sample.
 # Labels: resource_id, resource_name, ip_address
 
-CPU_USAGE = Gauge(
-    'opspro_cpu_usage_percent',
-    'CPU Usage Percentage',
-    ['resource_id', 'resource_name', 'ip_address']
+RESOURCE_METRICS = (
+    # (metric name, help, state field)
+    ('opspro_cpu_usage_percent', 'CPU Usage Percentage', 'cpu_usage'),
+    ('opspro_memory_usage_percent', 'Memory Usage Percentage', 'memory_usage'),
+    ('opspro_disk_usage_percent', 'Disk Usage Percentage', 'disk_usage'),
+    ('opspro_network_in_mb', 'Network Incoming Traffic (MB/s)', 'network_in'),
+    ('opspro_network_out_mb', 'Network Outgoing Traffic (MB/s)', 'network_out'),
 )
+RESOURCE_FAMILIES = [(name, doc) for name, doc, _ in RESOURCE_METRICS]
+RESOURCE_FIELDS = [field for _, _, field in RESOURCE_METRICS]
+RESOURCE_LABELS = ['resource_id', 'resource_name', 'ip_address']
 
-MEMORY_USAGE = Gauge(
-    'opspro_memory_usage_percent',
-    'Memory Usage Percentage',
-    ['resource_id', 'resource_name', 'ip_address']
-)
+# resource_id -> "name\tip" of every exported resource
+EXPORTED_KEY = "opspro:metrics:resources"
+# resource_id scored by when its labels were last written; resources silent
+# for METRICS_EXPORT_PRUNE_SECONDS are dropped by prune_exported()
+EXPORTED_SEEN_KEY = "opspro:metrics:resources:seen"
 
-DISK_USAGE = Gauge(
-    'opspro_disk_usage_percent',
-    'Disk Usage Percentage',
-    ['resource_id', 'resource_name', 'ip_address']
-)
+# Labels this process registered recently, to skip redundant writes. Entries
+# are refreshed periodically so a resource cleared by another process (e.g.
+# marked offline) is exported again once it reports.
+LABELS_REFRESH_SECONDS = 60
+_registered_labels: Dict[str, Tuple[str, float]] = {}
 
-NETWORK_IN = Gauge(
-    'opspro_network_in_mb',
-    'Network Incoming Traffic (MB/s)',
-    ['resource_id', 'resource_name', 'ip_address']
-)
+# After a failed write, labels are not written again for this long, so a
+# Redis outage costs one timeout per interval rather than one per sample
+EXPORT_RETRY_SECONDS = 30
+_export_retry_at = 0.0
 
-NETWORK_OUT = Gauge(
-    'opspro_network_out_mb',
-    'Network Outgoing Traffic (MB/s)',
-    ['resource_id', 'resource_name', 'ip_address']
-)
+
+def _parse_float(value: Optional[str]) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
 
 
-def update_metrics(resource_id: str, resource_name: str, ip_address: str, metrics: dict):
+class SnapshotCollector(Collector):
     """
-    Update Prometheus metrics for a resource
+    Per-resource gauges backed by a ResourceSnapshotStore.
+
+    The store is refreshed from Redis at most every `ttl` seconds, which
+    bounds the Redis work per scrape. Resources not seen for `stale_seconds`
+    are expired, and at most `max_resources` are exported.
+
+    `render()` writes the text format straight from the store and is what
+    /metrics uses; `collect()` keeps the regular Collector interface.
     """
-    labels = {
-        'resource_id': str(resource_id),
-        'resource_name': resource_name,
-        'ip_address': ip_address
-    }
 
-    if 'cpu_usage' in metrics:
-        CPU_USAGE.labels(**labels).set(metrics['cpu_usage'])
+    def __init__(
+        self,
+        ttl: float = settings.METRICS_SNAPSHOT_TTL_SECONDS,
+        stale_seconds: float = settings.METRICS_STALE_SECONDS,
+        max_resources: int = settings.METRICS_MAX_RESOURCES
+    ):
+        self.ttl = ttl
+        self.stale_seconds = stale_seconds
+        self.store = ResourceSnapshotStore(len(RESOURCE_METRICS), RESOURCE_LABELS, max_resources)
+        self._lock = threading.Lock()
+        self._refreshed_at: Optional[float] = None
+
+    def describe(self):
+        # Avoid a Redis round trip on registration
+        return [GaugeMetricFamily(name, doc, labels=RESOURCE_LABELS) for name, doc in RESOURCE_FAMILIES]
+
+    def refresh(self):
+        """Load the exported resources and their latest values from Redis"""
+        exported = redis_client.hgetall(EXPORTED_KEY)
+        resource_ids = list(exported)
+        pipe = redis_client.pipeline(transaction=False)
+        for resource_id in resource_ids:
+            pipe.hmget(state_key(int(resource_id)), "ts", *RESOURCE_FIELDS)
+        replies = pipe.execute()
 
-    if 'memory_usage' in metrics:
-        MEMORY_USAGE.labels(**labels).set(metrics['memory_usage'])
+        store = self.store
+        store.refused = 0
+        live = []
+        for resource_id, reply in zip(resource_ids, replies):
+            if reply[0] is None:
+                continue
+            name, _, ip_address = exported[resource_id].partition("\t")
+            rid = int(resource_id)
+            if store.update(rid, (resource_id, name, ip_address),
+                            [_parse_float(v) for v in reply[1:]], float(reply[0])):
+                live.append(rid)
+        store.retain(live)
+        store.expire(time.time() - self.stale_seconds)
 
-    if 'disk_usage' in metrics:
-        DISK_USAGE.labels(**labels).set(metrics['disk_usage'])
+        SNAPSHOT_RESOURCES.set(len(store))
+        SNAPSHOT_REFUSED.set(store.refused)
+        if store.refused:
+            logger.warning(
+                f"Metrics snapshot is at its limit of {store.max_resources} resources, "
+                f"{store.refused} not exported"
+            )
 
-    if 'network_in' in metrics:
-        NETWORK_IN.labels(**labels).set(metrics.get('network_in', 0))
+    def _maybe_refresh(self):
+        if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.ttl:
+            return
+        try:
+            self.refresh()
+        except RedisError as e:
+            # Keep serving the last snapshot rather than dropping every series
+            logger.warning(f"Resource metrics snapshot unavailable: {e}")
+        self._refreshed_at = time.monotonic()
 
-    if 'network_out' in metrics:
-        NETWORK_OUT.labels(**labels).set(metrics.get('network_out', 0))
+    def collect(self):
+        with self._lock:
+            self._maybe_refresh()
+            families = []
+            for metric, (name, doc) in enumerate(RESOURCE_FAMILIES):
+                family = GaugeMetricFamily(name, doc, labels=RESOURCE_LABELS)
+                for labels, value in self.store.iter_samples(metric):
+                    family.add_metric(labels, value)
+                families.append(family)
+            return families
+
+    def render(self) -> str:
+        with self._lock:
+            self._maybe_refresh()
+            return self.store.render(RESOURCE_FAMILIES)
+
+
+async def export_resources(resources: Iterable[Tuple[object, str, Optional[str]]]):
+    """
+    Export the metrics of reporting resources, given as (id, name, ip).
+    Values are read from the live state cache at scrape time; this only
+    registers the labels that changed or are due for a refresh, with one HSET.
+    """
+    global _export_retry_at
+    now = time.monotonic()
+    if now < _export_retry_at:
+        return
+    changed = {}
+    for resource_id, resource_name, ip_address in resources:
+        resource_id = str(resource_id)
+        labels = f"{resource_name}\t{ip_address or ''}"
+        registered = _registered_labels.get(resource_id)
+        if registered and registered[0] == labels and now - registered[1] < LABELS_REFRESH_SECONDS:
+            continue
+        changed[resource_id] = labels
+    if not changed:
+        return
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.hset(EXPORTED_KEY, mapping=changed)
+            pipe.zadd(EXPORTED_SEEN_KEY, {resource_id: time.time() for resource_id in changed})
+            await pipe.execute()
+    except RedisError as e:
+        _export_retry_at = now + EXPORT_RETRY_SECONDS
+        logger.warning(f"Could not export metrics of {len(changed)} resources, retrying in {EXPORT_RETRY_SECONDS}s: {e}")
+        return
+    for resource_id, labels in changed.items():
+        _registered_labels[resource_id] = (labels, now)
+
+
+async def update_metrics(resource_id: str, resource_name: str, ip_address: str, metrics: dict):
+    """Export a resource's metrics (see export_resources)"""
+    await export_resources([(resource_id, resource_name, ip_address)])
 
 
 def clear_metrics(resource_id: str, resource_name: str, ip_address: str):
@@ -68,23 +182,58 @@ def clear_metrics(resource_id: str, resource_name: str, ip_address: str):
     Clear Prometheus metrics for a resource when it goes offline or is deleted.
     This prevents stale metrics from accumulating.
     """
-    labels = {
-        'resource_id': str(resource_id),
-        'resource_name': resource_name,
-        'ip_address': ip_address
-    }
+    if clear_resources_metrics([resource_id]):
+        logger.info(f"Cleared Prometheus metrics for resource {resource_id} ({resource_name})")
 
+
+def clear_resources_metrics(resource_ids: Iterable) -> bool:
+    """Stop exporting the series of many resources with a single HDEL"""
+    resource_ids = [str(resource_id) for resource_id in resource_ids]
+    if not resource_ids:
+        return True
+    for resource_id in resource_ids:
+        _registered_labels.pop(resource_id, None)
     try:
-        # Remove metrics for this resource
-        CPU_USAGE.remove(*labels.values())
-        MEMORY_USAGE.remove(*labels.values())
-        DISK_USAGE.remove(*labels.values())
-        NETWORK_IN.remove(*labels.values())
-        NETWORK_OUT.remove(*labels.values())
-        logger.info(f"Cleared Prometheus metrics for resource {resource_id} ({resource_name})")
-    except Exception as e:
-        # Metrics might not exist, that's okay
-        logger.debug(f"Could not clear metrics for resource {resource_id}: {e}")
+        with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hdel(EXPORTED_KEY, *resource_ids)
+            pipe.zrem(EXPORTED_SEEN_KEY, *resource_ids)
+            pipe.execute()
+        return True
+    except RedisError as e:
+        logger.warning(f"Could not clear metrics for {len(resource_ids)} resources: {e}")
+        return False
+
+
+async def unexport_resource(resource_id):
+    """Stop exporting a deleted resource's series"""
+    resource_id = str(resource_id)
+    _registered_labels.pop(resource_id, None)
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.hdel(EXPORTED_KEY, resource_id)
+            pipe.zrem(EXPORTED_SEEN_KEY, resource_id)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not clear metrics of resource {resource_id}: {e}")
+
+
+def prune_exported(max_age: float = settings.METRICS_EXPORT_PRUNE_SECONDS, now: Optional[float] = None) -> int:
+    """
+    Drop exported resources whose labels were not written for `max_age`
+    seconds (deleted or decommissioned hosts). Returns how many were dropped.
+    """
+    now = time.time() if now is None else now
+    if redis_client.hlen(EXPORTED_KEY) != redis_client.zcard(EXPORTED_SEEN_KEY):
+        # Entries without a last-seen time (exported before it was kept)
+        # start aging now
+        exported = redis_client.hkeys(EXPORTED_KEY)
+        if exported:
+            redis_client.zadd(EXPORTED_SEEN_KEY, {resource_id: now for resource_id in exported}, nx=True)
+    stale = redis_client.zrangebyscore(EXPORTED_SEEN_KEY, "-inf", now - max_age)
+    if stale:
+        clear_resources_metrics(stale)
+        logger.info(f"Stopped exporting {len(stale)} resources silent for more than {max_age:.0f}s")
+    return len(stale)
 
 
 def update_resource_status(resource_id: str, resource_name: str, ip_address: str, is_online: bool):
@@ -96,3 +245,118 @@ def update_resource_status(resource_id: str, resource_name: str, ip_address: str
         logger.info(f"Resource {resource_id} ({resource_name}) marked as offline, metrics cleared")
     else:
         logger.debug(f"Resource {resource_id} ({resource_name}) is online")
+
+
+# Platform internal metrics
+
+INGEST_QUEUE_DEPTH = Gauge(
+    'opspro_ingest_queue_depth',
+    'Metric samples waiting in the write-behind buffer'
+)
+
+INGEST_FLUSH_LATENCY = Gauge(
+    'opspro_ingest_flush_latency_seconds',
+    'Duration of the last write-behind buffer flush'
+)
+
+INGEST_FLUSH_SIZE = Gauge(
+    'opspro_ingest_flush_size',
+    'Number of samples written by the last write-behind buffer flush'
+)
+
+INGEST_REJECTED = Counter(
+    'opspro_ingest_rejected_samples_total',
+    'Metric samples rejected because the write-behind buffer was full'
+)
+
+INGEST_DROPPED = Counter(
+    'opspro_ingest_dropped_samples_total',
+    'Metric samples dropped after repeated flush failures'
+)
+
+CACHE_REQUESTS = Counter(
+    'opspro_cache_requests_total',
+    'Lookups of shared response caches (hit, coalesced onto another computation, or miss)',
+    ['cache', 'result']
+)
+
+PROMETHEUS_LATENCY = Histogram(
+    'opspro_prometheus_request_seconds',
+    'Round-trip latency of requests to Prometheus',
+    ['endpoint'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+PROMETHEUS_BREAKER_STATE = Gauge(
+    'opspro_prometheus_breaker_state',
+    'Circuit breaker in front of Prometheus (0 closed, 1 half-open, 2 open)'
+)
+
+QUERY_REJECTED = Counter(
+    'opspro_query_rejected_total',
+    'PromQL proxy requests refused (cost, concurrency or invalid)',
+    ['reason']
+)
+
+QUERY_CLAMPED = Counter(
+    'opspro_query_clamped_total',
+    'Range queries whose step was raised by the cost limit'
+)
+
+QUERY_COALESCED = Counter(
+    'opspro_query_coalesced_total',
+    'PromQL proxy requests served by an identical in-flight query',
+    ['endpoint']
+)
+
+STATS_DRIFT = Counter(
+    'opspro_stats_counter_drift_total',
+    'Absolute difference between the stats counters and a recount, corrected by the reconciler',
+    ['stats']
+)
+
+SSH_QUEUE_DEPTH = Gauge(
+    'opspro_ssh_queue_depth',
+    'SSH jobs waiting for their host or for a pool thread'
+)
+
+SSH_POOL_BUSY = Gauge(
+    'opspro_ssh_pool_busy_threads',
+    'SSH pool threads running a job'
+)
+
+SSH_POOL_SATURATION = Gauge(
+    'opspro_ssh_pool_saturation',
+    'Share of the SSH pool threads running a job (0 to 1)'
+)
+
+SSH_JOB_SECONDS = Histogram(
+    'opspro_ssh_job_seconds',
+    'Duration of SSH jobs on the pool',
+    ['operation'],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+
+SSH_REJECTED = Counter(
+    'opspro_ssh_rejected_total',
+    'SSH jobs refused because the queue was full or their host stayed busy'
+)
+
+
+SNAPSHOT_RESOURCES = Gauge(
+    'opspro_metrics_snapshot_resources',
+    'Resources exported by the per-resource metrics snapshot'
+)
+
+SNAPSHOT_REFUSED = Gauge(
+    'opspro_metrics_snapshot_refused_resources',
+    'Resources left out of the snapshot by METRICS_MAX_RESOURCES'
+)
+
+# Not registered in REGISTRY: /metrics renders it directly (see render_metrics)
+RESOURCE_COLLECTOR = SnapshotCollector()
+
+
+def render_metrics() -> bytes:
+    """Body of /metrics: the default registry followed by the resource snapshot"""
+    return generate_latest(REGISTRY) + RESOURCE_COLLECTOR.render().encode("utf-8")
@@ -0,0 +1,122 @@
+"""
+Keyset (cursor) pagination for list endpoints
+Pages are read with `WHERE (sort keys) > (last row's keys) ORDER BY sort keys
+LIMIT n` on an indexed sort key instead of OFFSET, so every page costs the
+same however deep it is. The cursor handed to clients is the opaque,
+base64url-encoded sort key of the last row of the previous page.
+
+The total, when asked for, is the planner's row estimate for the filtered
+query (EXPLAIN), not an exact COUNT(*).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import DateTime, Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute, Query, Session
+
+# (column, descending)
+SortKey = Tuple[InstrumentedAttribute, bool]
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _typed_value(column: InstrumentedAttribute, value: Any) -> Any:
+    """`value` as a value of `column`; TypeError if it is of another type"""
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    # bool is an int to isinstance, but never a valid integer key
+    if not isinstance(value, python_type) or (isinstance(value, bool) and python_type is not bool):
+        raise TypeError(f"{column.key} must be {python_type.__name__}, not {type(value).__name__}")
+    return value
+
+
+def decode_cursor(cursor: str, keys: Sequence[SortKey]) -> List[Any]:
+    """Sort key values of a cursor; HTTP 400 if it was not issued for these keys"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("wrong number of sort keys")
+        return [_typed_value(column, value) for (column, _), value in zip(keys, values)]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor: {e}"
+        )
+
+
+def keyset_query(query, keys: Sequence[SortKey], cursor: Optional[str], limit: int):
+    """
+    `query` (a Query or a select()) restricted to the page after `cursor`,
+    ordered by `keys` (all ascending or all descending, the last one unique).
+    One row more than the page is fetched to tell whether another page follows.
+    """
+    descending = keys[0][1]
+    assert all(desc == descending for _, desc in keys), "mixed sort directions"
+    columns = [column for column, _ in keys]
+
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        left = tuple_(*columns) if len(columns) > 1 else columns[0]
+        right = tuple_(*values) if len(values) > 1 else values[0]
+        query = query.filter(left < right if descending else left > right)
+
+    query = query.order_by(*(column.desc() if descending else column.asc() for column in columns))
+    return query.limit(limit + 1)
+
+
+def split_page(rows: List[Any], keys: Sequence[SortKey], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """The page and the cursor of the next one (None on the last page)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column, _ in keys])
+
+
+def keyset_page(
+    query: Query,
+    keys: Sequence[SortKey],
+    cursor: Optional[str],
+    limit: int
+) -> Tuple[List[Any], Optional[str]]:
+    """One page of `query` and the cursor of the next page"""
+    return split_page(keyset_query(query, keys, cursor, limit).all(), keys, limit)
+
+
+async def keyset_page_async(
+    db: AsyncSession,
+    statement: Select,
+    keys: Sequence[SortKey],
+    cursor: Optional[str],
+    limit: int
+) -> Tuple[List[Any], Optional[str]]:
+    """keyset_page for a select() on an async session"""
+    rows = (await db.scalars(keyset_query(statement, keys, cursor, limit))).all()
+    return split_page(list(rows), keys, limit)
+
+
+def estimate_count(db: Session, query) -> Optional[int]:
+    """
+    Planner row estimate of `query`, a Query or a select() (PostgreSQL only,
+    None elsewhere). Async sessions call it with run_sync.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return None
+    statement = getattr(query, "statement", query).order_by(None).compile(
+        dialect=bind.dialect, compile_kwargs={"literal_binds": True}
+    )
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}").scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,19 @@
+"""
+Shared Redis clients
+`redis_client` is for sync code (celery tasks, workers), `async_redis_client`
+for the API's request path. Both connect lazily on first use.
+"""
+import redis
+import redis.asyncio as aioredis
+from app.core.config import settings
+
+REDIS_OPTIONS = dict(
+    decode_responses=True,
+    socket_connect_timeout=5,
+    socket_timeout=5,
+    health_check_interval=30
+)
+
+redis_client = redis.from_url(settings.REDIS_URL, **REDIS_OPTIONS)
+
+async_redis_client = aioredis.from_url(settings.REDIS_URL, **REDIS_OPTIONS)
@@ -0,0 +1,143 @@
+"""
+Compact per-resource metric snapshot store
+Holds the latest value of a fixed set of metrics for many resources in flat
+arrays (one slot per resource) with pre-escaped label strings, and renders
+them straight to the Prometheus text format. This avoids one child object
+per series and the per-sample label handling of prometheus_client.
+"""
+import math
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+NAN = float("nan")
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    return ",".join(f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values))
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class ResourceSnapshotStore:
+    """
+    Latest values of `metric_count` metrics per resource.
+
+    Slots of removed resources are reused. At most `max_resources` resources
+    are held; updates for new resources beyond that are refused.
+    """
+
+    def __init__(self, metric_count: int, label_names: Sequence[str], max_resources: int):
+        self.metric_count = metric_count
+        self.label_names = list(label_names)
+        self.max_resources = max_resources
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._ids = array("q")
+        self._last_seen = array("d")
+        self._values = [array("d") for _ in range(metric_count)]
+        self._labels: List[Optional[str]] = []
+        # Raw label values, to re-escape only when they change
+        self._label_values: List[Optional[Tuple[str, ...]]] = []
+        self.refused = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, resource_id: int) -> bool:
+        return resource_id in self._slots
+
+    def _allocate(self, resource_id: int) -> Optional[int]:
+        if len(self._slots) >= self.max_resources:
+            self.refused += 1
+            return None
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = resource_id
+        else:
+            slot = len(self._ids)
+            self._ids.append(resource_id)
+            self._last_seen.append(0.0)
+            for values in self._values:
+                values.append(NAN)
+            self._labels.append(None)
+            self._label_values.append(None)
+        self._slots[resource_id] = slot
+        return slot
+
+    def update(
+        self,
+        resource_id: int,
+        label_values: Tuple[str, ...],
+        values: Sequence[Optional[float]],
+        last_seen: float
+    ) -> bool:
+        """Set a resource's values; False if refused by the cardinality limit"""
+        slot = self._slots.get(resource_id)
+        if slot is None:
+            slot = self._allocate(resource_id)
+            if slot is None:
+                return False
+        if self._label_values[slot] != label_values:
+            self._label_values[slot] = label_values
+            self._labels[slot] = format_labels(self.label_names, label_values)
+        for metric, value in enumerate(values):
+            self._values[metric][slot] = NAN if value is None else value
+        self._last_seen[slot] = last_seen
+        return True
+
+    def remove(self, resource_id: int) -> bool:
+        slot = self._slots.pop(resource_id, None)
+        if slot is None:
+            return False
+        self._ids[slot] = -1
+        self._labels[slot] = None
+        self._label_values[slot] = None
+        self._last_seen[slot] = 0.0
+        for values in self._values:
+            values[slot] = NAN
+        self._free.append(slot)
+        return True
+
+    def retain(self, resource_ids: Iterable[int]) -> int:
+        """Drop every resource not in `resource_ids`; returns how many were dropped"""
+        keep = set(resource_ids)
+        gone = [resource_id for resource_id in self._slots if resource_id not in keep]
+        for resource_id in gone:
+            self.remove(resource_id)
+        return len(gone)
+
+    def expire(self, older_than: float) -> int:
+        """Drop resources last seen before `older_than` (epoch seconds)"""
+        stale = [rid for rid, slot in self._slots.items() if self._last_seen[slot] < older_than]
+        for resource_id in stale:
+            self.remove(resource_id)
+        return len(stale)
+
+    def iter_samples(self, metric: int):
+        """(label values, value) of every resource holding a value for `metric`"""
+        values = self._values[metric]
+        for slot, label_values in enumerate(self._label_values):
+            if label_values is not None and values[slot] == values[slot]:
+                yield label_values, values[slot]
+
+    def render(self, families: Sequence[Tuple[str, str]]) -> str:
+        """Prometheus text exposition of the store; `families` is (name, help) per metric"""
+        parts = []
+        labels = self._labels
+        for metric, (name, doc) in enumerate(families):
+            parts.append(f"# HELP {name} {doc}\n# TYPE {name} gauge\n")
+            # value == value skips NaN (no value)
+            parts.extend(
+                f"{name}{{{label}}} {format_value(value)}\n"
+                for label, value in zip(labels, self._values[metric])
+                if label is not None and value == value
+            )
+        return "".join(parts)
@@ -1,17 +1,52 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from prometheus_client import make_asgi_app
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import async_engine, engine, Base
+from app.core.monitoring import render_metrics
 from app.core.rate_limit import limiter
 from app.api.v1 import auth, users, resources, monitoring, alerts, automation
+from app.services.metric_buffer import metric_buffer
+from app.services.metric_partitions import maintain_partitions
+from app.services.fleet_stream import fleet_broadcaster
+from app.services.prometheus import prometheus
+from app.services.ssh_executor import ssh_executor
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop app-lifetime background services"""
+    # Make sure today's metric partitions exist before the first sample arrives;
+    # the maintain-metric-partitions beat task keeps them ahead afterwards
+    try:
+        await asyncio.to_thread(maintain_partitions, engine)
+    except Exception as e:
+        logger.warning(f"Could not maintain metric partitions on startup: {e}")
+    if settings.METRIC_BUFFER_ENABLED:
+        await metric_buffer.start()
+    await prometheus.start()
+    if settings.FLEET_STREAM_ENABLED:
+        await fleet_broadcaster.start()
+    yield
+    # Flush buffered metric rows on graceful shutdown
+    await metric_buffer.stop()
+    await fleet_broadcaster.stop()
+    await prometheus.stop()
+    await async_engine.dispose()
+    ssh_executor.shutdown()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
@@ -19,7 +54,8 @@ app = FastAPI(
     description="Operations Platform API",
     docs_url="/api/docs",
     redoc_url="/api/redoc",
-    openapi_url="/api/openapi.json"
+    openapi_url="/api/openapi.json",
+    lifespan=lifespan
 )
 
 # Add rate limiter to app
@@ -43,9 +79,10 @@ app.include_router(monitoring.router, prefix="/api/v1/monitoring", tags=["Monito
 app.include_router(alerts.router, prefix="/api/v1/alerts", tags=["Alerts"])
 app.include_router(automation.router, prefix="/api/v1/automation", tags=["Automation"])
 
-# Prometheus metrics endpoint
-metrics_app = make_asgi_app()
-app.mount("/metrics", metrics_app)
+# Prometheus metrics endpoint (sync, so rendering runs in the threadpool)
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/")
@@ -3,7 +3,8 @@ from app.models.user import User
 from app.models.resource import Resource, ResourceType, ResourceStatus
 from app.models.alert import Alert, AlertRule, AlertSeverity, AlertStatus
 from app.models.task import Task, TaskStatus
-from app.models.metric import Metric, ProcessMetric
+from app.models.agent_job import AgentJob, AgentJobAction, AgentRollout
+from app.models.metric import Metric, ProcessMetric, MetricRollup1m, MetricRollup5m, MetricRollup1h
 
 __all__ = [
     "User",
@@ -16,6 +17,12 @@ __all__ = [
     "AlertStatus",
     "Task",
     "TaskStatus",
+    "AgentJob",
+    "AgentJobAction",
+    "AgentRollout",
     "Metric",
     "ProcessMetric",
+    "MetricRollup1m",
+    "MetricRollup5m",
+    "MetricRollup1h",
 ]
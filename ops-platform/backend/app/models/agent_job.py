@@ -0,0 +1,75 @@
+from sqlalchemy import Column, Float, Integer, String, Text, JSON, DateTime, Enum as SQLEnum
+from sqlalchemy.sql import func
+from app.core.database import Base
+from app.models.task import TaskStatus
+import enum
+
+
+class AgentJobAction(str, enum.Enum):
+    """What an agent job does on its host"""
+    DEPLOY = "deploy"
+    UNINSTALL = "uninstall"
+
+
+class AgentJob(Base):
+    """Background agent deploy/uninstall job, run by the Celery worker"""
+    __tablename__ = "agent_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    action = Column(SQLEnum(AgentJobAction), nullable=False)
+    # Not a foreign key: an uninstall job outlives its deleted resource
+    resource_id = Column(Integer, index=True)
+    host = Column(String(255), nullable=False)
+    # Set for jobs of a fleet rollout, with the batch they run in
+    rollout_id = Column(Integer, index=True)
+    batch = Column(Integer)
+    
+    status = Column(SQLEnum(TaskStatus), nullable=False, default=TaskStatus.PENDING)
+    # [{"name", "status", "started_at", "finished_at"}] in execution order
+    steps = Column(JSON, nullable=False, default=list)
+    current_step = Column(String(20))
+    error = Column(Text)
+    
+    # SSH credentials and agent token (encrypted), cleared once the job starts
+    secrets_enc = Column(Text)
+    parameters = Column(JSON, default=dict)
+    
+    created_by = Column(String(100))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    
+    def __repr__(self):
+        return f"<AgentJob(id={self.id}, action='{self.action}', host='{self.host}', status='{self.status}')>"
+
+
+class AgentRollout(Base):
+    """Agent deployment to a selection of resources, in canary-first batches"""
+    __tablename__ = "agent_rollouts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(SQLEnum(TaskStatus), nullable=False, default=TaskStatus.PENDING)
+    # The request's resource selector, as given
+    selector = Column(JSON, nullable=False, default=dict)
+    
+    # Execution settings
+    parallelism = Column(Integer, nullable=False)
+    canary_size = Column(Integer, nullable=False, default=0)
+    batch_size = Column(Integer, nullable=False)
+    max_failure_rate = Column(Float, nullable=False)
+    
+    # Progress
+    total_hosts = Column(Integer, nullable=False, default=0)
+    batches = Column(Integer, nullable=False, default=0)
+    current_batch = Column(Integer)
+    # Selected resources without a job: [{"resource_id", "name", "reason"}]
+    skipped = Column(JSON, default=list)
+    stop_reason = Column(Text)
+    
+    created_by = Column(String(100))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    
+    def __repr__(self):
+        return f"<AgentRollout(id={self.id}, hosts={self.total_hosts}, status='{self.status}')>"
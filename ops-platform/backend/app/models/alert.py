@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, JSON, DateTime, Enum as SQLEnum, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, JSON, DateTime, Enum as SQLEnum, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from app.core.database import Base
 import enum
@@ -18,6 +18,11 @@ class AlertStatus(str, enum.Enum):
     ACKNOWLEDGED = "acknowledged"
 
 
+# Alerts in these states are "open"; at most one open alert exists per fingerprint.
+# SQLEnum stores member names, hence the upper-case literals.
+OPEN_ALERT_PREDICATE = "status IN ('FIRING', 'ACKNOWLEDGED')"
+
+
 class AlertRule(Base):
     """Alert rule configuration"""
     __tablename__ = "alert_rules"
@@ -51,6 +56,15 @@ class AlertRule(Base):
 class Alert(Base):
     """Alert instance"""
     __tablename__ = "alerts"
+    __table_args__ = (
+        Index(
+            "uq_alerts_open_fingerprint", "fingerprint", unique=True,
+            postgresql_where=text(OPEN_ALERT_PREDICATE),
+            sqlite_where=text(OPEN_ALERT_PREDICATE)
+        ),
+        # Keyset pagination of the alert list (newest first)
+        Index("ix_alerts_fired_at_id", "fired_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     rule_id = Column(Integer, ForeignKey("alert_rules.id"), nullable=False)
@@ -63,6 +77,11 @@ class Alert(Base):
     current_value = Column(Float)
     threshold_value = Column(Float)
     
+    # Deduplication: sha256 of rule, resource and labels (see alert_engine.alert_fingerprint)
+    fingerprint = Column(String(64))
+    occurrences = Column(Integer, default=1, nullable=False)
+    last_seen_at = Column(DateTime(timezone=True))
+    
     # Metadata
     labels = Column(JSON, default=dict)
     annotations = Column(JSON, default=dict)
@@ -1,7 +1,12 @@
 """
 Metric model for storing time-series monitoring data
+
+Both tables are range partitioned by day on `timestamp` (see
+app/services/metric_partitions.py), so the partition key is part of the primary key.
+Per-resource reads go through a (resource_id, timestamp DESC) index; a BRIN
+index on `timestamp` serves fleet-wide range scans.
 """
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, String, JSON
+from sqlalchemy import Column, Index, Integer, BigInteger, Float, DateTime, ForeignKey, String, JSON, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.core.database import Base
@@ -11,9 +16,14 @@ class Metric(Base):
     """Time-series metrics from monitored resources"""
     
     __tablename__ = "metrics"
+    __table_args__ = (
+        Index("ix_metrics_resource_id_timestamp", "resource_id", text("timestamp DESC")),
+        Index("ix_metrics_timestamp_brin", "timestamp", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    resource_id = Column(Integer, ForeignKey("resources.id"), nullable=False, index=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    resource_id = Column(Integer, ForeignKey("resources.id", ondelete="CASCADE"), nullable=False)
     
     # System metrics
     cpu_usage = Column(Float, nullable=False)
@@ -28,7 +38,7 @@ class Metric(Base):
     extra_data = Column(JSON, default={})
     
     # Timestamp
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, primary_key=True)
     
     # Relationship
     resource = relationship("Resource", back_populates="metrics")
@@ -38,9 +48,14 @@ class ProcessMetric(Base):
     """Top process metrics"""
     
     __tablename__ = "process_metrics"
+    __table_args__ = (
+        Index("ix_process_metrics_resource_id_timestamp", "resource_id", text("timestamp DESC")),
+        Index("ix_process_metrics_timestamp_brin", "timestamp", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    resource_id = Column(Integer, ForeignKey("resources.id"), nullable=False, index=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    resource_id = Column(Integer, ForeignKey("resources.id", ondelete="CASCADE"), nullable=False)
     
     # Process info
     process_name = Column(String(255), nullable=False)
@@ -49,7 +64,58 @@ class ProcessMetric(Base):
     memory_percent = Column(Float, default=0.0)
     
     # Timestamp
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, primary_key=True)
     
     # Relationship
     resource = relationship("Resource")
+
+
+class MetricRollupMixin:
+    """
+    Pre-aggregated metrics per resource per time bucket.
+    Maintained incrementally from the raw `metrics` table by app/tasks/metric_maintenance.py.
+    """
+    
+    resource_id = Column(Integer, ForeignKey("resources.id", ondelete="CASCADE"), primary_key=True)
+    bucket = Column(DateTime, primary_key=True, index=True)  # Bucket start (UTC)
+    samples = Column(Integer, nullable=False, default=0)
+    
+    cpu_usage_min = Column(Float)
+    cpu_usage_avg = Column(Float)
+    cpu_usage_max = Column(Float)
+    cpu_usage_p95 = Column(Float)
+    
+    memory_usage_min = Column(Float)
+    memory_usage_avg = Column(Float)
+    memory_usage_max = Column(Float)
+    memory_usage_p95 = Column(Float)
+    
+    disk_usage_min = Column(Float)
+    disk_usage_avg = Column(Float)
+    disk_usage_max = Column(Float)
+    disk_usage_p95 = Column(Float)
+    
+    network_in_min = Column(Float)
+    network_in_avg = Column(Float)
+    network_in_max = Column(Float)
+    network_in_p95 = Column(Float)
+    
+    network_out_min = Column(Float)
+    network_out_avg = Column(Float)
+    network_out_max = Column(Float)
+    network_out_p95 = Column(Float)
+
+
+class MetricRollup1m(MetricRollupMixin, Base):
+    """1-minute rollups"""
+    __tablename__ = "metric_rollups_1m"
+
+
+class MetricRollup5m(MetricRollupMixin, Base):
+    """5-minute rollups"""
+    __tablename__ = "metric_rollups_5m"
+
+
+class MetricRollup1h(MetricRollupMixin, Base):
+    """1-hour rollups"""
+    __tablename__ = "metric_rollups_1h"
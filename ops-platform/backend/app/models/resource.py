@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, Index, Enum as SQLEnum, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -24,6 +24,14 @@ class ResourceStatus(str, enum.Enum):
 class Resource(Base):
     """Resource model for CMDB"""
     __tablename__ = "resources"
+    __table_args__ = (
+        # Stale-resource reaper: active resources by last_seen
+        Index(
+            "ix_resources_active_last_seen", "last_seen",
+            postgresql_where=text("status = 'ACTIVE'"),
+            sqlite_where=text("status = 'ACTIVE'")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), unique=True, index=True, nullable=False)
@@ -59,7 +67,8 @@ class Resource(Base):
     last_seen = Column(DateTime(timezone=True))
     
     # Relationships
-    metrics = relationship("Metric", back_populates="resource", cascade="all, delete-orphan")
+    # Samples are removed by the database (ON DELETE CASCADE), not loaded to be deleted one by one
+    metrics = relationship("Metric", back_populates="resource", cascade="all, delete-orphan", passive_deletes=True)
     
     # SSH Credentials (Encrypted)
     ssh_port = Column(Integer, default=22)
@@ -0,0 +1,123 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Dict, List, Optional
+from datetime import datetime
+from app.core.config import settings
+from app.models.agent_job import AgentJobAction
+from app.models.resource import ResourceStatus, ResourceType
+from app.models.task import TaskStatus
+
+
+class AgentJobStep(BaseModel):
+    """Progress of one step of an agent job"""
+    name: str
+    status: str  # pending, running, success, failed
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class AgentJobInDB(BaseModel):
+    """Agent deploy/uninstall job and its step progress"""
+    id: int
+    action: AgentJobAction
+    resource_id: Optional[int] = None
+    host: str
+    status: TaskStatus
+    steps: List[AgentJobStep]
+    current_step: Optional[str] = None
+    error: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class RolloutSelector(BaseModel):
+    """Resources an agent rollout deploys to; all given criteria must match"""
+    resource_ids: Optional[List[int]] = None
+    type: Optional[ResourceType] = None
+    status: Optional[List[ResourceStatus]] = None
+    tags: Optional[List[str]] = Field(None, description="Resources carrying every one of these tags")
+    labels: Optional[Dict[str, str]] = Field(None, description="Resources with all of these label values")
+    all_resources: bool = Field(False, description="Select the whole fleet (required when no criteria are given)")
+    
+    @model_validator(mode="after")
+    def check_not_empty(self):
+        criteria = (self.resource_ids, self.type, self.status, self.tags, self.labels)
+        if not self.all_resources and all(c is None for c in criteria):
+            raise ValueError("Give at least one selector criterion, or all_resources=true")
+        return self
+
+
+class RolloutCreate(BaseModel):
+    """Fleet-wide agent rollout request"""
+    selector: RolloutSelector
+    parallelism: int = Field(20, ge=1, le=settings.ROLLOUT_MAX_PARALLELISM, description="Hosts deployed to at once")
+    canary_size: int = Field(1, ge=0, description="Hosts of the first batch; any failure there stops the rollout")
+    batch_size: int = Field(100, ge=1, description="Hosts per batch after the canary")
+    max_failure_rate: float = Field(
+        0.1, ge=0, le=1, description="Stop once failed hosts exceed this share of the finished ones"
+    )
+    backend_url: Optional[str] = Field(None, description="Backend URL for agent callbacks")
+    # Used for every host instead of the credentials stored on the resources
+    ssh_username: Optional[str] = None
+    ssh_port: Optional[int] = Field(None, ge=1, le=65535)
+    ssh_password: Optional[str] = None
+    ssh_private_key: Optional[str] = None
+
+
+class RolloutSkipped(BaseModel):
+    """Selected resource that got no job"""
+    resource_id: int
+    name: str
+    reason: str
+
+
+class RolloutInDB(BaseModel):
+    """Agent rollout and its settings"""
+    id: int
+    status: TaskStatus
+    selector: Dict
+    parallelism: int
+    canary_size: int
+    batch_size: int
+    max_failure_rate: float
+    total_hosts: int
+    batches: int
+    current_batch: Optional[int] = None
+    skipped: Optional[List[RolloutSkipped]] = None
+    stop_reason: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
+class RolloutBatchReport(BaseModel):
+    """Job outcomes of one batch (0 is the canary batch when there is one)"""
+    batch: int
+    hosts: int
+    counts: Dict[str, int]
+
+
+class RolloutFailure(BaseModel):
+    """Failed host of a rollout"""
+    job_id: int
+    resource_id: Optional[int] = None
+    host: str
+    step: Optional[str] = None
+    error: Optional[str] = None
+
+
+class RolloutReport(RolloutInDB):
+    """Rollout with its aggregate outcome"""
+    counts: Dict[str, int]  # Jobs per status
+    failure_rate: float  # Failed share of the finished jobs
+    hosts_per_minute: Optional[float] = None
+    batch_reports: List[RolloutBatchReport]
+    failures: List[RolloutFailure]
@@ -57,6 +57,9 @@ class AlertInDB(AlertBase):
     """Schema for alert in database"""
     id: int
     status: AlertStatus
+    fingerprint: Optional[str] = None
+    occurrences: int = 1
+    last_seen_at: Optional[datetime] = None
     labels: Dict[str, str]
     annotations: Dict[str, str]
     fired_at: datetime
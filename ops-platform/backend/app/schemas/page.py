@@ -0,0 +1,13 @@
+from pydantic import BaseModel
+from typing import Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    """One page of a cursor-paginated listing"""
+    items: List[T]
+    # Pass as `cursor` to get the next page; None on the last page
+    next_cursor: Optional[str] = None
+    # Planner estimate of the matching rows, when requested with with_total
+    total_estimate: Optional[int] = None
@@ -1,7 +1,8 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any
 from datetime import datetime
 from app.models.resource import ResourceType, ResourceStatus
+from app.schemas.agent_job import AgentJobInDB
 
 
 class ResourceBase(BaseModel):
@@ -67,6 +68,11 @@ class ResourceInDB(ResourceBase):
         from_attributes = True
 
 
+class ResourceCreated(ResourceInDB):
+    """Created resource, with the agent deploy job started for it if any"""
+    agent_job: Optional[AgentJobInDB] = None
+
+
 class ResourceMetrics(BaseModel):
     """Resource metrics update"""
     cpu_usage: float = Field(..., ge=0, le=100)
@@ -77,6 +83,32 @@ class ResourceMetrics(BaseModel):
     top_processes: Optional[List[Dict]] = []
 
 
+class MetricSample(ResourceMetrics):
+    """Single sample inside a batch ingest request"""
+    resource_id: int = Field(..., ge=1)
+    timestamp: Optional[datetime] = Field(None, description="Sample time (UTC), defaults to receive time")
+
+
+class MetricBatchRequest(BaseModel):
+    """Batch of metric samples, possibly for many resources"""
+    samples: List[Any] = Field(..., min_length=1)
+
+
+class MetricBatchItemResult(BaseModel):
+    """Per-sample ingest status"""
+    index: int
+    resource_id: Optional[int] = None
+    status: str  # accepted, rejected
+    error: Optional[str] = None
+
+
+class MetricBatchResponse(BaseModel):
+    """Batch ingest result summary"""
+    accepted: int
+    rejected: int
+    results: List[MetricBatchItemResult]
+
+
 class ResourceProbeRequest(BaseModel):
     """Request to probe a server for auto-detection"""
     ip_address: str = Field(..., description="Server IP address")
@@ -120,8 +152,26 @@ class MessageResponse(BaseModel):
     message: str
 
 
+class ResourceDeleteResponse(MessageResponse):
+    """Resource deletion result, with the agent uninstall job if one was started"""
+    agent_job: Optional[AgentJobInDB] = None
+    warning: Optional[str] = None
+
+
 class MetricResponse(BaseModel):
     """Resource metrics response"""
     resource_id: int
+    metrics: List[Dict] = []
+    processes: List[Dict] = []
+
+
+class MetricHistoryResponse(BaseModel):
+    """Resource metrics history"""
+    resource_id: int
+    resource_name: str
+    period_hours: int
+    resolution: str  # raw, 1m, 5m, 1h
+    agg: Optional[str] = None  # set when the series was downsampled
+    bucket_seconds: Optional[int] = None
+    data_points: int
     metrics: List[Dict]
-    processes: List[Dict]
@@ -0,0 +1,32 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+from datetime import datetime
+from app.models.task import TaskStatus
+
+
+class TaskInDB(BaseModel):
+    """Schema for automation task in database"""
+    id: int
+    name: str
+    description: Optional[str] = None
+    task_type: str
+    script_content: Optional[str] = None
+    script_path: Optional[str] = None
+    parameters: Optional[Dict[str, Any]] = None
+    target_resources: Optional[List[int]] = None
+    schedule: Optional[str] = None
+    enabled: Optional[bool] = None
+    status: Optional[TaskStatus] = None
+    last_run_at: Optional[datetime] = None
+    next_run_at: Optional[datetime] = None
+    execution_count: Optional[int] = None
+    success_count: Optional[int] = None
+    failure_count: Optional[int] = None
+    last_output: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    created_by: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
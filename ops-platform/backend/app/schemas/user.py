@@ -49,6 +49,12 @@ class Token(BaseModel):
     token_type: str = "bearer"
 
 
+class StreamTicket(BaseModel):
+    """Single-use ticket opening a live stream"""
+    ticket: str
+    expires_in: int
+
+
 class TokenData(BaseModel):
     """Token payload data"""
     username: Optional[str] = None
@@ -0,0 +1,169 @@
+"""
+Content-addressed agent bundles
+A deploy ships one compressed archive holding the agent script, its systemd
+unit and the wheels of its dependencies. The bundle is built once per version
+of those inputs (pip download runs only then) and cached on disk under
+AGENT_BUNDLE_DIR, keyed by a hash of the inputs; the archive itself is
+reproducible, so its sha256 names the exact bytes a host received.
+
+Hosts keep the sha256 of the bundle they have installed; AgentDeployer skips
+the upload and the dependency install when it matches.
+
+When the wheels cannot be downloaded the bundle is built without them (the
+host installs from its own index) and the download is retried after
+AGENT_BUNDLE_RETRY_SECONDS instead of on every deploy.
+"""
+import gzip
+import hashlib
+import io
+import logging
+import os
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+WHEELS_DIR = "wheels"
+
+
+class AgentBundle(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+    # False when the dependencies could not be downloaded
+    wheels: bool
+
+
+# Guards _bundles and _build_locks; never held while building
+_lock = threading.Lock()
+# Bundles of this process by inputs key: (bundle, built at)
+_bundles: Dict[str, Tuple[AgentBundle, float]] = {}
+# One lock per inputs key, so a bundle is built once while other keys are served
+_build_locks: Dict[str, threading.Lock] = {}
+
+
+def bundle_dir() -> str:
+    return settings.AGENT_BUNDLE_DIR or os.path.join(tempfile.gettempdir(), "opspro_agent_bundles")
+
+
+def inputs_key(files: Dict[str, str], packages: Sequence[str]) -> str:
+    """Hash of everything a bundle is built from"""
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(f"{name}\0{len(files[name])}\0".encode())
+        digest.update(files[name].encode())
+    digest.update("\0".join(sorted(packages)).encode())
+    return digest.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_wheels(packages: Sequence[str], target: str) -> bool:
+    """pip download the packages (and their dependencies) into target"""
+    try:
+        subprocess.run(
+            ["pip3", "download", "-d", target, *packages],
+            check=True,
+            capture_output=True,
+            timeout=settings.AGENT_BUNDLE_DOWNLOAD_TIMEOUT
+        )
+        return True
+    except subprocess.TimeoutExpired:
+        logger.warning("Agent dependency download timed out, building the bundle without wheels")
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"Agent dependency download failed, building the bundle without wheels: {e.stderr!r}")
+    except FileNotFoundError:
+        logger.warning("pip3 not found, building the bundle without wheels")
+    return False
+
+
+def _add(tar: tarfile.TarFile, name: str, data: bytes, mode: int):
+    # Fixed metadata so the same inputs give the same bytes
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = mode
+    info.mtime = 0
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_archive(path: str, files: Dict[str, str], wheels_dir: Optional[str]):
+    """Write a reproducible tar.gz of the files and the wheels in wheels_dir"""
+    entries = [(name, content.encode(), 0o755 if name.endswith(".py") else 0o644) for name, content in files.items()]
+    if wheels_dir:
+        for wheel in os.listdir(wheels_dir):
+            with open(os.path.join(wheels_dir, wheel), "rb") as f:
+                entries.append((f"{WHEELS_DIR}/{wheel}", f.read(), 0o644))
+
+    # gzip stamps the file name and time unless told not to
+    with open(path, "wb") as raw, gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode="w", format=tarfile.PAX_FORMAT) as tar:
+            for name, data, mode in sorted(entries):
+                _add(tar, name, data, mode)
+
+
+def _build(key: str, files: Dict[str, str], packages: Sequence[str]) -> AgentBundle:
+    directory = bundle_dir()
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=directory) as work:
+        wheels_dir = os.path.join(work, WHEELS_DIR)
+        os.makedirs(wheels_dir)
+        wheels = _download_wheels(packages, wheels_dir) if packages else True
+
+        name = f"{key}.tar.gz" if wheels else f"{key}-nowheels.tar.gz"
+        partial = os.path.join(work, name)
+        write_archive(partial, files, wheels_dir if wheels else None)
+        path = os.path.join(directory, name)
+        # Atomic, so other workers never read a half-written bundle
+        os.replace(partial, path)
+
+    bundle = AgentBundle(path, file_sha256(path), os.path.getsize(path), wheels)
+    logger.info(f"Built agent bundle {bundle.sha256[:12]} ({bundle.size} bytes, wheels: {wheels})")
+    return bundle
+
+
+def _cached(key: str) -> Optional[AgentBundle]:
+    """The bundle built for key, unless it is gone or its wheels are due for a retry"""
+    with _lock:
+        known = _bundles.get(key)
+    if known and os.path.exists(known[0].path) and (
+        known[0].wheels or time.monotonic() - known[1] < settings.AGENT_BUNDLE_RETRY_SECONDS
+    ):
+        return known[0]
+    return None
+
+
+def get_bundle(files: Dict[str, str], packages: Sequence[str]) -> AgentBundle:
+    """The bundle of these files and packages, built on first use"""
+    key = inputs_key(files, packages)
+    bundle = _cached(key)
+    if bundle:
+        return bundle
+
+    with _lock:
+        build_lock = _build_locks.setdefault(key, threading.Lock())
+    with build_lock:
+        # Built by another thread while this one waited
+        bundle = _cached(key)
+        if bundle:
+            return bundle
+
+        # Built by another worker, or before a restart
+        path = os.path.join(bundle_dir(), f"{key}.tar.gz")
+        if os.path.exists(path):
+            bundle = AgentBundle(path, file_sha256(path), os.path.getsize(path), True)
+        else:
+            bundle = _build(key, files, packages)
+        with _lock:
+            _bundles[key] = (bundle, time.monotonic())
+        return bundle
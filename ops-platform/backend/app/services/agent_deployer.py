@@ -1,9 +1,10 @@
 """
 Service to deploy monitoring agent to remote servers
 """
-import os
+import json
 import time
-from typing import Optional
+from typing import Callable, Iterable, Optional
+from app.services.agent_bundle import AgentBundle, get_bundle
 from app.services.resource_detector import SSHCredentials
 import paramiko
 
@@ -14,9 +15,12 @@ import os, sys, time, json, socket
 import subprocess
 from datetime import datetime
 
-BACKEND_URL = "__BACKEND_URL__"
-RESOURCE_ID = "__RESOURCE_ID__"
-API_TOKEN = "__API_TOKEN__"
+# 每台主机的配置 (部署时写入)
+with open("/opt/opspro/agent.json") as _f:
+    _CONFIG = json.load(_f)
+BACKEND_URL = _CONFIG["backend_url"]
+RESOURCE_ID = _CONFIG["resource_id"]
+API_TOKEN = _CONFIG["api_token"]
 INTERVAL = 30
 
 # ===== 依赖库处理 =====
@@ -241,16 +245,46 @@ RestartSec=10
 WantedBy=multi-user.target
 """
 
+AGENT_DIR = "/opt/opspro"
+# sha256 of the bundle installed on a host
+BUNDLE_MARKER = f"{AGENT_DIR}/.bundle-sha256"
+AGENT_PACKAGES = ("psutil", "requests")
+UPLOAD_CHUNK = 256 * 1024
+
+
+def agent_bundle() -> AgentBundle:
+    """The bundle of the current agent script, unit and dependencies"""
+    return get_bundle({"agent.py": AGENT_SCRIPT, "opspro-agent.service": SYSTEMD_SERVICE}, AGENT_PACKAGES)
+
 
 class AgentDeployer:
     """Deploy monitoring agent to remote servers"""
     
-    def __init__(self, credentials: SSHCredentials, resource_id: int, api_token: str, backend_url: str):
+    # Progress steps reported to `on_step`, in order
+    DEPLOY_STEPS = ("connect", "upload", "install", "start", "verify")
+    UNINSTALL_STEPS = ("connect", "stop", "remove", "reload")
+    
+    def __init__(
+        self,
+        credentials: SSHCredentials,
+        resource_id: int,
+        api_token: str,
+        backend_url: str,
+        on_step: Optional[Callable[[str], None]] = None
+    ):
         self.credentials = credentials
         self.resource_id = resource_id
         self.api_token = api_token
         self.backend_url = backend_url
         self.client: Optional[paramiko.SSHClient] = None
+        # Called with the name of each step as it begins
+        self.on_step = on_step
+        # Why the last deploy/uninstall failed
+        self.error: Optional[str] = None
+    
+    def _step(self, name: str):
+        if self.on_step:
+            self.on_step(name)
     
     def connect(self):
         """Establish SSH connection"""
@@ -287,70 +321,53 @@ class AgentDeployer:
         """
         Deploy agent to remote server (Offline Mode)
         Steps:
-        1. Download Python dependencies as wheel files
-        2. Upload dependencies and agent script
-        3. Set up systemd service
+        1. Check which agent bundle the host already has
+        2. Stream the bundle (script, unit, wheels) unless it is the same
+        3. Install dependencies and the systemd service from the bundle
         4. Start agent
         """
         try:
+            self._step("connect")
             self.connect()
             
-            # Step 1: Prepare offline dependencies
-            print("准备离线依赖包...")
-            wheels_dir = self._prepare_offline_packages()
-            
-            # Step 2: Create agent directory
-            print("创建 Agent 目录...")
-            self.execute("mkdir -p /opt/opspro/wheels")
-            
-            # Step 3: Upload dependencies
-            print("上传离线依赖包...")
-            sftp = self.client.open_sftp()
+            # Step 1: Compare the bundle with the one on the host
+            self._step("upload")
+            bundle = agent_bundle()
+            fresh = self.execute(f"cat {BUNDLE_MARKER} 2>/dev/null") != bundle.sha256
             
-            if wheels_dir and os.path.exists(wheels_dir):
-                for wheel_file in os.listdir(wheels_dir):
-                    local_path = os.path.join(wheels_dir, wheel_file)
-                    remote_path = f"/opt/opspro/wheels/{wheel_file}"
-                    sftp.put(local_path, remote_path)
-                    print(f"  上传: {wheel_file}")
-            
-            # Step 4: Upload agent script
-            print("上传 Agent 脚本...")
-            # Use replace to avoid format string issues with curly braces in script
-            agent_content = AGENT_SCRIPT.replace(
-                "__BACKEND_URL__", self.backend_url
-            ).replace(
-                "__RESOURCE_ID__", str(self.resource_id)
-            ).replace(
-                "__API_TOKEN__", self.api_token
-            )
-            
-            with sftp.file('/opt/opspro/agent.py', 'w') as f:
-                f.write(agent_content)
-            sftp.chmod('/opt/opspro/agent.py', 0o755)
+            # Step 2: Upload the bundle as a single stream
+            if fresh:
+                print(f"上传 Agent 包 ({bundle.size // 1024} KB)...")
+                self._upload_bundle(bundle)
+            else:
+                print("Agent 包未变化，跳过上传")
             
-            # Step 5: Create systemd service
-            print("创建 systemd 服务...")
-            with sftp.file('/etc/systemd/system/opspro-agent.service', 'w') as f:
-                f.write(SYSTEMD_SERVICE)
-            sftp.close()
+            # Step 3: Write the per-host configuration
+            print("写入 Agent 配置...")
+            self._write_config()
             
-            # Step 6: Install dependencies (optional)
-            print("尝试安装依赖 (可选)...")
-            try:
-                # 尝试安装，但忽略错误
-                install_cmd = "python3 -m pip install --no-index --find-links /opt/opspro/wheels psutil requests 2>/dev/null || python3 -m pip install psutil requests"
-                self.execute(install_cmd)
-            except Exception as e:
-                print(f"依赖安装失败，Agent 将尝试以原生模式运行: {e}")
+            # Step 4: Install dependencies and the service (optional for the wheels)
+            self._step("install")
+            if fresh:
+                print("安装依赖与 systemd 服务...")
+                self._run(f"install -m 644 {AGENT_DIR}/opspro-agent.service /etc/systemd/system/opspro-agent.service")
+                # 依赖安装失败时 Agent 以原生模式运行; 不写入标记, 下次部署重新安装
+                try:
+                    self._run(
+                        f"{{ python3 -m pip install --no-index --find-links {AGENT_DIR}/wheels {' '.join(AGENT_PACKAGES)} 2>/dev/null"
+                        f" || python3 -m pip install {' '.join(AGENT_PACKAGES)}; }}"
+                        f" && echo {bundle.sha256} > {BUNDLE_MARKER}"
+                    )
+                except RuntimeError as e:
+                    print(f"⚠ 依赖安装失败, Agent 将以原生模式运行: {e}")
             
-            # Step 7: Enable and start service
+            # Step 5: Enable and start service
+            self._step("start")
             print("启动 Agent 服务...")
-            self.execute("systemctl daemon-reload")
-            self.execute("systemctl enable opspro-agent")
-            self.execute("systemctl restart opspro-agent")
+            self.execute("systemctl daemon-reload; systemctl enable opspro-agent; systemctl restart opspro-agent")
             
             # Verify service is running
+            self._step("verify")
             time.sleep(2)  # Wait for service to start
             status = self.execute("systemctl is-active opspro-agent")
             if status == "active":
@@ -361,10 +378,12 @@ class AgentDeployer:
                 # 查看日志
                 logs = self.execute("journalctl -u opspro-agent -n 20 --no-pager")
                 print(f"服务日志:\n{logs}")
+                self.error = f"Agent service is {status or 'not running'}:\n{logs}"
                 return False
             
         except Exception as e:
             print(f"部署失败: {e}")
+            self.error = str(e)
             import traceback
             traceback.print_exc()
             return False
@@ -372,37 +391,43 @@ class AgentDeployer:
             if self.client:
                 self.client.close()
     
-    def _prepare_offline_packages(self) -> Optional[str]:
-        """
-        Download Python packages as wheels for offline installation
-        Returns: Path to wheels directory
-        """
-        import subprocess
-        import tempfile
-        
-        wheels_dir = os.path.join(tempfile.gettempdir(), "opspro_wheels")
-        os.makedirs(wheels_dir, exist_ok=True)
+    def _pipe(self, command: str, chunks: Iterable[bytes]):
+        """Run command with chunks streamed to its stdin; raises if it fails"""
+        if not self.client:
+            raise RuntimeError("SSH client not connected")
         
-        try:
-            # 下载 psutil 和 requests 及其依赖
-            print(f"  下载依赖到: {wheels_dir}")
-            subprocess.run(
-                ["pip3", "download", "-d", wheels_dir, "psutil", "requests"],
-                check=True,
-                capture_output=True,
-                timeout=60
+        stdin, stdout, stderr = self.client.exec_command(command)
+        for chunk in chunks:
+            stdin.channel.sendall(chunk)
+        stdin.channel.shutdown_write()
+        code = stdout.channel.recv_exit_status()
+        if code != 0:
+            raise RuntimeError(f"'{command}' exited with {code}: {stderr.read().decode('utf-8').strip()}")
+    
+    def _run(self, command: str):
+        """Run command; raises if it exits non-zero"""
+        self._pipe(command, ())
+    
+    def _upload_bundle(self, bundle: AgentBundle):
+        """Unpack the bundle into the agent directory straight from the SSH channel"""
+        with open(bundle.path, "rb") as f:
+            self._pipe(
+                f"mkdir -p {AGENT_DIR} && rm -rf {AGENT_DIR}/wheels && tar -xzf - -C {AGENT_DIR}",
+                iter(lambda: f.read(UPLOAD_CHUNK), b"")
             )
-            print(f"  ✓ 依赖包下载完成")
-            return wheels_dir
-        except subprocess.TimeoutExpired:
-            print("  ⚠ 下载超时，将使用在线安装模式")
-            return None
-        except subprocess.CalledProcessError as e:
-            print(f"  ⚠ 下载失败: {e}，将使用在线安装模式")
-            return None
-        except FileNotFoundError:
-            print("  ⚠ pip3 未找到，将使用在线安装模式")
-            return None
+    
+    def _write_config(self):
+        """Write agent.json (backend URL, resource id, token), readable by root only"""
+        config = json.dumps({
+            "backend_url": self.backend_url,
+            "resource_id": str(self.resource_id),
+            "api_token": self.api_token,
+        })
+        # umask only applies to a new file: chmod tightens one left by an older deploy
+        self._pipe(
+            f"mkdir -p {AGENT_DIR} && umask 077 && cat > {AGENT_DIR}/agent.json && chmod 600 {AGENT_DIR}/agent.json",
+            [config.encode()]
+        )
     
     def uninstall(self) -> bool:
         """
@@ -415,8 +440,10 @@ class AgentDeployer:
         5. Clean up systemd
         """
         try:
+            self._step("connect")
             self.connect()
             
+            self._step("stop")
             print("正在停止 Agent 服务...")
             try:
                 self.execute("systemctl stop opspro-agent")
@@ -431,6 +458,7 @@ class AgentDeployer:
             except Exception as e:
                 print(f"  ⚠ 禁用服务失败: {e}")
             
+            self._step("remove")
             print("正在删除服务配置文件...")
             try:
                 self.execute("rm -f /etc/systemd/system/opspro-agent.service")
@@ -445,6 +473,7 @@ class AgentDeployer:
             except Exception as e:
                 print(f"  ⚠ 删除 Agent 目录失败: {e}")
             
+            self._step("reload")
             print("正在重新加载 systemd...")
             try:
                 self.execute("systemctl daemon-reload")
@@ -457,6 +486,7 @@ class AgentDeployer:
             
         except Exception as e:
             print(f"⚠ 卸载过程中出现错误: {e}")
+            self.error = str(e)
             import traceback
             traceback.print_exc()
             return False
@@ -0,0 +1,209 @@
+"""
+Background agent deploy/uninstall jobs
+The API records a job (an agent_jobs row) and answers 202 right away; the
+Celery worker runs it (app/tasks/agent_jobs.py), so request times do not
+depend on how slow the target host is. Progress is written to the row as
+each step of AgentDeployer begins and is polled with
+GET /automation/agent-jobs/{id}.
+
+SSH credentials and the agent token are kept encrypted in the row rather
+than sent through the broker, and are erased as soon as the worker has read
+them. A job takes its host's SSH lease (ssh_executor.hold_host) for its
+whole run; when the host is busy the task is retried later rather than
+holding a worker slot while it waits. Jobs whose worker died are failed by
+the reap_stale_agent_jobs beat task.
+"""
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from cryptography.fernet import InvalidToken
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.encryption import decrypt_string, encrypt_string
+from app.models.agent_job import AgentJob, AgentJobAction
+from app.models.resource import Resource, ResourceStatus
+from app.models.task import TaskStatus
+from app.services.agent_deployer import AgentDeployer
+from app.services.resource_detector import SSHCredentials
+from app.services.ssh_executor import hold_host
+from app.tasks.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+RUN_TASK = "app.tasks.agent_jobs.run_agent_job"
+
+STEPS = {
+    AgentJobAction.DEPLOY: AgentDeployer.DEPLOY_STEPS,
+    AgentJobAction.UNINSTALL: AgentDeployer.UNINSTALL_STEPS,
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_job(
+    db: Session,
+    action: AgentJobAction,
+    credentials: SSHCredentials,
+    resource_id: Optional[int],
+    created_by: str,
+    api_token: str = "",
+    backend_url: str = "",
+    rollout_id: Optional[int] = None,
+    batch: Optional[int] = None
+) -> AgentJob:
+    """Record a pending job; the caller commits, then calls submit_job (or submits its rollout)"""
+    secrets = {
+        "password": credentials.password,
+        "private_key": credentials.private_key,
+        "api_token": api_token,
+    }
+    job = AgentJob(
+        action=action,
+        resource_id=resource_id,
+        host=credentials.host,
+        rollout_id=rollout_id,
+        batch=batch,
+        status=TaskStatus.PENDING,
+        steps=[{"name": name, "status": TaskStatus.PENDING.value} for name in STEPS[action]],
+        secrets_enc=encrypt_string(json.dumps(secrets)),
+        parameters={"port": credentials.port, "username": credentials.username, "backend_url": backend_url},
+        created_by=created_by
+    )
+    db.add(job)
+    return job
+
+
+def submit_job(db: Session, job: AgentJob) -> AgentJob:
+    """Queue a committed job for the worker; it fails right away if the broker is down"""
+    try:
+        celery_app.send_task(RUN_TASK, args=[job.id])
+    except Exception as e:
+        logger.error(f"Could not queue agent job {job.id}: {e}")
+        finish_job(job, False, f"Could not queue the job: {e}")
+        db.commit()
+    return job
+
+
+def start_step(db: Session, job: AgentJob, name: str):
+    """Close the running step and start `name`"""
+    now = _now()
+    steps = [dict(step) for step in job.steps]
+    for step in steps:
+        if step["status"] == TaskStatus.RUNNING.value:
+            step.update(status=TaskStatus.SUCCESS.value, finished_at=now)
+        if step["name"] == name:
+            step.update(status=TaskStatus.RUNNING.value, started_at=now)
+    # Reassigned so the JSON column is written
+    job.steps = steps
+    job.current_step = name
+    db.commit()
+
+
+def finish_job(job: AgentJob, ok: bool, error: Optional[str] = None):
+    """Close the running step and the job; steps never reached stay pending"""
+    now = _now()
+    steps = [dict(step) for step in job.steps]
+    for step in steps:
+        if step["status"] == TaskStatus.RUNNING.value:
+            step.update(status=(TaskStatus.SUCCESS if ok else TaskStatus.FAILED).value, finished_at=now)
+    job.steps = steps
+    job.status = TaskStatus.SUCCESS if ok else TaskStatus.FAILED
+    job.error = None if ok else error
+    job.secrets_enc = None
+    job.finished_at = datetime.now(timezone.utc)
+
+
+def fail_pending(db: Session, job_id: int, error: str) -> Optional[AgentJob]:
+    """Fail a job that could not be started; a job already picked up is left alone"""
+    job = db.get(AgentJob, job_id)
+    if job is not None and job.status == TaskStatus.PENDING:
+        finish_job(job, False, error)
+        db.commit()
+    return job
+
+
+def reap_stale_jobs(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    Fail RUNNING jobs started more than AGENT_JOB_TIMEOUT_SECONDS ago: their
+    worker died (their credentials are already erased, so they cannot be
+    resumed). Returns how many were failed.
+    """
+    now = now or datetime.now(timezone.utc)
+    stale = db.query(AgentJob).filter(
+        AgentJob.status == TaskStatus.RUNNING,
+        AgentJob.started_at < now - timedelta(seconds=settings.AGENT_JOB_TIMEOUT_SECONDS)
+    ).all()
+    for job in stale:
+        finish_job(job, False, f"Worker lost: no result after {settings.AGENT_JOB_TIMEOUT_SECONDS}s")
+    db.commit()
+    if stale:
+        logger.warning(f"Failed {len(stale)} agent jobs whose worker was lost")
+    return len(stale)
+
+
+def run_job(db: Session, job_id: int, wait: float = 0.0) -> Optional[AgentJob]:
+    """
+    Run a pending job to completion. A job already picked up (redelivered
+    message) or cancelled is left alone.
+
+    Raises SSHBusy, leaving the job pending, when its host stays held by
+    another SSH job for more than `wait` seconds.
+    """
+    job = db.get(AgentJob, job_id)
+    if job is None or job.status != TaskStatus.PENDING:
+        return job
+    host = job.host
+    # No connection is held while waiting for the host or during SSH work:
+    # every database step below commits before the next one starts
+    db.commit()
+
+    with hold_host(host, wait=wait):
+        claimed = db.query(AgentJob).filter(
+            AgentJob.id == job_id, AgentJob.status == TaskStatus.PENDING
+        ).update(
+            {AgentJob.status: TaskStatus.RUNNING, AgentJob.started_at: datetime.now(timezone.utc)},
+            synchronize_session=False
+        )
+        db.commit()
+        db.refresh(job)
+        if not claimed:
+            return job
+
+        try:
+            secrets = json.loads(decrypt_string(job.secrets_enc) or "{}")
+        except (InvalidToken, ValueError):
+            finish_job(job, False, "Job credentials cannot be decrypted (ENCRYPTION_KEY/SECRET_KEY differ from the API)")
+            db.commit()
+            return job
+        job.secrets_enc = None
+        db.commit()
+
+        parameters = job.parameters or {}
+        deployer = AgentDeployer(
+            SSHCredentials(
+                host=job.host,
+                port=parameters.get("port", 22),
+                username=parameters.get("username", "root"),
+                password=secrets.get("password"),
+                private_key=secrets.get("private_key")
+            ),
+            resource_id=job.resource_id or 0,
+            api_token=secrets.get("api_token", ""),
+            backend_url=parameters.get("backend_url", ""),
+            on_step=lambda name: start_step(db, job, name)
+        )
+        deploy = job.action == AgentJobAction.DEPLOY
+        db.commit()
+        ok = deployer.deploy() if deploy else deployer.uninstall()
+
+    finish_job(job, ok, deployer.error or f"Agent {job.action.value} failed")
+    if ok and deploy and job.resource_id:
+        resource = db.get(Resource, job.resource_id)
+        if resource is not None:
+            resource.status = ResourceStatus.ACTIVE
+    db.commit()
+    logger.info(f"Agent job {job.id} ({job.action.value} on {job.host}) finished: {job.status.value}")
+    return job
@@ -0,0 +1,345 @@
+"""
+Fleet-wide agent rollouts
+A rollout deploys the agent to every resource matched by a selector. The API
+resolves the selector, records one agent job per host (in its batch) and
+answers 202; the Celery worker then runs the batches in order
+(run_agent_rollout), each on a pool of `parallelism` threads, so a single
+worker deploys to many hosts at once.
+
+  - With canary_size > 0 the first batch is a canary: any failure in it
+    stops the rollout.
+  - After every batch, the rollout stops when failed hosts exceed
+    max_failure_rate of the finished ones.
+  - A rollout can be cancelled; jobs already running finish, pending ones
+    are cancelled.
+
+A stopped rollout cancels its remaining jobs and ends FAILED, as does one
+whose worker was killed (reap_stale_rollouts). The report
+(GET /automation/rollouts/{id}) is aggregated from the jobs.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from cryptography.fernet import InvalidToken
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.encryption import decrypt_string
+from app.models.agent_job import AgentJob, AgentJobAction, AgentRollout
+from app.models.resource import Resource
+from app.models.task import TaskStatus
+from app.schemas.agent_job import RolloutCreate, RolloutSelector
+from app.services.agent_jobs import create_job, fail_pending, run_job
+from app.services.resource_detector import SSHCredentials
+from app.services.ssh_executor import SSHBusy
+from app.tasks.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+RUN_TASK = "app.tasks.agent_jobs.run_agent_rollout"
+
+# Failed hosts listed in a report
+REPORT_FAILURES = 100
+
+
+def select_resources(db: Session, selector: RolloutSelector) -> List[Resource]:
+    """Resources matching the selector, by id"""
+    query = db.query(Resource)
+    if selector.resource_ids is not None:
+        query = query.filter(Resource.id.in_(selector.resource_ids))
+    if selector.type is not None:
+        query = query.filter(Resource.type == selector.type)
+    if selector.status is not None:
+        query = query.filter(Resource.status.in_(selector.status))
+    resources = query.order_by(Resource.id).all()
+
+    # Tags and labels are plain JSON columns: matched here
+    if selector.tags:
+        resources = [r for r in resources if set(selector.tags) <= set(r.tags or ())]
+    if selector.labels:
+        resources = [
+            r for r in resources
+            if all((r.labels or {}).get(key) == value for key, value in selector.labels.items())
+        ]
+    return resources
+
+
+def plan_batches(hosts: int, canary_size: int, batch_size: int) -> List[int]:
+    """Batch sizes: the canary batch (if any), then batches of batch_size"""
+    sizes = []
+    if canary_size and hosts:
+        sizes.append(min(canary_size, hosts))
+        hosts -= sizes[0]
+    while hosts > 0:
+        sizes.append(min(batch_size, hosts))
+        hosts -= sizes[-1]
+    return sizes
+
+
+def host_credentials(resource: Resource, request: RolloutCreate) -> Tuple[Optional[SSHCredentials], Optional[str]]:
+    """SSH credentials of a host (the request's, else the resource's), or why there are none"""
+    if not resource.ip_address:
+        return None, "No IP address"
+    password, private_key = request.ssh_password, request.ssh_private_key
+    if not password and not private_key:
+        try:
+            password = decrypt_string(resource.ssh_password_enc)
+            private_key = decrypt_string(resource.ssh_private_key_enc)
+        except InvalidToken:
+            return None, "Stored SSH credentials cannot be decrypted"
+    if not password and not private_key:
+        return None, "No SSH credentials"
+    return SSHCredentials(
+        host=resource.ip_address,
+        port=request.ssh_port or resource.ssh_port or 22,
+        username=request.ssh_username or resource.ssh_username or "root",
+        password=password,
+        private_key=private_key
+    ), None
+
+
+def create_rollout(
+    db: Session,
+    request: RolloutCreate,
+    created_by: str,
+    api_token: str,
+    backend_url: str
+) -> AgentRollout:
+    """Record a rollout and the pending jobs of its hosts; the caller commits, then submits it"""
+    hosts, skipped = [], []
+    for resource in select_resources(db, request.selector):
+        credentials, reason = host_credentials(resource, request)
+        if credentials is None:
+            skipped.append({"resource_id": resource.id, "name": resource.name, "reason": reason})
+        else:
+            hosts.append((resource, credentials))
+
+    sizes = plan_batches(len(hosts), request.canary_size, request.batch_size)
+    rollout = AgentRollout(
+        status=TaskStatus.PENDING,
+        selector=request.selector.model_dump(mode="json", exclude_none=True),
+        parallelism=request.parallelism,
+        canary_size=min(request.canary_size, len(hosts)),
+        batch_size=request.batch_size,
+        max_failure_rate=request.max_failure_rate,
+        total_hosts=len(hosts),
+        batches=len(sizes),
+        skipped=skipped,
+        created_by=created_by
+    )
+    db.add(rollout)
+    db.flush()
+
+    position = 0
+    for batch, size in enumerate(sizes):
+        for resource, credentials in hosts[position:position + size]:
+            create_job(
+                db, AgentJobAction.DEPLOY, credentials, resource.id, created_by,
+                api_token=api_token, backend_url=backend_url, rollout_id=rollout.id, batch=batch
+            )
+        position += size
+    return rollout
+
+
+def _cancel_pending(db: Session, rollout_id: int) -> int:
+    return db.query(AgentJob).filter(
+        AgentJob.rollout_id == rollout_id, AgentJob.status == TaskStatus.PENDING
+    ).update(
+        {
+            AgentJob.status: TaskStatus.CANCELLED,
+            AgentJob.secrets_enc: None,
+            AgentJob.finished_at: datetime.now(timezone.utc),
+        },
+        synchronize_session=False
+    )
+
+
+def end_rollout(db: Session, rollout: AgentRollout, status: TaskStatus, reason: Optional[str] = None):
+    """Close the rollout, cancelling the jobs it has not started"""
+    _cancel_pending(db, rollout.id)
+    rollout.status = status
+    rollout.stop_reason = reason
+    rollout.finished_at = datetime.now(timezone.utc)
+    db.commit()
+
+
+def submit_rollout(db: Session, rollout: AgentRollout) -> AgentRollout:
+    """Queue a committed rollout for the worker; it fails right away if the broker is down"""
+    try:
+        celery_app.send_task(RUN_TASK, args=[rollout.id])
+    except Exception as e:
+        logger.error(f"Could not queue agent rollout {rollout.id}: {e}")
+        end_rollout(db, rollout, TaskStatus.FAILED, f"Could not queue the rollout: {e}")
+    return rollout
+
+
+def cancel_rollout(db: Session, rollout: AgentRollout) -> AgentRollout:
+    """Stop a rollout: running jobs finish, pending ones are cancelled"""
+    if rollout.status in (TaskStatus.PENDING, TaskStatus.RUNNING):
+        end_rollout(db, rollout, TaskStatus.CANCELLED, "Cancelled")
+    return rollout
+
+
+def job_counts(db: Session, rollout_id: int) -> Dict[int, Dict[str, int]]:
+    """Jobs per status, per batch"""
+    rows = db.query(AgentJob.batch, AgentJob.status, func.count()).filter(
+        AgentJob.rollout_id == rollout_id
+    ).group_by(AgentJob.batch, AgentJob.status).all()
+    counts: Dict[int, Dict[str, int]] = {}
+    for batch, status, n in rows:
+        counts.setdefault(batch, {})[status.value] = n
+    return counts
+
+
+def _totals(counts: Dict[int, Dict[str, int]]) -> Dict[str, int]:
+    totals = {status.value: 0 for status in TaskStatus}
+    for batch in counts.values():
+        for status, n in batch.items():
+            totals[status] += n
+    return totals
+
+
+def failure_rate(totals: Dict[str, int]) -> float:
+    finished = totals[TaskStatus.SUCCESS.value] + totals[TaskStatus.FAILED.value]
+    return totals[TaskStatus.FAILED.value] / finished if finished else 0.0
+
+
+def reap_stale_rollouts(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    Fail RUNNING rollouts older than their time limit: their worker was
+    killed before it could close them. Returns how many were failed.
+    """
+    now = now or datetime.now(timezone.utc)
+    stale = db.query(AgentRollout).filter(
+        AgentRollout.status == TaskStatus.RUNNING,
+        AgentRollout.started_at < now - timedelta(seconds=settings.ROLLOUT_TIME_LIMIT_SECONDS + 60)
+    ).all()
+    for rollout in stale:
+        end_rollout(db, rollout, TaskStatus.FAILED, "Worker lost before the rollout finished")
+    return len(stale)
+
+
+def _run_one(session_factory: Callable[[], Session], rollout_id: int, job_id: int):
+    db = session_factory()
+    try:
+        # Skip the job once the rollout was cancelled or stopped
+        if db.query(AgentRollout.status).filter(AgentRollout.id == rollout_id).scalar() != TaskStatus.RUNNING:
+            return
+        # Waiting for a busy host holds a rollout thread, not a worker slot
+        run_job(db, job_id, wait=settings.SSH_HOST_WAIT_SECONDS)
+    except SSHBusy as e:
+        db.rollback()
+        fail_pending(db, job_id, str(e))
+    except Exception as e:
+        logger.error(f"Agent job {job_id} of rollout {rollout_id} crashed: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def run_rollout(db: Session, rollout_id: int, session_factory: Callable[[], Session]) -> Optional[AgentRollout]:
+    """Run the batches of a pending rollout in order, stopping on failures"""
+    claimed = db.query(AgentRollout).filter(
+        AgentRollout.id == rollout_id, AgentRollout.status == TaskStatus.PENDING
+    ).update(
+        {AgentRollout.status: TaskStatus.RUNNING, AgentRollout.started_at: datetime.now(timezone.utc)},
+        synchronize_session=False
+    )
+    db.commit()
+    rollout = db.get(AgentRollout, rollout_id)
+    if not claimed:
+        return rollout
+
+    # Jobs check out a database connection only for each of their short
+    # transactions, never while waiting for a host or running SSH, so the
+    # threads are not bounded by the connection pool
+    pool = ThreadPoolExecutor(max_workers=rollout.parallelism, thread_name_prefix="rollout")
+    try:
+        for batch in range(rollout.batches):
+            db.refresh(rollout)
+            if rollout.status != TaskStatus.RUNNING:
+                # Cancelled meanwhile
+                return rollout
+            rollout.current_batch = batch
+            db.commit()
+
+            job_ids = [
+                job_id for (job_id,) in db.query(AgentJob.id).filter(
+                    AgentJob.rollout_id == rollout_id,
+                    AgentJob.batch == batch,
+                    AgentJob.status == TaskStatus.PENDING
+                ).order_by(AgentJob.id)
+            ]
+            # Release the orchestrator's connection while the batch runs
+            db.commit()
+            list(pool.map(lambda job_id: _run_one(session_factory, rollout_id, job_id), job_ids))
+            db.refresh(rollout)
+            if rollout.status != TaskStatus.RUNNING:
+                return rollout
+
+            counts = job_counts(db, rollout_id)
+            totals = _totals(counts)
+            failed = counts.get(batch, {}).get(TaskStatus.FAILED.value, 0)
+            if batch == 0 and rollout.canary_size and failed:
+                end_rollout(db, rollout, TaskStatus.FAILED, f"Canary batch failed on {failed} of {len(job_ids)} hosts")
+                return rollout
+            rate = failure_rate(totals)
+            if rate > rollout.max_failure_rate:
+                end_rollout(
+                    db, rollout, TaskStatus.FAILED,
+                    f"Failure rate {rate:.0%} above the {rollout.max_failure_rate:.0%} limit after batch {batch}"
+                )
+                return rollout
+    finally:
+        # Also on the soft time limit: return at once instead of waiting
+        # for the batch in flight (its jobs run on in their threads)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    db.refresh(rollout)
+    if rollout.status == TaskStatus.RUNNING:
+        end_rollout(db, rollout, TaskStatus.SUCCESS)
+    return rollout
+
+
+def rollout_report(db: Session, rollout: AgentRollout) -> Dict:
+    """The rollout with job counts per batch, its failure rate, throughput and failed hosts"""
+    counts = job_counts(db, rollout.id)
+    totals = _totals(counts)
+
+    hosts_per_minute = None
+    if rollout.started_at:
+        end = rollout.finished_at or datetime.now(timezone.utc)
+        started = rollout.started_at
+        if started.tzinfo is None:
+            started = started.replace(tzinfo=timezone.utc)
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=timezone.utc)
+        minutes = (end - started).total_seconds() / 60
+        done = totals[TaskStatus.SUCCESS.value] + totals[TaskStatus.FAILED.value]
+        if minutes > 0:
+            hosts_per_minute = round(done / minutes, 1)
+
+    failures = db.query(AgentJob).filter(
+        AgentJob.rollout_id == rollout.id, AgentJob.status == TaskStatus.FAILED
+    ).order_by(AgentJob.id).limit(REPORT_FAILURES).all()
+
+    return {
+        **{column.name: getattr(rollout, column.name) for column in AgentRollout.__table__.columns},
+        "counts": totals,
+        "failure_rate": round(failure_rate(totals), 4),
+        "hosts_per_minute": hosts_per_minute,
+        "batch_reports": [
+            {"batch": batch, "hosts": sum(batch_counts.values()), "counts": batch_counts}
+            for batch, batch_counts in sorted(counts.items(), key=lambda item: item[0])
+        ],
+        "failures": [
+            {
+                "job_id": job.id,
+                "resource_id": job.resource_id,
+                "host": job.host,
+                "step": job.current_step,
+                "error": job.error,
+            }
+            for job in failures
+        ],
+    }
@@ -0,0 +1,342 @@
+"""
+Rule-driven alert evaluation
+Enabled AlertRules are kept in memory, indexed by metric. Every sample is
+checked against the rules for its metrics; a rule fires once its condition
+has held for `duration` seconds and resolves on the first sample that no
+longer matches. The database is only written on those transitions, plus a
+throttled refresh of still-firing alerts.
+
+Each alert has a fingerprint (rule, resource, labels). A unique partial index
+allows one open alert per fingerprint, and firing is an upsert on it, so
+repeated or concurrent evaluations bump `occurrences` instead of adding rows.
+"""
+import hashlib
+import logging
+import operator
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.alert import Alert, AlertRule, AlertSeverity, AlertStatus, OPEN_ALERT_PREDICATE
+from app.services.stats import ALERTS, counter_field, record
+
+logger = logging.getLogger(__name__)
+
+CONDITIONS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+OPEN_STATUSES = (AlertStatus.FIRING, AlertStatus.ACKNOWLEDGED)
+
+# Sample fields rules can refer to
+SAMPLE_METRICS = ("cpu_usage", "memory_usage", "disk_usage", "network_in", "network_out")
+
+# Seconds since the resource last reported. Every sample carries 0 (which
+# resolves heartbeat alerts); the stale-resource reaper submits the real age.
+HEARTBEAT_METRIC = "heartbeat_age"
+
+FIRING = "firing"
+REFRESH = "refresh"
+RESOLVED = "resolved"
+
+
+class CompiledRule(NamedTuple):
+    """In-memory copy of an enabled AlertRule"""
+    id: int
+    name: str
+    metric: str
+    condition: str
+    threshold: float
+    duration: int
+    severity: AlertSeverity
+    check: Callable[[float, float], bool]
+
+
+class RuleState:
+    """Evaluation state of one (rule, resource) pair"""
+    __slots__ = ("pending_since", "firing", "hits", "flushed_at")
+
+    def __init__(self, pending_since: Optional[datetime] = None, firing: bool = False):
+        self.pending_since = pending_since
+        self.firing = firing
+        # Breaching evaluations not yet added to the alert's occurrences
+        self.hits = 0
+        self.flushed_at: Optional[datetime] = None
+
+
+class Transition(NamedTuple):
+    """A state change that has to be persisted"""
+    kind: str  # firing, refresh or resolved
+    rule: CompiledRule
+    resource_id: int
+    resource_name: str
+    value: float
+    timestamp: datetime
+    count: int = 0  # breaching evaluations to add to occurrences
+
+
+def compile_rule(rule: AlertRule) -> Optional[CompiledRule]:
+    check = CONDITIONS.get(rule.condition)
+    if check is None:
+        logger.warning(f"Alert rule {rule.name!r} has unknown condition {rule.condition!r}, skipped")
+        return None
+    return CompiledRule(
+        id=rule.id,
+        name=rule.name,
+        metric=rule.metric,
+        condition=rule.condition,
+        threshold=rule.threshold,
+        duration=rule.duration or 0,
+        severity=rule.severity or AlertSeverity.WARNING,
+        check=check
+    )
+
+
+class AlertEngine:
+    """
+    In-memory alert evaluator.
+
+    Rules and the set of open alerts are (re)loaded from the database every
+    `refresh_interval` seconds, or right away after `invalidate()`. Pending
+    state only lives in memory.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = settings.ALERT_RULES_REFRESH_SECONDS,
+        alert_refresh: float = settings.ALERT_REFRESH_SECONDS
+    ):
+        self.refresh_interval = refresh_interval
+        self.alert_refresh = alert_refresh
+        self._lock = threading.Lock()
+        self._rules_by_metric: Dict[str, List[CompiledRule]] = {}
+        self._states: Dict[Tuple[int, int], RuleState] = {}
+        self._loaded_at: Optional[float] = None
+
+    @property
+    def rules(self) -> List[CompiledRule]:
+        return [rule for rules in self._rules_by_metric.values() for rule in rules]
+
+    def invalidate(self):
+        """Force a reload before the next evaluation (e.g. after a rule change)"""
+        self._loaded_at = None
+
+    def ensure_loaded(self, db: Session):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= self.refresh_interval:
+            self.load(db)
+
+    def load(self, db: Session):
+        """Rebuild the rule index and the firing state from the database"""
+        rules = db.query(AlertRule).filter(AlertRule.enabled.is_(True)).all()
+        open_alerts = db.query(Alert.rule_id, Alert.resource_id).filter(
+            Alert.status.in_(OPEN_STATUSES),
+            Alert.resource_id.isnot(None)
+        ).all()
+        self.set_rules([compile_rule(rule) for rule in rules], open_alerts)
+
+    def set_rules(self, rules: Iterable[Optional[CompiledRule]], open_alerts: Iterable[Tuple[int, int]] = ()):
+        by_metric: Dict[str, List[CompiledRule]] = {}
+        for rule in rules:
+            if rule is not None:
+                by_metric.setdefault(rule.metric, []).append(rule)
+        rule_ids = {rule.id for rules in by_metric.values() for rule in rules}
+        firing = {(rule_id, resource_id) for rule_id, resource_id in open_alerts if rule_id in rule_ids}
+
+        with self._lock:
+            # Keep pending timers of rules that still exist; firing comes from the DB
+            states = {}
+            for key, state in self._states.items():
+                if key[0] not in rule_ids:
+                    continue
+                if key in firing and state.firing:
+                    states[key] = state
+                elif state.pending_since is not None:
+                    states[key] = RuleState(state.pending_since)
+            for key in firing:
+                states.setdefault(key, RuleState()).firing = True
+            self._rules_by_metric = by_metric
+            self._states = states
+            self._loaded_at = time.monotonic()
+
+    def evaluate(
+        self,
+        resource_id: int,
+        values: Dict[str, Optional[float]],
+        timestamp: datetime,
+        resource_name: str = ""
+    ) -> List[Transition]:
+        """Check one sample against every rule of its metrics"""
+        transitions = []
+        with self._lock:
+            for metric, value in values.items():
+                if value is None:
+                    continue
+                for rule in self._rules_by_metric.get(metric, ()):
+                    key = (rule.id, resource_id)
+                    state = self._states.get(key)
+
+                    if rule.check(value, rule.threshold):
+                        if state is None:
+                            state = self._states[key] = RuleState()
+                        if state.firing:
+                            state.hits += 1
+                            if (state.flushed_at is None
+                                    or (timestamp - state.flushed_at).total_seconds() >= self.alert_refresh):
+                                transitions.append(Transition(
+                                    REFRESH, rule, resource_id, resource_name, value, timestamp, state.hits
+                                ))
+                                state.hits = 0
+                                state.flushed_at = timestamp
+                            continue
+                        if state.pending_since is None or state.pending_since > timestamp:
+                            state.pending_since = timestamp
+                        if (timestamp - state.pending_since).total_seconds() >= rule.duration:
+                            state.firing = True
+                            state.pending_since = None
+                            state.flushed_at = timestamp
+                            transitions.append(
+                                Transition(FIRING, rule, resource_id, resource_name, value, timestamp, 1)
+                            )
+                    elif state is not None:
+                        del self._states[key]
+                        if state.firing:
+                            transitions.append(Transition(
+                                RESOLVED, rule, resource_id, resource_name, value, timestamp, state.hits
+                            ))
+        return transitions
+
+
+def metric_values(metrics) -> Dict[str, Optional[float]]:
+    """Rule-addressable values of a ResourceMetrics sample"""
+    values = {name: getattr(metrics, name, None) for name in SAMPLE_METRICS}
+    values[HEARTBEAT_METRIC] = 0.0
+    return values
+
+
+def alert_fingerprint(rule_id: int, resource_id: Optional[int], labels: Optional[Dict[str, str]] = None) -> str:
+    """
+    Identity of an alert instance. Mirrored in SQL by the add_alert_fingerprint
+    migration, so keep the format in sync.
+    """
+    label_set = ",".join(f"{k}={v}" for k, v in sorted((labels or {}).items()))
+    raw = f"{rule_id}:{'' if resource_id is None else resource_id}:{label_set}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def rule_labels(rule: CompiledRule) -> Dict[str, str]:
+    # Only immutable rule attributes, so renaming a rule keeps the fingerprint
+    return {"metric": rule.metric}
+
+
+def _as_utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts
+
+
+def _upsert_open_alert(db: Session, t: Transition):
+    """Insert the firing alert, or fold it into the open one with the same fingerprint"""
+    rule = t.rule
+    labels = rule_labels(rule)
+    seen_at = _as_utc(t.timestamp)
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(Alert).values(
+        rule_id=rule.id,
+        resource_id=t.resource_id,
+        status=AlertStatus.FIRING,
+        severity=rule.severity,
+        message=f"{rule.name} on {t.resource_name or t.resource_id}: "
+                f"{rule.metric} {t.value:.1f} {rule.condition} {rule.threshold:g}",
+        current_value=t.value,
+        threshold_value=rule.threshold,
+        fingerprint=alert_fingerprint(rule.id, t.resource_id, labels),
+        occurrences=t.count,
+        last_seen_at=seen_at,
+        labels=labels,
+        annotations={},
+        fired_at=seen_at
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Alert.fingerprint],
+        index_where=text(OPEN_ALERT_PREDICATE),
+        set_={
+            "current_value": stmt.excluded.current_value,
+            "last_seen_at": stmt.excluded.last_seen_at,
+            "occurrences": Alert.occurrences + stmt.excluded.occurrences,
+        }
+    ).returning(Alert.occurrences)
+    # Folded into an open alert iff occurrences grew past this transition's own
+    if db.execute(stmt).scalar() == t.count:
+        record(db, ALERTS, added=[counter_field(AlertStatus.FIRING, rule.severity)])
+
+
+def apply_transitions(db: Session, transitions: List[Transition]):
+    """Persist transitions (caller commits)"""
+    for t in transitions:
+        if t.kind == FIRING:
+            _upsert_open_alert(db, t)
+            continue
+
+        values = {
+            Alert.current_value: t.value,
+            Alert.occurrences: Alert.occurrences + t.count,
+        }
+        open_alert = db.query(Alert).filter(
+            Alert.fingerprint == alert_fingerprint(t.rule.id, t.resource_id, rule_labels(t.rule)),
+            Alert.status.in_(OPEN_STATUSES)
+        )
+        if t.kind == RESOLVED:
+            values[Alert.status] = AlertStatus.RESOLVED
+            values[Alert.resolved_at] = _as_utc(t.timestamp)
+            # The stats counters need the status being left (firing or acknowledged)
+            resolved = open_alert.with_entities(Alert.status, Alert.severity).all()
+            record(
+                db, ALERTS,
+                added=[counter_field(AlertStatus.RESOLVED, severity) for _, severity in resolved],
+                removed=[counter_field(status, severity) for status, severity in resolved]
+            )
+        else:
+            values[Alert.last_seen_at] = _as_utc(t.timestamp)
+
+        open_alert.update(values, synchronize_session=False)
+
+
+def evaluate_samples(
+    db: Session,
+    samples: Iterable[Tuple[int, str, Dict[str, Optional[float]], datetime]],
+    engine: Optional[AlertEngine] = None
+) -> List[Transition]:
+    """
+    Evaluate (resource_id, resource_name, values, timestamp) samples in time
+    order and persist the resulting transitions in one commit.
+    """
+    engine = engine or alert_engine
+    engine.ensure_loaded(db)
+
+    transitions = []
+    for resource_id, resource_name, values, timestamp in sorted(samples, key=lambda s: s[3]):
+        transitions += engine.evaluate(resource_id, values, timestamp, resource_name)
+
+    if transitions:
+        try:
+            apply_transitions(db, transitions)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            # In-memory state is ahead of the DB now; resync on the next sample
+            engine.invalidate()
+            logger.error(f"Failed to persist {len(transitions)} alert transitions: {e}")
+            return []
+    return transitions
+
+
+alert_engine = AlertEngine()
@@ -0,0 +1,109 @@
+"""
+Alert sample stream
+Accepted samples are published to Redis Streams and evaluated by the alert
+worker (app/tasks/alert_worker.py), keeping rule evaluation off the ingest
+request path. Streams are sharded by resource id so that a resource's samples
+always land on the same stream and are evaluated in order.
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from redis.exceptions import RedisError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.redis import async_redis_client, redis_client
+from app.services.alert_engine import evaluate_samples
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = "opspro:alerts:samples"
+CONSUMER_GROUP = "alert-evaluators"
+
+# (resource_id, resource_name, values, timestamp), as taken by evaluate_samples
+AlertSample = Tuple[int, str, Dict[str, Optional[float]], datetime]
+
+
+def shard_for(resource_id: int, shards: Optional[int] = None) -> int:
+    return resource_id % (shards or settings.ALERT_STREAM_SHARDS)
+
+
+def stream_key(shard: int) -> str:
+    return f"{STREAM_PREFIX}:{shard}"
+
+
+def encode_sample(sample: AlertSample) -> Dict[str, str]:
+    resource_id, resource_name, values, timestamp = sample
+    return {
+        "r": str(resource_id),
+        "n": resource_name or "",
+        "t": timestamp.isoformat(),
+        "v": json.dumps(values, separators=(",", ":")),
+    }
+
+
+def decode_sample(fields: Dict[str, str]) -> AlertSample:
+    return (
+        int(fields["r"]),
+        fields.get("n", ""),
+        json.loads(fields["v"]),
+        datetime.fromisoformat(fields["t"]),
+    )
+
+
+def _add_to_streams(pipe, samples: List[AlertSample]):
+    for sample in samples:
+        pipe.xadd(
+            stream_key(shard_for(sample[0])),
+            encode_sample(sample),
+            maxlen=settings.ALERT_STREAM_MAXLEN,
+            approximate=True
+        )
+
+
+async def publish_samples(samples: List[AlertSample]):
+    """XADD every sample to its shard stream in one round trip"""
+    async with async_redis_client.pipeline(transaction=False) as pipe:
+        _add_to_streams(pipe, samples)
+        await pipe.execute()
+
+
+async def submit_samples(db: Union[Session, AsyncSession], samples: Iterable[AlertSample]):
+    """
+    Hand samples to the alert worker. When streaming is disabled or Redis is
+    unavailable they are evaluated inline instead, so alerts are never skipped.
+    """
+    samples = list(samples)
+    if not samples:
+        return
+
+    if settings.ALERT_STREAM_ENABLED:
+        try:
+            await publish_samples(samples)
+            return
+        except RedisError as e:
+            logger.warning(f"Alert stream unavailable, evaluating {len(samples)} samples inline: {e}")
+
+    if isinstance(db, AsyncSession):
+        await db.run_sync(evaluate_samples, samples)
+    else:
+        evaluate_samples(db, samples)
+
+
+def submit_samples_sync(db: Session, samples: Iterable[AlertSample]):
+    """submit_samples for sync callers (celery tasks)"""
+    samples = list(samples)
+    if not samples:
+        return
+
+    if settings.ALERT_STREAM_ENABLED:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            _add_to_streams(pipe, samples)
+            pipe.execute()
+            return
+        except RedisError as e:
+            logger.warning(f"Alert stream unavailable, evaluating {len(samples)} samples inline: {e}")
+
+    evaluate_samples(db, samples)
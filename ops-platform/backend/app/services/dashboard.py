@@ -0,0 +1,134 @@
+"""
+Monitoring dashboard aggregation
+The dashboard is composed from a handful of PromQL instant queries, run
+concurrently over the shared Prometheus client. The composed payload is
+cached for DASHBOARD_CACHE_TTL_SECONDS and shared by every tab and worker
+(app/core/cache.py). While Prometheus is unavailable the dashboard is built
+from the resources table and the live state cache instead.
+"""
+import asyncio
+import logging
+from typing import Any, Dict, List
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import cache_key, cached
+from app.core.config import settings
+from app.models.resource import Resource, ResourceStatus
+from app.services.prometheus import prometheus
+from app.services.resource_state import overlay_live_state
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_QUERIES = {
+    "total_online": "count(opspro_cpu_usage_percent)",
+    "avg_cpu": "avg(opspro_cpu_usage_percent)",
+    "avg_mem": "avg(opspro_memory_usage_percent)",
+    "total_net_in": "sum(opspro_network_in_mb)",
+    "total_net_out": "sum(opspro_network_out_mb)",
+    "top_cpu": "topk(5, opspro_cpu_usage_percent)",
+    "all_nodes": "opspro_cpu_usage_percent"
+}
+
+
+async def instant_query(query: str) -> List[Dict[str, Any]]:
+    """Result vector of an instant query (empty if the query failed)"""
+    data = await prometheus.get("query", {"query": query})
+    if data["status"] == "success" and data["data"]["result"]:
+        return data["data"]["result"]
+    return []
+
+
+def _scalar(results: Dict[str, List], key: str, default: float = 0.0) -> float:
+    if results.get(key):
+        return float(results[key][0]["value"][1])
+    return default
+
+
+def compose_dashboard(results: Dict[str, List], total_resources: int) -> Dict[str, Any]:
+    """Dashboard payload from the query results"""
+    # All nodes, for the heatmap
+    all_resources_status = []
+    for item in results.get("all_nodes", ()):
+        metric = item["metric"]
+        cpu_val = float(item["value"][1])
+
+        status = "normal"
+        if cpu_val > 80: status = "critical"
+        elif cpu_val > 50: status = "warning"
+
+        all_resources_status.append({
+            "id": metric.get("resource_id", "0"),
+            "name": metric.get("resource_name", "Unknown"),
+            "ip": metric.get("ip_address", ""),
+            "cpu": round(cpu_val, 1),
+            "status": status
+        })
+
+    top_cpu_resources = []
+    for item in results.get("top_cpu", ()):
+        metric = item["metric"]
+        top_cpu_resources.append({
+            "id": metric.get("resource_id", "0"),
+            "name": metric.get("resource_name", "Unknown"),
+            "cpu_usage": round(float(item["value"][1]), 1),
+            # Memory usage is tricky to map without a join, we skip it for now or query separately
+            "memory_usage": 0
+        })
+    # topk output order is not guaranteed
+    top_cpu_resources.sort(key=lambda x: x["cpu_usage"], reverse=True)
+
+    return {
+        "total_resources": total_resources,
+        "online_resources": int(_scalar(results, "total_online")),
+        "average_cpu_usage": round(_scalar(results, "avg_cpu"), 1),
+        "average_memory_usage": round(_scalar(results, "avg_mem"), 1),
+        "total_network_traffic": round(_scalar(results, "total_net_in") + _scalar(results, "total_net_out"), 1),
+        "top_cpu_resources": top_cpu_resources,
+        "all_resources_status": all_resources_status
+    }
+
+
+async def build_dashboard(db: AsyncSession) -> Dict[str, Any]:
+    """Run the dashboard queries concurrently and compose the payload"""
+    vectors = await asyncio.gather(*(instant_query(q) for q in DASHBOARD_QUERIES.values()))
+    results = dict(zip(DASHBOARD_QUERIES, vectors))
+    # Database total count (including offline)
+    total = await db.scalar(select(func.count()).select_from(Resource))
+    return compose_dashboard(results, total)
+
+
+async def get_dashboard(db: AsyncSession) -> Dict[str, Any]:
+    """The shared, briefly cached dashboard payload"""
+    return await cached(
+        "dashboard", cache_key("dashboard"), settings.DASHBOARD_CACHE_TTL_SECONDS,
+        lambda: build_dashboard(db)
+    )
+
+
+async def fallback_dashboard(db: AsyncSession, error: Exception) -> Dict[str, Any]:
+    """Dashboard from the database, for when Prometheus cannot be queried"""
+    resources = await overlay_live_state((await db.scalars(select(Resource))).all())
+    online = [r for r in resources if r.status == ResourceStatus.ACTIVE]
+
+    def average(name: str) -> float:
+        values = [getattr(r, name) or 0.0 for r in online]
+        return round(sum(values) / len(values), 1) if values else 0.0
+
+    top_cpu = sorted(online, key=lambda r: r.cpu_usage or 0.0, reverse=True)[:5]
+    return {
+        "total_resources": len(resources),
+        "online_resources": len(online),
+        "average_cpu_usage": average("cpu_usage"),
+        "average_memory_usage": average("memory_usage"),
+        "top_cpu_resources": [
+            {
+                "id": str(r.id),
+                "name": r.name,
+                "cpu_usage": round(r.cpu_usage or 0.0, 1),
+                "memory_usage": round(r.memory_usage or 0.0, 1)
+            }
+            for r in top_cpu
+        ],
+        "source": "database",
+        "error": str(error)
+    }
@@ -0,0 +1,58 @@
+"""
+Downsampling helpers for time-series responses
+"""
+import math
+from typing import List, Sequence
+
+
+def bucket_width(window_seconds: float, max_points: int, step_seconds: int) -> int:
+    """
+    Smallest bucket width (a multiple of the source step) that fits the
+    window into at most `max_points` buckets.
+    """
+    width = math.ceil(window_seconds / max_points)
+    return max(step_seconds, math.ceil(width / step_seconds) * step_seconds)
+
+
+def lttb_indices(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Picks `threshold` points of the series (always including the first and
+    last one) that best preserve its visual shape, and returns their indices.
+    """
+    n = len(xs)
+    if threshold >= n:
+        return list(range(n))
+    if threshold <= 2:
+        return [0, n - 1][:max(threshold, 0)]
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average point of the next bucket is the third triangle vertex
+        next_start = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        # Pick the point of the current bucket forming the largest triangle
+        start = int(math.floor(i * every)) + 1
+        end = int(math.floor((i + 1) * every)) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
@@ -0,0 +1,297 @@
+"""
+Live fleet stream
+Pushes the dashboard heatmap to subscribers instead of having every tab poll
+/monitoring/dashboard.
+
+One API worker at a time (holder of a short Redis lease) aggregates the
+fleet from the live state cache every FLEET_STREAM_INTERVAL_SECONDS, stores
+the full snapshot in Redis and publishes only the resources whose state
+changed on a pub/sub channel. Every worker holds one subscription and fans
+the deltas out to its own SSE clients, so the work per interval is one fleet
+scan in total plus one small message per viewer, regardless of how many
+tabs are open.
+
+Messages carry a version; a client that misses one (slow consumer, gap,
+lost subscription) is sent a fresh snapshot.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.monitoring import EXPORTED_KEY
+from app.core.redis import async_redis_client
+from app.models.resource import Resource, ResourceStatus
+from app.services.resource_state import state_key
+
+logger = logging.getLogger(__name__)
+
+FLEET_PREFIX = "opspro:fleet"
+CHANNEL = f"{FLEET_PREFIX}:updates"
+SNAPSHOT_KEY = f"{FLEET_PREFIX}:snapshot"
+LEADER_KEY = f"{FLEET_PREFIX}:leader"
+
+# Pushed to a subscriber queue that overflowed: resend a snapshot
+RESYNC = {"type": "resync"}
+
+# Renew the lease only if we still hold it
+RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def cpu_status(cpu: float) -> str:
+    # Same thresholds as the dashboard heatmap
+    if cpu > 80:
+        return "critical"
+    if cpu > 50:
+        return "warning"
+    return "normal"
+
+
+def _quantize(value: Optional[str]) -> float:
+    """Values are rounded so that jitter below the resolution is not a change"""
+    if value in (None, ""):
+        return 0.0
+    resolution = settings.FLEET_STREAM_RESOLUTION
+    return round(round(float(value) / resolution) * resolution, 1)
+
+
+def build_fleet(
+    exported: Dict[str, str],
+    replies: List[List[Optional[str]]],
+    active: Set[str]
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Heatmap entries of the exported resources; `replies` are HMGET ts, cpu,
+    memory, disk, `active` the ids of resources with status ACTIVE
+    """
+    fleet = {}
+    for (resource_id, labels), (ts, cpu, memory, disk) in zip(exported.items(), replies):
+        if ts is None:
+            continue
+        name, _, ip_address = labels.partition("\t")
+        cpu_value = _quantize(cpu)
+        fleet[resource_id] = {
+            "id": resource_id,
+            "name": name,
+            "ip": ip_address,
+            "cpu": cpu_value,
+            "memory": _quantize(memory),
+            "disk": _quantize(disk),
+            "status": cpu_status(cpu_value),
+            "online": resource_id in active,
+        }
+    return fleet
+
+
+def summarize(fleet: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    count = len(fleet)
+    return {
+        # Resources with status ACTIVE, like the dashboard's fallback
+        "online_resources": sum(1 for r in fleet.values() if r["online"]),
+        "average_cpu_usage": round(sum(r["cpu"] for r in fleet.values()) / count, 1) if count else 0.0,
+        "average_memory_usage": round(sum(r["memory"] for r in fleet.values()) / count, 1) if count else 0.0,
+        "average_disk_usage": round(sum(r["disk"] for r in fleet.values()) / count, 1) if count else 0.0,
+    }
+
+
+def diff_fleet(
+    previous: Dict[str, Dict[str, Any]],
+    current: Dict[str, Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """(changed or new entries, removed ids)"""
+    changed = [entry for resource_id, entry in current.items() if previous.get(resource_id) != entry]
+    removed = [resource_id for resource_id in previous if resource_id not in current]
+    return changed, removed
+
+
+async def load_snapshot() -> Optional[Dict[str, Any]]:
+    raw = await async_redis_client.get(SNAPSHOT_KEY)
+    return json.loads(raw) if raw else None
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+async def _fresh_snapshot() -> Dict[str, Any]:
+    try:
+        snapshot = await load_snapshot()
+    except RedisError as e:
+        logger.warning(f"Fleet snapshot unavailable: {e}")
+        snapshot = None
+    return snapshot or {"type": "snapshot", "version": 0, "summary": summarize({}), "resources": {}}
+
+
+async def stream_events(queue: asyncio.Queue, keepalive: float = 15.0):
+    """
+    Server-sent events for one subscriber: a snapshot, then the deltas that
+    follow it in order. Any gap, overflow or version reset sends a new snapshot.
+    """
+    snapshot = await _fresh_snapshot()
+    version = snapshot["version"]
+    yield sse("snapshot", snapshot)
+    while True:
+        try:
+            message = await asyncio.wait_for(queue.get(), timeout=keepalive)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+            continue
+        if message is not RESYNC and message["version"] == version + 1:
+            version = message["version"]
+            yield sse("delta", message)
+            continue
+        if message is not RESYNC and message["version"] <= version:
+            # Already contained in the snapshot we sent
+            continue
+        snapshot = await _fresh_snapshot()
+        if snapshot["version"] != version:
+            version = snapshot["version"]
+            yield sse("snapshot", snapshot)
+
+
+class FleetBroadcaster:
+    """Aggregator (when leader) and local fan-out of one API worker"""
+
+    def __init__(self, interval: float = settings.FLEET_STREAM_INTERVAL_SECONDS):
+        self.interval = interval
+        self.lease_ms = int(max(interval * 3, 5) * 1000)
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._tasks: List[asyncio.Task] = []
+        self._renew = async_redis_client.register_script(RENEW_LEASE)
+        self._fleet: Dict[str, Dict[str, Any]] = {}
+        self._version = 0
+        self._leader = False
+        self._active: Set[str] = set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._aggregate_loop()),
+            asyncio.create_task(self._listen_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.FLEET_STREAM_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _fan_out(self, message: Dict[str, Any]):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog and have it resync
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    async def _is_leader(self) -> bool:
+        if self._leader:
+            self._leader = bool(await self._renew(keys=[LEADER_KEY], args=[self.consumer, self.lease_ms]))
+        if not self._leader:
+            self._leader = bool(await async_redis_client.set(LEADER_KEY, self.consumer, nx=True, px=self.lease_ms))
+            if self._leader:
+                # Continue from the published state so versions stay monotonic
+                snapshot = await load_snapshot()
+                self._fleet = snapshot["resources"] if snapshot else {}
+                # Without a snapshot, start above any version clients may hold
+                self._version = snapshot["version"] if snapshot else int(time.time() * 1000)
+        return self._leader
+
+    async def _active_ids(self) -> Set[str]:
+        """Ids of the ACTIVE resources; the last known set if the database cannot be read"""
+        try:
+            async with AsyncSessionLocal() as db:
+                ids = await db.scalars(select(Resource.id).where(Resource.status == ResourceStatus.ACTIVE))
+                self._active = {str(resource_id) for resource_id in ids}
+        except SQLAlchemyError as e:
+            logger.warning(f"Fleet stream could not read resource statuses: {e}")
+        return self._active
+
+    async def aggregate(self) -> Optional[Dict[str, Any]]:
+        """Scan the fleet once; store the snapshot and return the delta (None if nothing changed)"""
+        exported = await async_redis_client.hgetall(EXPORTED_KEY)
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for resource_id in exported:
+                pipe.hmget(state_key(int(resource_id)), "ts", "cpu_usage", "memory_usage", "disk_usage")
+            replies = await pipe.execute()
+        fleet = build_fleet(exported, replies, await self._active_ids())
+        changed, removed = diff_fleet(self._fleet, fleet)
+        if not changed and not removed:
+            return None
+
+        self._fleet = fleet
+        self._version += 1
+        summary = summarize(fleet)
+        snapshot = {"type": "snapshot", "version": self._version, "summary": summary, "resources": fleet}
+        delta = {
+            "type": "delta", "version": self._version, "summary": summary,
+            "changed": changed, "removed": removed,
+        }
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(SNAPSHOT_KEY, json.dumps(snapshot, separators=(",", ":")))
+            pipe.publish(CHANNEL, json.dumps(delta, separators=(",", ":")))
+            await pipe.execute()
+        return delta
+
+    async def _aggregate_loop(self):
+        while True:
+            started = time.monotonic()
+            try:
+                if await self._is_leader():
+                    await self.aggregate()
+            except RedisError as e:
+                self._leader = False
+                logger.warning(f"Fleet stream aggregation failed: {e}")
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def _listen_loop(self):
+        while True:
+            pubsub = async_redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CHANNEL)
+                # Deltas may have been missed while (re)connecting
+                self._fan_out(RESYNC)
+                while True:
+                    # Polled with a timeout: a blocking read would hit the socket timeout when idle
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None and message.get("type") == "message":
+                        self._fan_out(json.loads(message["data"]))
+            except RedisError as e:
+                logger.warning(f"Fleet stream subscription lost: {e}")
+                await asyncio.sleep(2)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except RedisError:
+                    pass
+
+
+fleet_broadcaster = FleetBroadcaster()
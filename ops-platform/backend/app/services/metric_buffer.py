@@ -0,0 +1,222 @@
+"""
+Write-behind buffer for metric samples
+Ingest puts rows on a bounded in-process queue; a background flusher writes
+them in bulk (Postgres COPY when available) on a size or time threshold.
+"""
+import asyncio
+import csv
+import io
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from app.core.config import settings
+from app.core.database import engine
+from app.core.monitoring import (
+    INGEST_QUEUE_DEPTH, INGEST_FLUSH_LATENCY, INGEST_FLUSH_SIZE, INGEST_REJECTED, INGEST_DROPPED
+)
+from app.models.metric import Metric, ProcessMetric
+from app.services.metric_rollups import mark_touched
+
+logger = logging.getLogger(__name__)
+
+# One queued sample: (metrics row, process_metrics rows)
+BufferedSample = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+METRIC_COLUMNS = [
+    "resource_id", "cpu_usage", "memory_usage", "disk_usage",
+    "network_in", "network_out", "extra_data", "timestamp"
+]
+PROCESS_COLUMNS = [
+    "resource_id", "process_name", "process_pid", "cpu_percent", "memory_percent", "timestamp"
+]
+
+FLUSH_RETRIES = 3
+
+
+def _to_csv(rows: List[Dict[str, Any]], columns: List[str]) -> io.StringIO:
+    """Serialize rows to CSV for COPY ... FROM STDIN"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([
+            json.dumps(row[col]) if col == "extra_data" else
+            row[col].isoformat() if col == "timestamp" else
+            row[col]
+            for col in columns
+        ])
+    buf.seek(0)
+    return buf
+
+
+def write_samples(samples: List[BufferedSample]) -> None:
+    """
+    Write buffered samples in one transaction (blocking, runs in a worker thread).
+    Uses COPY on psycopg2 connections and falls back to executemany INSERTs,
+    then records the rollup buckets the samples fall into.
+    """
+    metric_rows = [metric for metric, _ in samples]
+    process_rows = [proc for _, procs in samples for proc in procs]
+
+    with engine.begin() as conn:
+        dbapi_conn = conn.connection.dbapi_connection
+        cursor = dbapi_conn.cursor()
+        if hasattr(cursor, "copy_expert"):
+            try:
+                cursor.copy_expert(
+                    f"COPY metrics ({', '.join(METRIC_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                    _to_csv(metric_rows, METRIC_COLUMNS)
+                )
+                if process_rows:
+                    cursor.copy_expert(
+                        f"COPY process_metrics ({', '.join(PROCESS_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                        _to_csv(process_rows, PROCESS_COLUMNS)
+                    )
+            finally:
+                cursor.close()
+        else:
+            cursor.close()
+            conn.execute(insert(Metric), metric_rows)
+            if process_rows:
+                conn.execute(insert(ProcessMetric), process_rows)
+
+    # Committed: older buckets are re-aggregated by the next rollup refresh
+    mark_touched(row["timestamp"] for row in metric_rows)
+
+
+class MetricWriteBuffer:
+    """Bounded write-behind queue with a background bulk flusher"""
+
+    def __init__(
+        self,
+        max_size: int,
+        flush_size: int,
+        flush_interval: float,
+        put_timeout: float
+    ):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: List[BufferedSample] = []
+        self._inflight: Optional[asyncio.Future] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Start the background flusher (call from app startup)"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        INGEST_QUEUE_DEPTH.set_function(lambda: self._queue.qsize() + len(self._pending))
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Metric write buffer started (max_size={self.max_size}, "
+            f"flush_size={self.flush_size}, flush_interval={self.flush_interval}s)"
+        )
+
+    async def stop(self):
+        """Stop the flusher and write out everything still buffered (call from app shutdown)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Let an interrupted flush finish, then drain the rest
+        if self._inflight is not None and not self._inflight.done():
+            await self._inflight
+        remaining = self._pending
+        self._pending = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for i in range(0, len(remaining), self.flush_size):
+            await self._flush(remaining[i:i + self.flush_size])
+        logger.info(f"Metric write buffer stopped, flushed {len(remaining)} samples on shutdown")
+
+    async def put_many(self, samples: List[BufferedSample]) -> int:
+        """
+        Queue samples for writing.
+
+        Waits up to `put_timeout` in total for queue space (backpressure) and
+        returns how many samples were queued; the rest must be retried by the caller.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.put_timeout
+        queued = 0
+        for sample in samples:
+            try:
+                self._queue.put_nowait(sample)
+            except asyncio.QueueFull:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._queue.put(sample), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            queued += 1
+
+        if queued < len(samples):
+            INGEST_REJECTED.inc(len(samples) - queued)
+        return queued
+
+    async def _run(self):
+        """Collect samples until the size or time threshold is hit, then flush"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._pending.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval
+
+            while len(self._pending) < self.flush_size:
+                try:
+                    self._pending.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            batch, self._pending = self._pending, []
+            # Shield the write so shutdown can wait for it instead of abandoning it
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+
+    async def _flush(self, batch: List[BufferedSample]):
+        """Write a batch off the event loop, retrying transient database errors"""
+        for attempt in range(1, FLUSH_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(write_samples, batch)
+                INGEST_FLUSH_LATENCY.set(time.perf_counter() - started)
+                INGEST_FLUSH_SIZE.set(len(batch))
+                return
+            except Exception as e:
+                logger.warning(f"Metric buffer flush of {len(batch)} samples failed (attempt {attempt}): {e}")
+                if attempt < FLUSH_RETRIES:
+                    await asyncio.sleep(2 ** (attempt - 1))
+
+        logger.error(f"Dropping {len(batch)} metric samples after {FLUSH_RETRIES} failed flushes")
+        INGEST_DROPPED.inc(len(batch))
+
+
+metric_buffer = MetricWriteBuffer(
+    max_size=settings.METRIC_BUFFER_MAX_SIZE,
+    flush_size=settings.METRIC_BUFFER_FLUSH_SIZE,
+    flush_interval=settings.METRIC_BUFFER_FLUSH_INTERVAL,
+    put_timeout=settings.METRIC_BUFFER_PUT_TIMEOUT
+)
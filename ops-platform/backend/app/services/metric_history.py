@@ -0,0 +1,209 @@
+"""
+Metric history queries
+Picks raw samples or a rollup level based on the requested time range, and
+optionally downsamples the series to a point budget.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import Float, cast, func, literal_column
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.metric import Metric
+from app.services.downsampling import bucket_width, lttb_indices
+from app.services.metric_rollups import (
+    BUCKET_ORIGIN, ROLLUP_LEVELS, ROLLUP_METRICS, RollupLevel, floor_to_bucket
+)
+
+RAW_RESOLUTION = "raw"
+
+HISTORY_AGGREGATES = ("avg", "min", "max", "lttb")
+
+# LTTB picks its points from this many SQL buckets per requested point
+LTTB_OVERSAMPLE = 4
+
+
+class HistoryResult(NamedTuple):
+    """A metric series and how it was produced"""
+    resolution: str  # raw or a rollup level name
+    bucket_seconds: Optional[int]  # width of the SQL buckets, None when not bucketed
+    points: List[Dict]
+
+
+def select_resolution(window: timedelta) -> Optional[RollupLevel]:
+    """
+    Pick the finest source that keeps the series under METRIC_HISTORY_MAX_POINTS
+    and still covers the window. Returns None for raw samples.
+    """
+    seconds = window.total_seconds()
+    max_points = settings.METRIC_HISTORY_MAX_POINTS
+
+    if (seconds / settings.AGENT_REPORT_INTERVAL <= max_points
+            and window <= timedelta(days=settings.METRIC_RETENTION_DAYS)):
+        return None
+
+    for level in ROLLUP_LEVELS:
+        if seconds / level.seconds <= max_points and window <= timedelta(days=level.retention_days):
+            return level
+    return ROLLUP_LEVELS[-1]
+
+
+def _raw_point(m: Metric) -> Dict:
+    return {
+        "timestamp": m.timestamp.isoformat(),
+        "cpu_usage": m.cpu_usage,
+        "memory_usage": m.memory_usage,
+        "disk_usage": m.disk_usage,
+        "network_in": m.network_in,
+        "network_out": m.network_out
+    }
+
+
+def _rollup_point(row) -> Dict:
+    """Average under the plain metric names, min/max/p95 as suffixed keys"""
+    point = {"timestamp": row.bucket.isoformat()}
+    for metric in ROLLUP_METRICS:
+        point[metric] = getattr(row, f"{metric}_avg")
+        point[f"{metric}_min"] = getattr(row, f"{metric}_min")
+        point[f"{metric}_max"] = getattr(row, f"{metric}_max")
+        point[f"{metric}_p95"] = getattr(row, f"{metric}_p95")
+    return point
+
+
+def _bucket_expr(column, seconds: int):
+    """date_bin() of `column` into `seconds` wide buckets, aligned like the rollups"""
+    return func.date_bin(
+        literal_column(f"INTERVAL '{int(seconds)} seconds'"),
+        column,
+        literal_column(f"TIMESTAMP '{BUCKET_ORIGIN.isoformat(sep=' ')}'")
+    ).label("bucket")
+
+
+def _aggregates(level: Optional[RollupLevel], agg: str):
+    """One aggregate expression per metric, combining raw samples or rollup buckets"""
+    columns = []
+    for metric in ROLLUP_METRICS:
+        if level is None:
+            column = getattr(Metric, metric)
+            expr = {"min": func.min, "max": func.max}.get(agg, func.avg)(column)
+        else:
+            model = level.model
+            if agg == "min":
+                expr = func.min(getattr(model, f"{metric}_min"))
+            elif agg == "max":
+                expr = func.max(getattr(model, f"{metric}_max"))
+            else:
+                # Weight each rollup bucket by the raw samples it holds
+                expr = cast(
+                    func.sum(getattr(model, f"{metric}_avg") * model.samples)
+                    / func.nullif(func.sum(model.samples), 0),
+                    Float
+                )
+        columns.append(expr.label(metric))
+    return columns
+
+
+def _bucketed_points(
+    db: Session,
+    resource_id: int,
+    since: datetime,
+    until: datetime,
+    level: Optional[RollupLevel],
+    seconds: int,
+    agg: str
+) -> List[Dict]:
+    """Aggregate the series into `seconds` wide buckets in the database"""
+    if level is None:
+        bucket = _bucket_expr(Metric.timestamp, seconds)
+        query = db.query(bucket, *_aggregates(None, agg)).filter(
+            Metric.resource_id == resource_id,
+            Metric.timestamp >= since,
+            Metric.timestamp <= until
+        )
+    else:
+        model = level.model
+        bucket = _bucket_expr(model.bucket, seconds)
+        query = db.query(bucket, *_aggregates(level, agg)).filter(
+            model.resource_id == resource_id,
+            model.bucket >= floor_to_bucket(since, level.seconds),
+            model.bucket <= until
+        )
+
+    rows = query.group_by(bucket).order_by(bucket.asc()).all()
+    points = []
+    for row in rows:
+        point = {"timestamp": row.bucket.isoformat()}
+        for metric in ROLLUP_METRICS:
+            point[metric] = getattr(row, metric)
+        points.append(point)
+    return points
+
+
+def _lttb(points: List[Dict], max_points: int) -> List[Dict]:
+    """
+    Keep the points LTTB selects for any metric, giving each metric an equal
+    share of the budget so the result never exceeds `max_points`. Every
+    selection shares the first and last point, so only the interior points
+    are split between the metrics.
+    """
+    if len(points) <= max_points:
+        return points
+
+    xs = [datetime.fromisoformat(p["timestamp"]).timestamp() for p in points]
+    threshold = 2 + max(0, max_points - 2) // len(ROLLUP_METRICS)
+    keep = set()
+    for metric in ROLLUP_METRICS:
+        ys = [p.get(metric) or 0.0 for p in points]
+        keep.update(lttb_indices(xs, ys, threshold))
+    return [points[i] for i in sorted(keep)]
+
+
+def fetch_history(
+    db: Session,
+    resource_id: int,
+    since: datetime,
+    until: datetime,
+    max_points: Optional[int] = None,
+    agg: str = "avg"
+) -> HistoryResult:
+    """
+    Fetch the metric series of a resource for [since, until].
+
+    With `max_points`, series longer than the budget are bucketed with
+    date_bin() in SQL using `agg` (avg/min/max) per bucket. For "lttb" the
+    series is bucketed to a few times the budget and then thinned with
+    Largest-Triangle-Three-Buckets, which keeps spikes visible.
+    """
+    level = select_resolution(until - since)
+    step = settings.AGENT_REPORT_INTERVAL if level is None else level.seconds
+
+    if max_points is not None:
+        target = max_points * LTTB_OVERSAMPLE if agg == "lttb" else max_points
+        window = (until - since).total_seconds()
+        if window / step > target:
+            seconds = bucket_width(window, target, step)
+            points = _bucketed_points(db, resource_id, since, until, level, seconds, agg)
+            if agg == "lttb":
+                points = _lttb(points, max_points)
+            return HistoryResult(level.name if level else RAW_RESOLUTION, seconds, points)
+
+    if level is None:
+        # Both bounds are literal values so the planner prunes every
+        # daily partition outside the window
+        rows = db.query(Metric).filter(
+            Metric.resource_id == resource_id,
+            Metric.timestamp >= since,
+            Metric.timestamp <= until
+        ).order_by(Metric.timestamp.asc()).all()
+        resolution, points = RAW_RESOLUTION, [_raw_point(m) for m in rows]
+    else:
+        model = level.model
+        rows = db.query(model).filter(
+            model.resource_id == resource_id,
+            model.bucket >= floor_to_bucket(since, level.seconds),
+            model.bucket <= until
+        ).order_by(model.bucket.asc()).all()
+        resolution, points = level.name, [_rollup_point(r) for r in rows]
+
+    if max_points is not None and agg == "lttb":
+        points = _lttb(points, max_points)
+    return HistoryResult(resolution, None, points)
@@ -0,0 +1,168 @@
+"""
+Metric ingest service
+Validates agent samples and stores them with bulk inserts
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.metric import Metric, ProcessMetric
+from app.models.resource import Resource
+from app.schemas.resource import ResourceMetrics, MetricSample
+
+logger = logging.getLogger(__name__)
+
+# Only the top N processes of each sample are kept
+MAX_PROCESSES_PER_SAMPLE = 5
+
+
+def normalize_timestamp(value: Optional[datetime], now: datetime) -> datetime:
+    """Convert a sample timestamp to naive UTC (the storage format), defaulting to now"""
+    if value is None:
+        return now
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def build_metric_row(resource_id: int, metrics: ResourceMetrics, timestamp: datetime) -> Dict[str, Any]:
+    """Build a `metrics` table row from a validated sample"""
+    return {
+        "resource_id": resource_id,
+        "cpu_usage": metrics.cpu_usage,
+        "memory_usage": metrics.memory_usage,
+        "disk_usage": metrics.disk_usage,
+        "network_in": metrics.network_in or 0,
+        "network_out": metrics.network_out or 0,
+        "extra_data": {},
+        "timestamp": timestamp,
+    }
+
+
+def build_process_rows(resource_id: int, processes: Optional[List[Dict]], timestamp: datetime) -> List[Dict[str, Any]]:
+    """Build `process_metrics` rows for the top processes of a sample"""
+    rows = []
+    for proc in (processes or [])[:MAX_PROCESSES_PER_SAMPLE]:
+        rows.append({
+            "resource_id": resource_id,
+            "process_name": str(proc.get('name') or 'unknown')[:255],
+            "process_pid": proc.get('pid') or 0,
+            "cpu_percent": proc.get('cpu_percent') or 0,
+            "memory_percent": proc.get('memory_percent') or 0,
+            "timestamp": timestamp,
+        })
+    return rows
+
+
+def store_metric_rows(db: Session, metric_rows: List[Dict], process_rows: List[Dict]) -> None:
+    """
+    Bulk insert metric and process rows.
+    Does not commit - the caller owns the transaction.
+    """
+    if metric_rows:
+        db.execute(insert(Metric), metric_rows)
+    if process_rows:
+        db.execute(insert(ProcessMetric), process_rows)
+
+
+def validate_batch(
+    raw_samples: List[Any],
+    now: datetime
+) -> Tuple[List[Tuple[int, MetricSample]], List[Dict[str, Any]]]:
+    """
+    Validate raw batch items one by one so a bad item does not reject the batch.
+
+    Returns:
+        (valid, results) where valid is a list of (index, sample) and results
+        holds one status entry per input item (rejected items filled in).
+    """
+    max_future = now + timedelta(seconds=settings.METRIC_MAX_CLOCK_SKEW_SECONDS)
+    # Older samples would land in an already dropped partition
+    min_past = datetime.combine(now.date() - timedelta(days=settings.METRIC_RETENTION_DAYS), datetime.min.time())
+    valid = []
+    results = []
+
+    for index, raw in enumerate(raw_samples):
+        result = {"index": index, "resource_id": None, "status": "accepted", "error": None}
+        results.append(result)
+
+        if not isinstance(raw, dict):
+            result.update(status="rejected", error="Sample must be an object")
+            continue
+        if isinstance(raw.get("resource_id"), int):
+            result["resource_id"] = raw["resource_id"]
+
+        try:
+            sample = MetricSample(**raw)
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            result.update(status="rejected", error=errors)
+            continue
+
+        sample.timestamp = normalize_timestamp(sample.timestamp, now)
+        if sample.timestamp > max_future:
+            result.update(status="rejected", error="timestamp is too far in the future")
+            continue
+        if sample.timestamp < min_past:
+            result.update(status="rejected", error="timestamp is older than the retention window")
+            continue
+
+        valid.append((index, sample))
+
+    return valid, results
+
+
+def load_resources(db: Session, resource_ids: Iterable[int]) -> Dict[int, Resource]:
+    """Fetch all referenced resources with a single query"""
+    ids = set(resource_ids)
+    if not ids:
+        return {}
+    return {r.id: r for r in db.query(Resource).filter(Resource.id.in_(ids)).all()}
+
+
+def latest_per_resource(samples: Iterable[MetricSample]) -> Dict[int, MetricSample]:
+    """Pick the newest sample of each resource"""
+    latest: Dict[int, MetricSample] = {}
+    for sample in samples:
+        current = latest.get(sample.resource_id)
+        if current is None or sample.timestamp >= current.timestamp:
+            latest[sample.resource_id] = sample
+    return latest
+
+
+def update_resource_latest(db: Session, latest: Dict[int, MetricSample]) -> None:
+    """Bulk UPDATE the current usage columns of resources by primary key"""
+    if not latest:
+        return
+    db.execute(update(Resource), [
+        {
+            "id": resource_id,
+            "cpu_usage": sample.cpu_usage,
+            "memory_usage": sample.memory_usage,
+            "disk_usage": sample.disk_usage,
+            "last_seen": sample.timestamp.replace(tzinfo=timezone.utc),
+        }
+        for resource_id, sample in latest.items()
+    ])
+
+
+def drop_stale_latest(latest: Dict[int, MetricSample], resources: Dict[int, Resource]) -> Dict[int, MetricSample]:
+    """
+    Drop samples older than what the resource already reports, so a catching-up
+    agent replaying old samples does not roll the current values back.
+    """
+    fresh = {}
+    for resource_id, sample in latest.items():
+        last_seen = resources[resource_id].last_seen
+        if last_seen is not None:
+            if last_seen.tzinfo is not None:
+                last_seen = last_seen.astimezone(timezone.utc).replace(tzinfo=None)
+            if sample.timestamp < last_seen:
+                continue
+        fresh[resource_id] = sample
+    return fresh
@@ -0,0 +1,110 @@
+"""
+Daily range partition management for the time-series tables
+Creates future partitions ahead of time and enforces retention by
+dropping whole expired partitions instead of row-level DELETEs.
+"""
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("metrics", "process_metrics")
+
+# Serializes partition DDL between uvicorn workers and Celery
+PARTITION_LOCK_ID = 724001
+
+_PARTITION_SUFFIX = re.compile(r"_p(\d{8})$")
+
+
+def partition_name(table: str, day: date) -> str:
+    """Name of the partition holding `day`, e.g. metrics_p20240131"""
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def partition_day(name: str) -> Optional[date]:
+    """Parse the day back out of a partition name"""
+    match = _PARTITION_SUFFIX.search(name)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d").date()
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    """Check whether `table` is a partitioned parent table"""
+    return bool(conn.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"),
+        {"t": table}
+    ).scalar())
+
+
+def list_partitions(conn: Connection, table: str) -> List[str]:
+    """List the partitions attached to `table`"""
+    rows = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :t"
+    ), {"t": table})
+    return [row[0] for row in rows]
+
+
+def ensure_partitions(conn: Connection, table: str, start: date, end: date) -> List[str]:
+    """Create the daily partitions of `table` covering [start, end]"""
+    existing = set(list_partitions(conn, table))
+    created = []
+    day = start
+    while day <= end:
+        name = partition_name(table, day)
+        if name not in existing:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            ))
+            created.append(name)
+        day += timedelta(days=1)
+    return created
+
+
+def drop_expired_partitions(conn: Connection, table: str, keep_from: date) -> List[str]:
+    """Drop the partitions of `table` holding only days before `keep_from`"""
+    dropped = []
+    for name in list_partitions(conn, table):
+        day = partition_day(name)
+        if day is not None and day < keep_from:
+            conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def maintain_partitions(engine: Engine, today: Optional[date] = None) -> dict:
+    """
+    Create partitions for the retention window plus METRIC_PARTITION_PREMAKE_DAYS
+    ahead and drop the expired ones. Safe to run from several processes.
+    """
+    today = today or datetime.utcnow().date()
+    keep_from = today - timedelta(days=settings.METRIC_RETENTION_DAYS)
+    premake_until = today + timedelta(days=settings.METRIC_PARTITION_PREMAKE_DAYS)
+    summary = {"created": [], "dropped": []}
+
+    if engine.dialect.name != "postgresql":
+        return summary
+
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID})
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(conn, table):
+                logger.warning(f"Table {table} is not partitioned, run the partition_metrics migration")
+                continue
+            summary["created"] += ensure_partitions(conn, table, keep_from, premake_until)
+            summary["dropped"] += drop_expired_partitions(conn, table, keep_from)
+
+    if summary["created"] or summary["dropped"]:
+        logger.info(
+            f"Metric partitions maintained: created={summary['created']}, dropped={summary['dropped']}"
+        )
+    return summary
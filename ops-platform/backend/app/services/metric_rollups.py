@@ -0,0 +1,240 @@
+"""
+Incrementally maintained metric rollups (1m / 5m / 1h)
+Each level holds min/avg/max/p95 per resource per bucket and is refreshed
+from the raw `metrics` table by a celery beat task.
+
+A run re-aggregates from the level's newest bucket (minus LATE_BUCKETS) on.
+Samples landing further back (batch backfills, agents with a lagging clock)
+are caught through the touched buckets: every write of raw samples records
+the buckets it touched in a sorted set per level once it has committed, and
+the next run re-aggregates those buckets too. Without Redis only the trailing
+window is refreshed.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Type
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+from app.core.redis import async_redis_client, redis_client
+from app.models.metric import MetricRollupMixin, MetricRollup1m, MetricRollup5m, MetricRollup1h
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_METRICS = ("cpu_usage", "memory_usage", "disk_usage", "network_in", "network_out")
+ROLLUP_STATS = ("min", "avg", "max", "p95")
+
+# Buckets are aligned to this origin (same as the date_bin origin in SQL)
+BUCKET_ORIGIN = datetime(2000, 1, 1)
+
+# Trailing buckets re-aggregated on every run to absorb late samples
+LATE_BUCKETS = 2
+
+# Raw time range aggregated per statement (multiple of every bucket size)
+REFRESH_CHUNK = timedelta(hours=6)
+
+# Sorted set per level of buckets written to since its last run, by offset from BUCKET_ORIGIN
+TOUCHED_PREFIX = "opspro:metrics:rollups:touched"
+
+
+class RollupLevel(NamedTuple):
+    """A rollup resolution and its storage"""
+    name: str
+    model: Type[MetricRollupMixin]
+    seconds: int
+    retention_days: int
+
+
+ROLLUP_LEVELS = (
+    RollupLevel("1m", MetricRollup1m, 60, settings.METRIC_ROLLUP_RETENTION_DAYS_1M),
+    RollupLevel("5m", MetricRollup5m, 300, settings.METRIC_ROLLUP_RETENTION_DAYS_5M),
+    RollupLevel("1h", MetricRollup1h, 3600, settings.METRIC_ROLLUP_RETENTION_DAYS_1H),
+)
+ROLLUP_LEVELS_BY_NAME = {level.name: level for level in ROLLUP_LEVELS}
+
+
+def floor_to_bucket(ts: datetime, seconds: int) -> datetime:
+    """Start of the bucket containing `ts`"""
+    offset = int((ts - BUCKET_ORIGIN).total_seconds()) // seconds * seconds
+    return BUCKET_ORIGIN + timedelta(seconds=offset)
+
+
+def bucket_offset(ts: datetime, seconds: int) -> int:
+    """Seconds from BUCKET_ORIGIN to the start of the bucket containing `ts`"""
+    return int((floor_to_bucket(ts, seconds) - BUCKET_ORIGIN).total_seconds())
+
+
+def touched_key(level: RollupLevel) -> str:
+    return f"{TOUCHED_PREFIX}:{level.name}"
+
+
+def _touched(timestamps: Iterable[datetime]) -> Dict[str, Dict[str, int]]:
+    """Buckets holding the timestamps, per touched-set key"""
+    timestamps = set(timestamps)
+    touched = {}
+    for level in ROLLUP_LEVELS:
+        offsets = {bucket_offset(ts, level.seconds) for ts in timestamps}
+        if offsets:
+            touched[touched_key(level)] = {str(offset): offset for offset in offsets}
+    return touched
+
+
+def mark_touched(timestamps: Iterable[datetime]):
+    """Record the buckets of committed raw samples for the next refresh"""
+    touched = _touched(timestamps)
+    if not touched:
+        return
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            for key, members in touched.items():
+                pipe.zadd(key, members)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not record the rollup buckets of {len(touched)} levels: {e}")
+
+
+async def mark_touched_async(timestamps: Iterable[datetime]):
+    """mark_touched() for the event loop"""
+    touched = _touched(timestamps)
+    if not touched:
+        return
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for key, members in touched.items():
+                pipe.zadd(key, members)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not record the rollup buckets of {len(touched)} levels: {e}")
+
+
+def take_touched(level: RollupLevel) -> List[int]:
+    """Pop the bucket offsets recorded for `level`"""
+    try:
+        with redis_client.pipeline(transaction=True) as pipe:
+            pipe.zrange(touched_key(level), 0, -1)
+            pipe.delete(touched_key(level))
+            members, _ = pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Touched rollup buckets unavailable, refreshing {level.name} from its watermark: {e}")
+        return []
+    return sorted(int(member) for member in members)
+
+
+def _restore_touched(level: RollupLevel, offsets: List[int]):
+    try:
+        redis_client.zadd(touched_key(level), {str(offset): offset for offset in offsets})
+    except RedisError as e:
+        logger.warning(f"Lost {len(offsets)} touched {level.name} rollup buckets: {e}")
+
+
+def touched_ranges(offsets: List[int], seconds: int) -> List[Tuple[datetime, datetime]]:
+    """Merge sorted bucket offsets into [start, end) ranges of adjacent buckets"""
+    ranges = []
+    for offset in offsets:
+        start = BUCKET_ORIGIN + timedelta(seconds=offset)
+        end = start + timedelta(seconds=seconds)
+        if ranges and ranges[-1][1] >= start:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def stat_columns():
+    """Rollup value columns, e.g. cpu_usage_p95"""
+    return [f"{metric}_{stat}" for metric in ROLLUP_METRICS for stat in ROLLUP_STATS]
+
+
+def _upsert_sql(level: RollupLevel) -> str:
+    """Aggregate raw rows of [start, end) into the level table, replacing touched buckets"""
+    aggregates = []
+    for metric in ROLLUP_METRICS:
+        aggregates += [
+            f"min({metric})",
+            f"avg({metric})",
+            f"max({metric})",
+            f"percentile_cont(0.95) WITHIN GROUP (ORDER BY {metric})",
+        ]
+    columns = stat_columns()
+    return f"""
+        INSERT INTO {level.model.__tablename__} (resource_id, bucket, samples, {', '.join(columns)})
+        SELECT resource_id,
+               date_bin(INTERVAL '{level.seconds} seconds', timestamp, TIMESTAMP '{BUCKET_ORIGIN.isoformat()}') AS bucket,
+               count(*),
+               {', '.join(aggregates)}
+        FROM metrics
+        WHERE timestamp >= :start AND timestamp < :end
+        GROUP BY resource_id, bucket
+        ON CONFLICT (resource_id, bucket) DO UPDATE SET
+            samples = EXCLUDED.samples,
+            {', '.join(f'{col} = EXCLUDED.{col}' for col in columns)}
+    """
+
+
+def _aggregate(engine: Engine, sql, start: datetime, end: datetime) -> int:
+    """Run the upsert over [start, end) in REFRESH_CHUNK pieces"""
+    upserted = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + REFRESH_CHUNK, end)
+        with engine.begin() as conn:
+            upserted += conn.execute(sql, {"start": chunk_start, "end": chunk_end}).rowcount
+        chunk_start = chunk_end
+    return upserted
+
+
+def refresh_rollups(engine: Engine, level: RollupLevel, now: Optional[datetime] = None) -> int:
+    """
+    Re-aggregate everything since the level's watermark (its newest bucket,
+    minus LATE_BUCKETS) up to now, and the older buckets written to since the
+    last run. Idempotent, so overlapping runs are harmless.
+
+    Returns the number of upserted buckets.
+    """
+    now = now or datetime.utcnow()
+    table = level.model.__tablename__
+    history_days = min(settings.METRIC_RETENTION_DAYS, level.retention_days)
+    earliest = floor_to_bucket(now - timedelta(days=history_days), level.seconds)
+
+    # Taken before reading the watermark: a bucket touched after this is seen by the next run
+    touched = take_touched(level)
+    with engine.connect() as conn:
+        watermark = conn.execute(text(f"SELECT max(bucket) FROM {table}")).scalar()
+
+    start = earliest
+    if watermark is not None:
+        start = max(earliest, watermark - timedelta(seconds=LATE_BUCKETS * level.seconds))
+    late = [
+        offset for offset in touched
+        if earliest <= BUCKET_ORIGIN + timedelta(seconds=offset) < start
+    ]
+
+    sql = text(_upsert_sql(level))
+    upserted = 0
+    try:
+        for range_start, range_end in touched_ranges(late, level.seconds):
+            upserted += _aggregate(engine, sql, range_start, range_end)
+        upserted += _aggregate(engine, sql, start, now)
+    except Exception:
+        # Left for the next run
+        _restore_touched(level, late)
+        raise
+
+    logger.debug(
+        f"Rollup {level.name}: upserted {upserted} buckets since {start.isoformat()} "
+        f"and {len(late)} late buckets"
+    )
+    return upserted
+
+
+def purge_expired_rollups(engine: Engine, level: RollupLevel, now: Optional[datetime] = None) -> int:
+    """Delete buckets older than the level's retention"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=level.retention_days)
+    with engine.begin() as conn:
+        result = conn.execute(
+            text(f"DELETE FROM {level.model.__tablename__} WHERE bucket < :cutoff"),
+            {"cutoff": cutoff}
+        )
+    return result.rowcount
@@ -0,0 +1,154 @@
+"""
+Prometheus HTTP API client
+One pooled httpx.AsyncClient for the whole app, opened and closed by the app
+lifespan, with explicit timeouts and a circuit breaker: after
+PROMETHEUS_BREAKER_FAILURES consecutive failures requests fail fast for
+PROMETHEUS_BREAKER_RESET_SECONDS, then a single trial request decides
+whether Prometheus is back.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+import httpx
+from app.core.config import settings
+from app.core.monitoring import PROMETHEUS_BREAKER_STATE, PROMETHEUS_LATENCY
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class PrometheusUnavailable(Exception):
+    """Prometheus could not be queried, or the breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker"""
+
+    def __init__(
+        self,
+        failure_threshold: int = settings.PROMETHEUS_BREAKER_FAILURES,
+        reset_seconds: float = settings.PROMETHEUS_BREAKER_RESET_SECONDS
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.state = CLOSED
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Prometheus circuit breaker {self.state} -> {state}")
+            self.state = state
+        PROMETHEUS_BREAKER_STATE.set(BREAKER_STATES[state])
+
+    def allow(self) -> bool:
+        """Whether a request may go out now"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self._trial_running = False
+        self._set_state(CLOSED)
+
+    def record_abandoned(self):
+        """The request was cancelled by its caller; it says nothing about Prometheus"""
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+
+class PrometheusClient:
+    """Shared client; requests made before start() open it lazily"""
+
+    def __init__(self, base_url: str = settings.PROMETHEUS_URL):
+        self.base_url = base_url
+        self.breaker = CircuitBreaker()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.state != OPEN
+
+    def _open(self) -> httpx.AsyncClient:
+        http2 = settings.PROMETHEUS_HTTP2 and HTTP2_AVAILABLE
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            timeout=httpx.Timeout(
+                settings.PROMETHEUS_TIMEOUT_SECONDS,
+                connect=settings.PROMETHEUS_CONNECT_TIMEOUT_SECONDS
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.PROMETHEUS_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.PROMETHEUS_MAX_CONNECTIONS,
+                keepalive_expiry=60
+            )
+        )
+        logger.info(f"Prometheus client for {self.base_url} opened (HTTP/2: {http2})")
+        return self._client
+
+    async def start(self):
+        if self._client is None:
+            self._open()
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        GET /api/v1/<endpoint> and return the decoded body. Raises
+        PrometheusUnavailable on connection errors, timeouts, 5xx responses
+        and while the breaker is open. Query errors (4xx) are returned as is.
+        """
+        if not self.breaker.allow():
+            raise PrometheusUnavailable("Prometheus circuit breaker is open")
+        client = self._client or self._open()
+
+        started = time.perf_counter()
+        try:
+            resp = await client.get(f"/api/v1/{endpoint}", params=params)
+            if resp.status_code >= 500:
+                raise PrometheusUnavailable(f"Prometheus returned HTTP {resp.status_code}")
+            body = resp.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.breaker.record_failure()
+            raise PrometheusUnavailable(f"Prometheus connection failed: {e}") from e
+        except PrometheusUnavailable:
+            self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned()
+            raise
+        finally:
+            PROMETHEUS_LATENCY.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+        self.breaker.record_success()
+        return body
+
+
+prometheus = PrometheusClient()
@@ -0,0 +1,188 @@
+"""
+Query frontend for range queries
+Sits between /monitoring/query_range and Prometheus, in the spirit of the
+Thanos/Cortex query-frontend:
+  - start and end are aligned to the step, so refreshes over sliding
+    windows produce the same evaluation timestamps;
+  - the range is split at fixed hour (or, for long ranges, day) boundaries
+    and the sub-queries run in parallel;
+  - sub-results lying entirely further in the past than
+    QUERY_CACHE_FRESHNESS_SECONDS cannot change any more and are cached in
+    Redis, so a refresh only fetches the newest part(s).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from redis.exceptions import RedisError
+from app.core.cache import cache_key
+from app.core.config import settings
+from app.core.monitoring import CACHE_REQUESTS
+from app.core.redis import async_redis_client
+from app.services.prometheus import prometheus
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 86400
+
+
+class SubQuery(NamedTuple):
+    start: int
+    end: int
+
+
+def align(start: float, end: float, step: int) -> Tuple[int, int]:
+    """Round start and end down to multiples of step"""
+    start, end = int(start), int(end)
+    return start - start % step, end - end % step
+
+
+def split_interval(start: int, end: int, step: int) -> int:
+    """Hour splits, day splits beyond QUERY_SPLIT_DAYS_AFTER; always a multiple of step"""
+    interval = DAY if end - start > settings.QUERY_SPLIT_DAYS_AFTER_SECONDS else HOUR
+    if interval % step:
+        # Keep split points on the step grid
+        interval = max(step, interval // step * step)
+    return interval
+
+
+def split_range(start: int, end: int, step: int) -> List[SubQuery]:
+    """
+    Disjoint sub-ranges covering [start, end] (both inclusive, as in Prometheus)
+    split at multiples of the split interval. `start` must be step-aligned.
+
+    The first sub-range is widened back to its interval boundary so that it
+    is the same (cacheable) sub-query for every window starting inside that
+    interval; the caller trims it to `start`.
+    """
+    interval = split_interval(start, end, step)
+    parts = []
+    part_start = start - start % interval
+    while part_start <= end:
+        # Boundaries are multiples of the interval, hence on the step grid too
+        boundary = (part_start // interval + 1) * interval
+        part_end = min(end, boundary - step)
+        parts.append(SubQuery(part_start, part_end))
+        part_start = part_end + step
+    return parts
+
+
+def is_cacheable(part: SubQuery, now: float) -> bool:
+    return part.end < now - settings.QUERY_CACHE_FRESHNESS_SECONDS
+
+
+def sub_query_key(query: str, step: int, part: SubQuery) -> str:
+    digest = hashlib.sha256(f"{query}\n{step}\n{part.start}\n{part.end}".encode("utf-8")).hexdigest()
+    return cache_key("query_range", digest)
+
+
+def trim_matrix(response: Dict[str, Any], start: int) -> Dict[str, Any]:
+    """Drop samples before `start` (and series left empty)"""
+    result = []
+    for item in response["data"]["result"]:
+        values = [value for value in item["values"] if value[0] >= start]
+        if values:
+            result.append({"metric": item["metric"], "values": values})
+    trimmed = dict(response)
+    trimmed["data"] = dict(response["data"], result=result)
+    return trimmed
+
+
+def merge_matrices(responses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Concatenate the series of consecutive matrix responses"""
+    series: Dict[str, Dict[str, Any]] = {}
+    warnings: List[str] = []
+    for response in responses:
+        warnings += response.get("warnings", [])
+        for item in response["data"]["result"]:
+            key = json.dumps(item["metric"], sort_keys=True)
+            merged = series.get(key)
+            if merged is None:
+                series[key] = {"metric": item["metric"], "values": list(item["values"])}
+            else:
+                merged["values"] += item["values"]
+    result: Dict[str, Any] = {
+        "status": "success",
+        "data": {"resultType": "matrix", "result": list(series.values())}
+    }
+    if warnings:
+        result["warnings"] = warnings
+    return result
+
+
+async def _load_cached(keys: List[Optional[str]]) -> List[Optional[Dict[str, Any]]]:
+    wanted = [key for key in keys if key]
+    if not wanted:
+        return [None] * len(keys)
+    try:
+        found = dict(zip(wanted, await async_redis_client.mget(wanted)))
+    except RedisError as e:
+        logger.warning(f"Query range cache unavailable: {e}")
+        return [None] * len(keys)
+    return [json.loads(found[key]) if key and found.get(key) else None for key in keys]
+
+
+async def _store_cached(entries: List[Tuple[str, Dict[str, Any]]]):
+    if not entries:
+        return
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for key, response in entries:
+                pipe.set(key, json.dumps(response, separators=(",", ":")), ex=settings.QUERY_CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not cache {len(entries)} range sub-queries: {e}")
+
+
+async def query_range(
+    query: str,
+    start: float,
+    end: float,
+    step: int,
+    now: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Evaluate a range query through the frontend. Prometheus errors (e.g. a
+    bad expression) are returned as Prometheus reported them.
+    """
+    now = time.time() if now is None else now
+    start, end = align(start, end, step)
+    if end < start:
+        return {"status": "error", "errorType": "bad_data",
+                "error": "end timestamp must not be before start time"}
+    parts = split_range(start, end, step)
+    keys = [sub_query_key(query, step, part) if is_cacheable(part, now) else None for part in parts]
+    responses = await _load_cached(keys)
+
+    missing = [i for i, response in enumerate(responses) if response is None]
+    hits = len(parts) - len(missing)
+    if hits:
+        CACHE_REQUESTS.labels(cache="query_range", result="hit").inc(hits)
+    if missing:
+        CACHE_REQUESTS.labels(cache="query_range", result="miss").inc(len(missing))
+
+    semaphore = asyncio.Semaphore(settings.QUERY_SPLIT_CONCURRENCY)
+
+    async def fetch(part: SubQuery) -> Dict[str, Any]:
+        async with semaphore:
+            return await prometheus.get(
+                "query_range", {"query": query, "start": part.start, "end": part.end, "step": step}
+            )
+
+    fetched = await asyncio.gather(*(fetch(parts[i]) for i in missing))
+    to_cache = []
+    for i, response in zip(missing, fetched):
+        if response.get("status") != "success":
+            return response
+        responses[i] = response
+        if keys[i]:
+            to_cache.append((keys[i], response))
+    await _store_cached(to_cache)
+
+    responses[0] = trim_matrix(responses[0], start)
+    if len(responses) == 1:
+        return responses[0]
+    return merge_matrices(responses)
@@ -0,0 +1,215 @@
+"""
+Guards for the raw PromQL proxy
+  - identical in-flight queries (same normalized expression and evaluation
+    time/range) are coalesced onto one Prometheus request;
+  - a cost estimate (evaluation steps x samples per step x series) rejects
+    expensive queries, or clamps the step of range queries when
+    QUERY_COST_CLAMP_STEP is set;
+  - each user may only run QUERY_MAX_CONCURRENT_PER_USER queries at once,
+    counted in Redis so the limit holds across API workers.
+
+The series count is estimated, not looked up: selectors of the per-resource
+metrics (opspro_*) match one series per exported resource, any other
+selector is assumed to match QUERY_COST_DEFAULT_SERIES series.
+"""
+import math
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, List, NamedTuple, Optional, Tuple
+from redis.exceptions import RedisError
+from app.core.cache import SingleFlight
+from app.core.config import settings
+from app.core.monitoring import (
+    EXPORTED_KEY, QUERY_CLAMPED, QUERY_COALESCED, QUERY_REJECTED, RESOURCE_FAMILIES
+)
+from app.core.redis import async_redis_client
+
+INFLIGHT_PREFIX = "opspro:query:inflight"
+
+RESOURCE_METRIC_NAMES = frozenset(name for name, _ in RESOURCE_FAMILIES)
+
+# PromQL words that look like metric names but are not selectors
+KEYWORDS = frozenset({
+    "by", "without", "on", "ignoring", "group_left", "group_right", "offset", "bool",
+    "and", "or", "unless", "inf", "nan",
+})
+
+_STRING = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|`[^`]*`')
+_LABELS = re.compile(r"\{[^}]*\}")
+_GROUPING = re.compile(r"\b(?:by|without|on|ignoring|group_left|group_right)\s*\([^)]*\)")
+_IDENTIFIER = re.compile(r"(?<![\w:.])([a-zA-Z_:][\w:]*)(?![\w:])(?!\s*\()")
+_RANGE = re.compile(r"\[\s*(\d+[smhdwy](?:\d+[smhdwy])*)\s*(?::[^\]]*)?\]")
+_DURATION_PART = re.compile(r"(\d+)([smhdwy])")
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+
+_flights = SingleFlight()
+_fleet_size: Tuple[float, int] = (0.0, 0)
+
+
+class QueryRejected(Exception):
+    """Raised when a query is refused; carries the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str, reason: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.reason = reason
+        self.headers = {"Retry-After": "1"} if status_code == 429 else None
+
+
+class QueryCost(NamedTuple):
+    series: int
+    steps: int
+    samples_per_step: int
+
+    @property
+    def samples(self) -> int:
+        return self.series * self.steps * self.samples_per_step
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace outside string literals"""
+    parts = []
+    last = 0
+    for match in _STRING.finditer(query):
+        parts.append(" ".join(query[last:match.start()].split()))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(" ".join(query[last:].split()))
+    return "".join(parts).strip()
+
+
+def parse_duration(value: str) -> int:
+    return sum(int(n) * _UNITS[unit] for n, unit in _DURATION_PART.findall(value))
+
+
+def selectors(query: str) -> List[str]:
+    """Metric names selected by the query (label matchers and strings removed)"""
+    bare = _LABELS.sub(" ", _STRING.sub(" ", query))
+    bare = _GROUPING.sub(" ", _RANGE.sub(" ", bare))
+    return [name for name in _IDENTIFIER.findall(bare) if name.lower() not in KEYWORDS]
+
+
+def estimate_series(query: str, fleet_size: int) -> int:
+    names = selectors(query)
+    series = sum(
+        fleet_size if name in RESOURCE_METRIC_NAMES else settings.QUERY_COST_DEFAULT_SERIES
+        for name in names
+    )
+    # Bare label matchers ({job="x"}) select metrics we know nothing about
+    if not names:
+        series = settings.QUERY_COST_DEFAULT_SERIES
+    return max(1, series)
+
+
+def samples_per_step(query: str) -> int:
+    """Samples read per series and step; range selectors read a whole window"""
+    windows = [parse_duration(match) for match in _RANGE.findall(_STRING.sub(" ", query))]
+    if not windows:
+        return 1
+    return max(1, math.ceil(max(windows) / settings.QUERY_COST_SCRAPE_INTERVAL_SECONDS))
+
+
+def estimate_cost(query: str, start: float, end: float, step: float, fleet_size: int) -> QueryCost:
+    return QueryCost(
+        series=estimate_series(query, fleet_size),
+        steps=int((end - start) // step) + 1,
+        samples_per_step=samples_per_step(query)
+    )
+
+
+async def fleet_size() -> int:
+    """Number of exported resources, refreshed every 30s"""
+    global _fleet_size
+    checked_at, size = _fleet_size
+    if time.monotonic() - checked_at >= 30:
+        try:
+            size = await async_redis_client.hlen(EXPORTED_KEY)
+        except RedisError:
+            pass
+        _fleet_size = (time.monotonic(), size)
+    return size
+
+
+def _reject(status_code: int, detail: str, reason: str) -> QueryRejected:
+    QUERY_REJECTED.labels(reason=reason).inc()
+    return QueryRejected(status_code, detail, reason)
+
+
+async def check_instant(query: str):
+    """Reject instant queries reading too many samples"""
+    cost = estimate_cost(query, 0, 0, 1, await fleet_size())
+    if cost.samples > settings.QUERY_MAX_SAMPLES:
+        raise _reject(
+            422, f"Query too expensive: ~{cost.samples:,} samples "
+                 f"(limit {settings.QUERY_MAX_SAMPLES:,}), narrow the selector or range window",
+            "cost"
+        )
+
+
+async def check_range(query: str, start: float, end: float, step: int) -> Tuple[int, Optional[str]]:
+    """
+    Validate a range query. Returns the step to use and, if it was clamped,
+    a warning for the response.
+    """
+    if end < start:
+        raise _reject(400, "end must not be before start", "invalid")
+    fleet = await fleet_size()
+    cost = estimate_cost(query, start, end, step, fleet)
+    if cost.steps <= settings.QUERY_MAX_POINTS and cost.samples <= settings.QUERY_MAX_SAMPLES:
+        return step, None
+
+    per_step = cost.series * cost.samples_per_step
+    if not settings.QUERY_COST_CLAMP_STEP or per_step > settings.QUERY_MAX_SAMPLES:
+        raise _reject(
+            422, f"Query too expensive: {cost.steps:,} steps x ~{per_step:,} samples per step "
+                 f"(limits {settings.QUERY_MAX_POINTS:,} steps, {settings.QUERY_MAX_SAMPLES:,} samples); "
+                 f"use a larger step or a shorter range",
+            "cost"
+        )
+
+    # Smallest step keeping both the resolution and the sample budget
+    max_steps = min(settings.QUERY_MAX_POINTS, settings.QUERY_MAX_SAMPLES // per_step)
+    clamped = max(step, math.ceil((end - start) / max(1, max_steps - 1)))
+    QUERY_CLAMPED.inc()
+    return clamped, f"step raised from {step}s to {clamped}s by the query cost limit"
+
+
+@asynccontextmanager
+async def user_slot(user_id: int):
+    """Hold one of the user's concurrent query slots, or raise QueryRejected (429)"""
+    key = f"{INFLIGHT_PREFIX}:{user_id}"
+    try:
+        async with async_redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            # Leaked slots (crashed worker) expire
+            pipe.expire(key, int(settings.PROMETHEUS_TIMEOUT_SECONDS * 6))
+            running, _ = await pipe.execute()
+    except RedisError:
+        running = None
+
+    if running is None:
+        # No shared counter: do not block queries over it
+        yield
+        return
+    try:
+        if running > settings.QUERY_MAX_CONCURRENT_PER_USER:
+            raise _reject(
+                429, f"Too many concurrent queries (limit {settings.QUERY_MAX_CONCURRENT_PER_USER} per user)",
+                "concurrency"
+            )
+        yield
+    finally:
+        try:
+            await async_redis_client.decr(key)
+        except RedisError:
+            pass
+
+
+async def coalesce(endpoint: str, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Share one in-flight evaluation between identical requests of this process"""
+    result, shared = await _flights.do(f"{endpoint}:{key}", fn)
+    if shared:
+        QUERY_COALESCED.labels(endpoint=endpoint).inc()
+    return result
@@ -0,0 +1,110 @@
+"""
+Stale-resource reaper
+Resources that have not reported for RESOURCE_OFFLINE_AFTER_INTERVALS
+heartbeat intervals are flipped to OFFLINE with one UPDATE (served by the
+partial index on active resources' last_seen), their Prometheus series are
+dropped in bulk, and a heartbeat sample is submitted for each of them so the
+"heartbeat_age" alert rules fire through the regular alert path. The next
+sample of a resource brings it back to ACTIVE and resolves the alert.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, NamedTuple, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.config import settings
+from app.core.monitoring import clear_resources_metrics
+from app.models.resource import Resource, ResourceStatus, ResourceType
+from app.services.alert_engine import HEARTBEAT_METRIC
+from app.services.alert_stream import submit_samples_sync
+from app.services.stats import RESOURCES, counter_field, record
+
+logger = logging.getLogger(__name__)
+
+
+class StaleResource(NamedTuple):
+    id: int
+    name: str
+    ip_address: Optional[str]
+    last_seen: datetime
+    type: ResourceType
+
+
+def offline_cutoff(now: datetime) -> datetime:
+    """Resources last seen before this are considered offline"""
+    return now - timedelta(
+        seconds=settings.RESOURCE_HEARTBEAT_SECONDS * settings.RESOURCE_OFFLINE_AFTER_INTERVALS
+    )
+
+
+def _as_utc(ts: datetime) -> datetime:
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def _record_status_change(db: Session, types: List[ResourceType], old: ResourceStatus, new: ResourceStatus):
+    # Bulk UPDATEs bypass the session events keeping the stats counters
+    record(
+        db, RESOURCES,
+        added=[counter_field(new, t) for t in types],
+        removed=[counter_field(old, t) for t in types]
+    )
+
+
+def reap_stale_resources(db: Session, now: Optional[datetime] = None) -> List[StaleResource]:
+    """
+    Mark active resources that stopped reporting as OFFLINE.
+
+    Returns the resources that were flipped. Resources that never reported
+    (no last_seen) are left alone.
+    """
+    now = _as_utc(now or datetime.now(timezone.utc))
+    table = Resource.__table__
+    stmt = (
+        update(table)
+        .where(
+            table.c.status == ResourceStatus.ACTIVE,
+            table.c.last_seen < offline_cutoff(now)
+        )
+        .values(status=ResourceStatus.OFFLINE)
+        .returning(table.c.id, table.c.name, table.c.ip_address, table.c.last_seen, table.c.type)
+    )
+    stale = [StaleResource(*row) for row in db.execute(stmt)]
+    _record_status_change(db, [r.type for r in stale], ResourceStatus.ACTIVE, ResourceStatus.OFFLINE)
+    db.commit()
+    if not stale:
+        return stale
+
+    logger.warning(f"Marked {len(stale)} resources OFFLINE after missing their heartbeat")
+    clear_resources_metrics(resource.id for resource in stale)
+    # Sample timestamps are naive UTC, like the ingest endpoints'
+    sampled_at = now.replace(tzinfo=None)
+    submit_samples_sync(db, [
+        (
+            resource.id,
+            resource.name,
+            {HEARTBEAT_METRIC: (now - _as_utc(resource.last_seen)).total_seconds()},
+            sampled_at
+        )
+        for resource in stale
+    ])
+    return stale
+
+
+def mark_online(db: Session, resources: List[Resource]):
+    """
+    Flip reporting resources that were reaped back to ACTIVE (caller
+    commits). The status only changes from OFFLINE, so resources put into
+    maintenance or deactivated by hand keep their status.
+    """
+    offline = [resource.id for resource in resources if resource.status == ResourceStatus.OFFLINE]
+    if not offline:
+        return
+    db.query(Resource).filter(
+        Resource.id.in_(offline),
+        Resource.status == ResourceStatus.OFFLINE
+    ).update({Resource.status: ResourceStatus.ACTIVE}, synchronize_session=False)
+    flipped = [resource for resource in resources if resource.id in offline]
+    _record_status_change(db, [r.type for r in flipped], ResourceStatus.OFFLINE, ResourceStatus.ACTIVE)
+    for resource in flipped:
+        set_committed_value(resource, "status", ResourceStatus.ACTIVE)
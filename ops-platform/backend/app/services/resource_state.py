@@ -0,0 +1,203 @@
+"""
+Live resource state cache
+The latest usage values and last_seen of every resource live in a Redis hash
+instead of being UPDATEd on the `resources` row for each sample. Changed
+resources are tracked in a dirty set and written back to Postgres in bulk by
+the `sync_resource_state` beat task; reads overlay the cached values on the
+ORM objects.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from redis.exceptions import RedisError
+from sqlalchemy import and_, bindparam, or_, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.config import settings
+from app.core.redis import async_redis_client, redis_client
+from app.models.resource import Resource
+
+logger = logging.getLogger(__name__)
+
+STATE_PREFIX = "opspro:resource:state"
+DIRTY_KEY = f"{STATE_PREFIX}:dirty"
+
+STATE_FIELDS = ("cpu_usage", "memory_usage", "disk_usage", "network_in", "network_out")
+
+# Resource columns written back by the sync
+SYNCED_COLUMNS = ("cpu_usage", "memory_usage", "disk_usage")
+
+# Only accept a state newer than the cached one (agents may replay old samples)
+STORE_IF_NEWER = """
+local current = redis.call('hget', KEYS[1], 'ts')
+if current and tonumber(current) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('hset', KEYS[1], 'ts', ARGV[1], unpack(ARGV, 4))
+redis.call('expire', KEYS[1], ARGV[3])
+redis.call('sadd', KEYS[2], ARGV[2])
+return 1
+"""
+_store_if_newer = async_redis_client.register_script(STORE_IF_NEWER)
+
+
+def state_key(resource_id: int) -> str:
+    return f"{STATE_PREFIX}:{resource_id}"
+
+
+def _utc(ts: datetime) -> datetime:
+    if ts.tzinfo is None:
+        return ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc)
+
+
+def build_state(metrics, timestamp: datetime) -> Dict[str, object]:
+    """Cacheable state of a ResourceMetrics sample taken at `timestamp` (UTC)"""
+    state = {name: getattr(metrics, name, None) for name in STATE_FIELDS}
+    state["last_seen"] = _utc(timestamp)
+    return state
+
+
+def decode_state(fields: Dict[str, str]) -> Optional[Dict[str, object]]:
+    """Parse a cached hash; None if it is empty"""
+    if not fields or "ts" not in fields:
+        return None
+    state = {name: float(fields[name]) for name in STATE_FIELDS if fields.get(name) not in (None, "")}
+    state["last_seen"] = datetime.fromtimestamp(float(fields["ts"]), tz=timezone.utc)
+    return state
+
+
+def _store_args(resource_id: int, state: Dict[str, object]) -> List:
+    args = [state["last_seen"].timestamp(), resource_id, settings.RESOURCE_STATE_TTL_SECONDS]
+    for name in STATE_FIELDS:
+        value = state.get(name)
+        args += [name, "" if value is None else value]
+    return args
+
+
+async def store_latest(states: Dict[int, Dict[str, object]]) -> bool:
+    """
+    Cache the latest state of resources. Returns False if the cache is
+    disabled or unreachable, in which case the caller writes the row instead.
+    """
+    if not settings.RESOURCE_STATE_ENABLED:
+        return False
+    if not states:
+        return True
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for resource_id, state in states.items():
+                await _store_if_newer(
+                    keys=[state_key(resource_id), DIRTY_KEY],
+                    args=_store_args(resource_id, state),
+                    client=pipe
+                )
+            await pipe.execute()
+        return True
+    except RedisError as e:
+        logger.warning(f"Resource state cache unavailable, updating rows directly: {e}")
+        return False
+
+
+async def load_states(resource_ids: Iterable[int]) -> Dict[int, Dict[str, object]]:
+    """Cached state of the given resources (missing ones are left out)"""
+    resource_ids = list(resource_ids)
+    if not settings.RESOURCE_STATE_ENABLED or not resource_ids:
+        return {}
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for resource_id in resource_ids:
+                pipe.hgetall(state_key(resource_id))
+            replies = await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Resource state cache unavailable, serving stored values: {e}")
+        return {}
+
+    states = {}
+    for resource_id, fields in zip(resource_ids, replies):
+        state = decode_state(fields)
+        if state is not None:
+            states[resource_id] = state
+    return states
+
+
+async def overlay_live_state(resources: List[Resource]) -> List[Resource]:
+    """
+    Replace the stored usage values of the resources with the cached ones.
+    Values are set as committed state, so they are never flushed back by
+    the request's session.
+    """
+    states = await load_states(r.id for r in resources)
+    for resource in resources:
+        state = states.get(resource.id)
+        if not state:
+            continue
+        for name in SYNCED_COLUMNS:
+            if name in state:
+                set_committed_value(resource, name, state[name])
+        set_committed_value(resource, "last_seen", state["last_seen"])
+    return resources
+
+
+async def forget_resource(resource_id: int):
+    """Drop the cached state of a deleted resource"""
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            pipe.delete(state_key(resource_id))
+            pipe.srem(DIRTY_KEY, resource_id)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not drop cached state of resource {resource_id}: {e}")
+
+
+def sync_to_database(engine: Engine, batch_size: int = 1000) -> int:
+    """
+    Write the cached state of changed resources back to `resources` in bulk.
+    Rows already holding a newer last_seen are left alone.
+
+    Returns the number of resources synced.
+    """
+    synced = 0
+    stmt = (
+        update(Resource.__table__)
+        .where(and_(
+            Resource.__table__.c.id == bindparam("b_id"),
+            or_(
+                Resource.__table__.c.last_seen.is_(None),
+                Resource.__table__.c.last_seen < bindparam("b_last_seen")
+            )
+        ))
+        .values(
+            last_seen=bindparam("b_last_seen"),
+            **{name: bindparam(f"b_{name}") for name in SYNCED_COLUMNS}
+        )
+    )
+
+    while True:
+        resource_ids = [int(r) for r in redis_client.spop(DIRTY_KEY, batch_size) or []]
+        if not resource_ids:
+            return synced
+
+        pipe = redis_client.pipeline(transaction=False)
+        for resource_id in resource_ids:
+            pipe.hgetall(state_key(resource_id))
+        params = []
+        for resource_id, fields in zip(resource_ids, pipe.execute()):
+            state = decode_state(fields)
+            if state is None:
+                continue
+            params.append({
+                "b_id": resource_id,
+                "b_last_seen": state["last_seen"],
+                **{f"b_{name}": state.get(name, 0.0) for name in SYNCED_COLUMNS}
+            })
+
+        if params:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(stmt, params)
+            except Exception:
+                # Put them back so the next run retries
+                redis_client.sadd(DIRTY_KEY, *resource_ids)
+                raise
+        synced += len(params)
@@ -0,0 +1,216 @@
+"""
+Executor for blocking SSH work
+probe_server, deploy_agent and uninstall_agent are paramiko calls that take
+seconds (connects, SFTP uploads, waiting for the agent service to start).
+The API runs them on a dedicated pool of SSH_POOL_SIZE threads instead of on
+its event loop, so a slow or unreachable host ties up a pool thread, never
+the worker serving every other request.
+
+  - Jobs for the same host run one at a time: an asyncio lock within the
+    process and a Redis lease across API workers. Waiting for the host does
+    not hold a pool thread.
+  - At most SSH_MAX_QUEUED jobs wait (for their host or for a thread); more
+    are refused with SSHBusy, mapped to HTTP 503 by the handlers.
+  - A job keeps running when the request that started it goes away, so a
+    deploy is never left half done by a client disconnect.
+
+The pool is exported as opspro_ssh_queue_depth, opspro_ssh_pool_busy_threads
+and opspro_ssh_pool_saturation, job durations as opspro_ssh_job_seconds.
+
+Background agent jobs run by the Celery worker take the same host lease with
+hold_host(), so they never overlap with an API probe of their host.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Optional
+from redis.exceptions import RedisError
+from app.core.cache import RELEASE_LOCK
+from app.core.config import settings
+from app.core.monitoring import (
+    SSH_JOB_SECONDS, SSH_POOL_BUSY, SSH_POOL_SATURATION, SSH_QUEUE_DEPTH, SSH_REJECTED
+)
+from app.core.redis import async_redis_client, redis_client
+
+logger = logging.getLogger(__name__)
+
+HOST_LOCK_PREFIX = "opspro:ssh:host"
+
+# How often a job waiting for a host held by another worker retries the lease
+LEASE_POLL_INTERVAL = 0.5
+
+_release_lease = async_redis_client.register_script(RELEASE_LOCK)
+_release_lease_sync = redis_client.register_script(RELEASE_LOCK)
+
+
+class SSHBusy(Exception):
+    """The SSH job could not be started (queue full, host busy for too long)"""
+
+
+class SSHExecutor:
+    """Bounded thread pool for SSH jobs with per-host serialization"""
+
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._hosts: Dict[str, asyncio.Lock] = {}
+        self._host_waiters: Dict[str, int] = {}
+        # Touched from pool threads
+        self._counts_lock = threading.Lock()
+        self._queued = 0
+        self._busy = 0
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ssh")
+        return self._pool
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def busy(self) -> int:
+        return self._busy
+
+    def _adjust(self, queued: int = 0, busy: int = 0):
+        with self._counts_lock:
+            self._queued += queued
+            self._busy += busy
+            SSH_QUEUE_DEPTH.set(self._queued)
+            SSH_POOL_BUSY.set(self._busy)
+            SSH_POOL_SATURATION.set(self._busy / self.workers)
+
+    async def run(self, operation: str, host: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run fn(*args, **kwargs) on the pool once `host` is free and return
+        its result. `operation` labels the job in the metrics and logs.
+        """
+        with self._counts_lock:
+            full = self._queued >= self.max_queued
+        if full:
+            SSH_REJECTED.inc()
+            raise SSHBusy(f"Too many SSH jobs waiting (limit {self.max_queued}), retry later")
+
+        self._adjust(queued=1)
+        job = asyncio.ensure_future(self._run_locked(operation, host, fn, args, kwargs))
+        # The job outlives a cancelled request
+        return await asyncio.shield(job)
+
+    async def _run_locked(self, operation: str, host: str, fn, args, kwargs) -> Any:
+        started = False
+        try:
+            async with self.host_lock(host):
+                future = self.pool.submit(self._call, operation, host, fn, args, kwargs)
+                future.add_done_callback(self._unqueue_cancelled)
+                started = True
+                return await asyncio.wrap_future(future)
+        finally:
+            if not started:
+                self._adjust(queued=-1)
+
+    def _unqueue_cancelled(self, future: Future):
+        # Cancelled by shutdown() before a thread picked it up, so _call never ran
+        if future.cancelled():
+            self._adjust(queued=-1)
+
+    def _call(self, operation: str, host: str, fn, args, kwargs) -> Any:
+        self._adjust(queued=-1, busy=1)
+        began = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - began
+            SSH_JOB_SECONDS.labels(operation=operation).observe(elapsed)
+            logger.info(f"SSH {operation} on {host} took {elapsed:.1f}s")
+            self._adjust(busy=-1)
+
+    @asynccontextmanager
+    async def host_lock(self, host: str):
+        """Exclusive use of `host` by this process, and by the whole API when Redis is up"""
+        lock = self._hosts.setdefault(host, asyncio.Lock())
+        self._host_waiters[host] = self._host_waiters.get(host, 0) + 1
+        try:
+            async with lock:
+                token = await _acquire_lease(host)
+                try:
+                    yield
+                finally:
+                    if token:
+                        await _release(host, token)
+        finally:
+            self._host_waiters[host] -= 1
+            if not self._host_waiters[host]:
+                del self._host_waiters[host]
+                del self._hosts[host]
+
+    def shutdown(self):
+        """Drop queued jobs; running ones finish in their threads"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+async def _acquire_lease(host: str) -> Optional[str]:
+    """Wait for the cross-worker lease of `host`; None when Redis is unavailable"""
+    key = f"{HOST_LOCK_PREFIX}:{host}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.SSH_HOST_WAIT_SECONDS
+    while True:
+        try:
+            # The lease expires should the worker holding it die mid-job
+            if await async_redis_client.set(key, token, nx=True, px=settings.SSH_HOST_LEASE_SECONDS * 1000):
+                return token
+        except RedisError as e:
+            logger.warning(f"SSH host lease unavailable, locking {host} in this process only: {e}")
+            return None
+        if time.monotonic() >= deadline:
+            SSH_REJECTED.inc()
+            raise SSHBusy(f"Host {host} is busy with another SSH job, retry later")
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+
+
+async def _release(host: str, token: str):
+    try:
+        await _release_lease(keys=[f"{HOST_LOCK_PREFIX}:{host}"], args=[token])
+    except RedisError:
+        pass
+
+
+@contextmanager
+def hold_host(host: str, wait: float):
+    """
+    Hold the cross-worker lease of `host` from sync code, waiting up to
+    `wait` seconds for it (SSHBusy after that). Runs unlocked without Redis.
+    """
+    key = f"{HOST_LOCK_PREFIX}:{host}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            if redis_client.set(key, token, nx=True, px=settings.SSH_HOST_LEASE_SECONDS * 1000):
+                break
+        except RedisError as e:
+            logger.warning(f"SSH host lease unavailable, running on {host} unlocked: {e}")
+            token = None
+            break
+        if time.monotonic() >= deadline:
+            raise SSHBusy(f"Host {host} is busy with another SSH job")
+        time.sleep(LEASE_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        if token:
+            try:
+                _release_lease_sync(keys=[key], args=[token])
+            except RedisError:
+                pass
+
+
+ssh_executor = SSHExecutor(settings.SSH_POOL_SIZE, settings.SSH_MAX_QUEUED)
@@ -0,0 +1,335 @@
+"""
+Stats summaries of resources and alerts
+The summary endpoints read per-(status, type) and per-(status, severity)
+counters from Redis hashes instead of counting the tables on every dashboard
+load. The counters are adjusted after each commit that changes them:
+  - ORM inserts, deletes and status/type updates are picked up by session
+    events;
+  - bulk statements (stale-resource reaper, alert engine) report their
+    changes with record().
+The commit hook only queues the changes: a background writer thread merges
+whatever has queued up and applies it in one pipeline, so a slow or
+unreachable Redis never holds up the committing thread (or the event loop of
+an async handler committing through run_sync).
+
+The `reconcile_stats` beat task recounts both tables with one GROUP BY query
+each and overwrites the counters, correcting drift (a worker dying between
+commit and increment, a change racing the previous recount). Without Redis,
+or while the counters are not seeded, the summaries are served from the
+GROUP BY query.
+"""
+import logging
+import os
+import queue
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from redis.exceptions import RedisError
+from sqlalchemy import event, func, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+from app.core.config import settings
+from app.core.monitoring import STATS_DRIFT
+from app.core.redis import async_redis_client, redis_client
+from app.models.alert import Alert, AlertSeverity, AlertStatus
+from app.models.resource import Resource, ResourceStatus, ResourceType
+
+logger = logging.getLogger(__name__)
+
+STATS_PREFIX = "opspro:stats"
+# Present in a counter hash once it holds a full count
+SEEDED = "seeded"
+# Session.info entry holding the changes of the current transaction
+PENDING = "stats_changes"
+
+# Adjust only complete counters; an unseeded hash is filled by the next read
+ADJUST_IF_SEEDED = """
+if redis.call('hexists', KEYS[1], 'seeded') == 0 then
+    return 0
+end
+for i = 1, #ARGV, 2 do
+    redis.call('hincrby', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+_adjust = redis_client.register_script(ADJUST_IF_SEEDED)
+
+
+class CountedModel(NamedTuple):
+    name: str
+    model: type
+    group: str
+    kind: str
+
+    @property
+    def key(self) -> str:
+        return f"{STATS_PREFIX}:{self.name}"
+
+
+RESOURCES = CountedModel("resources", Resource, "status", "type")
+ALERTS = CountedModel("alerts", Alert, "status", "severity")
+COUNTED = {Resource: RESOURCES, Alert: ALERTS}
+
+
+def counter_field(group, kind) -> str:
+    """Hash field of a (status, type/severity) pair, by enum name as stored in the database"""
+    return f"{getattr(group, 'name', group)}:{getattr(kind, 'name', kind)}"
+
+
+def count_from_db(db: Session, counted: CountedModel) -> Dict[str, int]:
+    """Count the table with a single GROUP BY query"""
+    group = getattr(counted.model, counted.group)
+    kind = getattr(counted.model, counted.kind)
+    rows = db.query(group, kind, func.count()).group_by(group, kind).all()
+    return {counter_field(g, k): n for g, k, n in rows}
+
+
+def _totals(counts: Dict[str, int], position: int) -> Counter:
+    totals = Counter()
+    for field, n in counts.items():
+        totals[field.split(":")[position]] += n
+    return totals
+
+
+def summarize_resources(counts: Dict[str, int]) -> Dict[str, object]:
+    by_status = _totals(counts, 0)
+    by_type = _totals(counts, 1)
+    return {
+        "total": sum(counts.values()),
+        "active": by_status[ResourceStatus.ACTIVE.name],
+        "inactive": by_status[ResourceStatus.INACTIVE.name],
+        "by_type": {t.value: by_type[t.name] for t in ResourceType},
+    }
+
+
+def summarize_alerts(counts: Dict[str, int]) -> Dict[str, object]:
+    by_status = _totals(counts, 0)
+    by_severity = _totals(counts, 1)
+    return {
+        "total": sum(counts.values()),
+        "firing": by_status[AlertStatus.FIRING.name],
+        "acknowledged": by_status[AlertStatus.ACKNOWLEDGED.name],
+        "resolved": by_status[AlertStatus.RESOLVED.name],
+        "by_severity": {s.value: by_severity[s.name] for s in AlertSeverity},
+    }
+
+
+# --- Recording changes ---
+
+def record(db: Session, counted: CountedModel, added: Iterable[str] = (), removed: Iterable[str] = ()):
+    """Count rows entering/leaving counter fields; applied when `db` commits"""
+    pending = db.info.setdefault(PENDING, {})
+    if counted.name in pending and pending[counted.name] is None:
+        return
+    changes = pending.setdefault(counted.name, Counter())
+    for field in added:
+        changes[field] += 1
+    for field in removed:
+        changes[field] -= 1
+
+
+def invalidate(db: Session, counted: CountedModel):
+    """The change cannot be counted: drop the counters on commit, the next read recounts"""
+    db.info.setdefault(PENDING, {})[counted.name] = None
+
+
+def apply_changes(pending: Dict[str, Optional[Counter]]):
+    """Apply committed changes to the counters (errors are left to the reconciler)"""
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            for name, changes in pending.items():
+                key = f"{STATS_PREFIX}:{name}"
+                if changes is None:
+                    pipe.delete(key)
+                    continue
+                args = [arg for field, n in changes.items() if n for arg in (field, n)]
+                if args:
+                    _adjust(keys=[key], args=args, client=pipe)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Could not update the stats counters: {e}")
+
+
+def merge_changes(batches: List[Dict[str, Optional[Counter]]]) -> Dict[str, Optional[Counter]]:
+    """Sum the changes of several commits; a dropped counter stays dropped"""
+    merged: Dict[str, Optional[Counter]] = {}
+    for pending in batches:
+        for name, changes in pending.items():
+            if name in merged and merged[name] is None:
+                continue
+            if changes is None:
+                merged[name] = None
+            else:
+                merged.setdefault(name, Counter()).update(changes)
+    return merged
+
+
+class CounterWriter:
+    """Applies committed changes from a daemon thread, merging those queued meanwhile"""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def submit(self, pending: Dict[str, Optional[Counter]]):
+        self._ensure_running()
+        self._queue.put(pending)
+
+    def flush(self):
+        """Wait until everything submitted so far has been applied"""
+        self._queue.join()
+
+    def _ensure_running(self):
+        # A forked worker inherits the queue but not the thread
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._run, name="stats-counter-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batches = [self._queue.get()]
+            while True:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                apply_changes(merge_changes(batches))
+            except Exception:
+                logger.exception("Stats counter writer failed, leaving the counters to the reconciler")
+            finally:
+                for _ in batches:
+                    self._queue.task_done()
+
+
+counter_writer = CounterWriter()
+
+
+def _values(obj, counted: CountedModel, before: bool):
+    """(group, kind) of obj before or after the flush; NO_VALUE if not loaded"""
+    values = []
+    for attr in (counted.group, counted.kind):
+        state = inspect(obj).attrs[attr]
+        history = state.history
+        if before and history.deleted:
+            values.append(history.deleted[0])
+        elif before and history.added:
+            # Set on an expired object: the old value was never loaded
+            values.append(NO_VALUE)
+        elif history.added:
+            values.append(history.added[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(state.loaded_value)
+    return values
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context):
+    if not settings.STATS_COUNTERS_ENABLED:
+        return
+    for objects, before, after in (
+        (session.new, False, True),
+        (session.deleted, True, False),
+        (session.dirty, True, True),
+    ):
+        for obj in objects:
+            counted = COUNTED.get(type(obj))
+            if counted is None:
+                continue
+            if before and after and not any(
+                inspect(obj).attrs[attr].history.has_changes() for attr in (counted.group, counted.kind)
+            ):
+                continue
+            old = _values(obj, counted, before=True) if before else None
+            new = _values(obj, counted, before=False) if after else None
+            if NO_VALUE in (old or ()) or NO_VALUE in (new or ()):
+                invalidate(session, counted)
+                continue
+            record(
+                session, counted,
+                added=[counter_field(*new)] if new else (),
+                removed=[counter_field(*old)] if old else ()
+            )
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_on_commit(session: Session):
+    pending = session.info.pop(PENDING, None)
+    if pending:
+        counter_writer.submit(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session: Session):
+    session.info.pop(PENDING, None)
+
+
+# --- Reading and reconciling ---
+
+def _store_counts(pipe, counted: CountedModel, counts: Dict[str, int]):
+    pipe.delete(counted.key)
+    pipe.hset(counted.key, mapping={SEEDED: 1, **counts})
+
+
+async def get_counts(db: AsyncSession, counted: CountedModel) -> Dict[str, int]:
+    """Counters from Redis; recounted (and seeded) from the database if missing"""
+    fields = None
+    if settings.STATS_COUNTERS_ENABLED:
+        try:
+            fields = await async_redis_client.hgetall(counted.key)
+        except RedisError as e:
+            logger.warning(f"Stats counters unavailable, counting {counted.name} in the database: {e}")
+        if fields and fields.pop(SEEDED, None) is not None:
+            return {field: int(n) for field, n in fields.items()}
+
+    counts = await db.run_sync(count_from_db, counted)
+    if fields is not None:
+        try:
+            async with async_redis_client.pipeline(transaction=True) as pipe:
+                _store_counts(pipe, counted, counts)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Could not seed the {counted.name} stats counters: {e}")
+    return counts
+
+
+async def resource_stats(db: AsyncSession) -> Dict[str, object]:
+    return summarize_resources(await get_counts(db, RESOURCES))
+
+
+async def alert_stats(db: AsyncSession) -> Dict[str, object]:
+    return summarize_alerts(await get_counts(db, ALERTS))
+
+
+def reconcile(db: Session) -> Dict[str, int]:
+    """
+    Overwrite the counters with a recount. Returns the drift found per
+    counter (sum of absolute differences, 0 for counters that were not seeded).
+    """
+    drift = {}
+    for counted in COUNTED.values():
+        counts = count_from_db(db, counted)
+        current = redis_client.hgetall(counted.key)
+        off = 0
+        if current.pop(SEEDED, None) is not None:
+            off = sum(abs(int(current.get(field, 0)) - counts.get(field, 0)) for field in set(current) | set(counts))
+        if off:
+            STATS_DRIFT.labels(stats=counted.name).inc(off)
+            logger.warning(f"Corrected a drift of {off} in the {counted.name} stats counters")
+        with redis_client.pipeline(transaction=True) as pipe:
+            _store_counts(pipe, counted, counts)
+            pipe.execute()
+        drift[counted.name] = off
+    return drift
@@ -0,0 +1,65 @@
+"""
+Background agent deploy/uninstall jobs and fleet-wide rollouts
+"""
+from celery.exceptions import SoftTimeLimitExceeded
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services.agent_jobs import fail_pending, reap_stale_jobs, run_job
+from app.models.agent_job import AgentRollout
+from app.models.task import TaskStatus
+from app.services.agent_rollout import end_rollout, reap_stale_rollouts, run_rollout
+from app.services.ssh_executor import SSHBusy
+from app.tasks.celery_app import celery_app
+
+
+@celery_app.task(bind=True, acks_late=True, max_retries=None)
+def run_agent_job(self, job_id: int):
+    """Deploy or uninstall the agent of a job recorded by the API, reporting step progress"""
+    db = SessionLocal()
+    try:
+        try:
+            job = run_job(db, job_id)
+        except SSHBusy as e:
+            # Retried instead of holding this worker slot while the host is busy
+            if self.request.retries * settings.AGENT_JOB_BUSY_RETRY_SECONDS < settings.SSH_HOST_LEASE_SECONDS:
+                raise self.retry(countdown=settings.AGENT_JOB_BUSY_RETRY_SECONDS, exc=e)
+            job = fail_pending(db, job_id, f"{e} for {settings.SSH_HOST_LEASE_SECONDS}s")
+        if job is None:
+            return {"job_id": job_id, "missing": True}
+        # Read while the session is open (the job expired on commit)
+        return {"job_id": job_id, "status": job.status.value}
+    finally:
+        db.close()
+
+
+@celery_app.task
+def reap_stale_agent_jobs():
+    """Fail agent jobs and rollouts left RUNNING by a worker that died"""
+    db = SessionLocal()
+    try:
+        return {"failed": reap_stale_jobs(db), "failed_rollouts": reap_stale_rollouts(db)}
+    finally:
+        db.close()
+
+
+@celery_app.task(
+    time_limit=settings.ROLLOUT_TIME_LIMIT_SECONDS,
+    soft_time_limit=settings.ROLLOUT_TIME_LIMIT_SECONDS - 60
+)
+def run_agent_rollout(rollout_id: int):
+    """Deploy the agent to the hosts of a rollout, batch after batch, on a thread pool"""
+    db = SessionLocal()
+    try:
+        try:
+            rollout = run_rollout(db, rollout_id, SessionLocal)
+        except SoftTimeLimitExceeded:
+            db.rollback()
+            rollout = db.get(AgentRollout, rollout_id)
+            if rollout is not None:
+                end_rollout(db, rollout, TaskStatus.FAILED, "Rollout time limit reached")
+        if rollout is None:
+            return {"rollout_id": rollout_id, "missing": True}
+        # Read while the session is open (the rollout expired on commit)
+        return {"rollout_id": rollout_id, "status": rollout.status.value}
+    finally:
+        db.close()
@@ -0,0 +1,239 @@
+"""
+Alert evaluation worker
+Consumes the sharded sample streams published by the ingest endpoints
+(app/services/alert_stream.py) and evaluates alert rules in batches.
+
+Run one or more instances with:
+    python -m app.tasks.alert_worker
+
+All workers share one consumer group. Each shard stream is owned by a single
+worker at a time through a short Redis lease, so samples of a resource are
+evaluated in order; shards are rebalanced as workers come and go, and a new
+owner first claims the entries its predecessor left unacknowledged.
+"""
+import logging
+import math
+import os
+import signal
+import socket
+import time
+from typing import Dict, List, Optional, Set
+import redis
+from redis.exceptions import RedisError, ResponseError
+from sqlalchemy.exc import SQLAlchemyError
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis import redis_client
+from app.services.alert_engine import AlertEngine, apply_transitions
+from app.services.alert_stream import CONSUMER_GROUP, STREAM_PREFIX, decode_sample, stream_key
+
+logger = logging.getLogger(__name__)
+
+WORKERS_KEY = f"{STREAM_PREFIX}:workers"
+
+# Renew the lease only if we still hold it / release only our own lease
+RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_key(shard: int) -> str:
+    return f"{STREAM_PREFIX}:lease:{shard}"
+
+
+def target_shards(shards: int, workers: int) -> int:
+    """Shards each worker should own for an even spread"""
+    return math.ceil(shards / max(1, workers))
+
+
+class AlertWorker:
+    """Stream consumer owning a subset of the shard streams"""
+
+    def __init__(
+        self,
+        client: redis.Redis = redis_client,
+        shards: int = settings.ALERT_STREAM_SHARDS,
+        batch_size: int = settings.ALERT_WORKER_BATCH_SIZE,
+        lease_seconds: int = settings.ALERT_WORKER_LEASE_SECONDS,
+        engine: Optional[AlertEngine] = None
+    ):
+        self.redis = client
+        self.shards = shards
+        self.batch_size = batch_size
+        self.lease_ms = lease_seconds * 1000
+        self.engine = engine or AlertEngine()
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.owned: Set[int] = set()
+        # Shards whose pending (delivered, unacknowledged) entries must be re-read
+        self.backlog: Set[int] = set()
+        self._renew = self.redis.register_script(RENEW_LEASE)
+        self._release = self.redis.register_script(RELEASE_LEASE)
+        self._last_rebalance = 0.0
+        self._stopping = False
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def ensure_groups(self):
+        for shard in range(self.shards):
+            try:
+                self.redis.xgroup_create(stream_key(shard), CONSUMER_GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+
+    def rebalance(self):
+        """Heartbeat, renew our leases and converge on our fair share of shards"""
+        now = time.time()
+        self.redis.zadd(WORKERS_KEY, {self.consumer: now})
+        self.redis.zremrangebyscore(WORKERS_KEY, 0, now - self.lease_ms / 1000)
+        target = target_shards(self.shards, self.redis.zcard(WORKERS_KEY))
+
+        for shard in list(self.owned):
+            if not self._renew(keys=[lease_key(shard)], args=[self.consumer, self.lease_ms]):
+                logger.warning(f"Lost lease on alert shard {shard}")
+                self.owned.discard(shard)
+                self.backlog.discard(shard)
+
+        while len(self.owned) > target:
+            shard = max(self.owned)
+            self._release(keys=[lease_key(shard)], args=[self.consumer])
+            self.owned.discard(shard)
+            self.backlog.discard(shard)
+
+        for shard in range(self.shards):
+            if len(self.owned) >= target:
+                break
+            if shard in self.owned:
+                continue
+            if self.redis.set(lease_key(shard), self.consumer, nx=True, px=self.lease_ms):
+                self.owned.add(shard)
+                self._claim_pending(shard)
+
+        self._last_rebalance = time.monotonic()
+
+    def _claim_pending(self, shard: int):
+        """Take over entries other consumers read but never acknowledged"""
+        key = stream_key(shard)
+        start = "0-0"
+        while True:
+            start, _, *_ = self.redis.xautoclaim(
+                key, CONSUMER_GROUP, self.consumer, min_idle_time=0, start_id=start,
+                count=self.batch_size, justid=True
+            )
+            if start in ("0-0", b"0-0"):
+                break
+        self.backlog.add(shard)
+
+        # Forget consumers of dead workers once they hold nothing
+        for info in self.redis.xinfo_consumers(key, CONSUMER_GROUP):
+            if (info["name"] != self.consumer and info["pending"] == 0
+                    and info["idle"] > 4 * self.lease_ms):
+                self.redis.xgroup_delconsumer(key, CONSUMER_GROUP, info["name"])
+
+    def read_batch(self):
+        streams = {
+            stream_key(shard): "0" if shard in self.backlog else ">"
+            for shard in sorted(self.owned)
+        }
+        if not streams:
+            time.sleep(1)
+            return []
+        block = None if self.backlog else 1000
+        return self.redis.xreadgroup(
+            CONSUMER_GROUP, self.consumer, streams, count=self.batch_size, block=block
+        ) or []
+
+    def process(self, response) -> bool:
+        """Evaluate one XREADGROUP response; acknowledge it only once persisted"""
+        samples = []
+        acks: Dict[str, List[str]] = {}
+        for key, entries in response:
+            shard = int(key.rsplit(":", 1)[1])
+            if not entries:
+                # Pending entries of this shard are drained
+                self.backlog.discard(shard)
+                continue
+            for entry_id, fields in entries:
+                acks.setdefault(key, []).append(entry_id)
+                try:
+                    samples.append(decode_sample(fields))
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.error(f"Dropping malformed alert sample {entry_id} on {key}: {e}")
+
+        if not acks:
+            return True
+
+        db = SessionLocal()
+        try:
+            self.engine.ensure_loaded(db)
+            transitions = []
+            for resource_id, resource_name, values, timestamp in samples:
+                transitions += self.engine.evaluate(resource_id, values, timestamp, resource_name)
+            if transitions:
+                apply_transitions(db, transitions)
+                db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            self.engine.invalidate()
+            # Leave the entries pending and re-read them on the next round
+            self.backlog.update(int(key.rsplit(":", 1)[1]) for key in acks)
+            logger.error(f"Alert evaluation of {len(samples)} samples failed: {e}")
+            return False
+        finally:
+            db.close()
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key, ids in acks.items():
+            pipe.xack(key, CONSUMER_GROUP, *ids)
+        pipe.execute()
+        return True
+
+    def run(self):
+        logger.info(f"Alert worker {self.consumer} starting ({self.shards} shards)")
+        self.ensure_groups()
+        while not self._stopping:
+            try:
+                if time.monotonic() - self._last_rebalance >= self.lease_ms / 3000:
+                    self.rebalance()
+                if not self.process(self.read_batch()):
+                    time.sleep(1)
+            except RedisError as e:
+                logger.error(f"Alert worker Redis error: {e}")
+                time.sleep(2)
+        self.shutdown()
+
+    def shutdown(self):
+        """Hand our shards back right away instead of waiting for the leases to expire"""
+        try:
+            for shard in self.owned:
+                self._release(keys=[lease_key(shard)], args=[self.consumer])
+            self.redis.zrem(WORKERS_KEY, self.consumer)
+        except RedisError as e:
+            logger.warning(f"Alert worker shutdown: {e}")
+        self.owned.clear()
+        logger.info(f"Alert worker {self.consumer} stopped")
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    worker = AlertWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
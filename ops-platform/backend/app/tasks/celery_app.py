@@ -1,11 +1,18 @@
 from celery import Celery
+from celery.schedules import crontab
 from app.core.config import settings
 
 # Initialize Celery app
 celery_app = Celery(
     "ops-platform",
     broker=settings.REDIS_URL,
-    backend=settings.REDIS_URL
+    backend=settings.REDIS_URL,
+    include=[
+        "app.tasks.metric_maintenance",
+        "app.tasks.resource_state",
+        "app.tasks.stats",
+        "app.tasks.agent_jobs",
+    ]
 )
 
 # Celery configuration
@@ -20,6 +27,45 @@ celery_app.conf.update(
     task_soft_time_limit=25 * 60,  # 25 minutes
 )
 
+# Periodic tasks (run by celery beat)
+celery_app.conf.beat_schedule = {
+    "maintain-metric-partitions": {
+        "task": "app.tasks.metric_maintenance.maintain_metric_partitions",
+        "schedule": crontab(minute=5),  # hourly, partitions are premade days ahead
+    },
+    "refresh-metric-rollups-1m": {
+        "task": "app.tasks.metric_maintenance.refresh_metric_rollups",
+        "schedule": 60.0,
+        "args": ("1m",),
+    },
+    "refresh-metric-rollups-5m": {
+        "task": "app.tasks.metric_maintenance.refresh_metric_rollups",
+        "schedule": 300.0,
+        "args": ("5m",),
+    },
+    "refresh-metric-rollups-1h": {
+        "task": "app.tasks.metric_maintenance.refresh_metric_rollups",
+        "schedule": crontab(minute=2),
+        "args": ("1h",),
+    },
+    "sync-resource-state": {
+        "task": "app.tasks.resource_state.sync_resource_state",
+        "schedule": float(settings.RESOURCE_STATE_SYNC_SECONDS),
+    },
+    "reap-stale-resources": {
+        "task": "app.tasks.resource_state.reap_stale_resources",
+        "schedule": float(settings.RESOURCE_REAPER_SECONDS),
+    },
+    "reconcile-stats": {
+        "task": "app.tasks.stats.reconcile_stats",
+        "schedule": float(settings.STATS_RECONCILE_SECONDS),
+    },
+    "reap-stale-agent-jobs": {
+        "task": "app.tasks.agent_jobs.reap_stale_agent_jobs",
+        "schedule": 300.0,
+    },
+}
+
 # Auto-discover tasks
 celery_app.autodiscover_tasks(['app.tasks'])
 
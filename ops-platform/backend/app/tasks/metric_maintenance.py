@@ -0,0 +1,29 @@
+"""
+Periodic maintenance of the metrics time-series tables
+"""
+import logging
+from app.core.database import engine
+from app.services.metric_partitions import maintain_partitions
+from app.services.metric_rollups import ROLLUP_LEVELS_BY_NAME, refresh_rollups, purge_expired_rollups
+from app.tasks.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task
+def maintain_metric_partitions():
+    """Create upcoming daily partitions and drop the ones past retention"""
+    summary = maintain_partitions(engine)
+    return {
+        "created": len(summary["created"]),
+        "dropped": len(summary["dropped"])
+    }
+
+
+@celery_app.task
+def refresh_metric_rollups(level: str):
+    """Incrementally refresh one rollup level ("1m", "5m" or "1h") and purge expired buckets"""
+    rollup_level = ROLLUP_LEVELS_BY_NAME[level]
+    upserted = refresh_rollups(engine, rollup_level)
+    purged = purge_expired_rollups(engine, rollup_level)
+    return {"level": level, "upserted": upserted, "purged": purged}
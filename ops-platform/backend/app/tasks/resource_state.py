@@ -0,0 +1,48 @@
+"""
+Periodic write-back of the live resource state cache, and the stale-resource
+reaper that runs on top of it
+"""
+import logging
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.core.database import SessionLocal, engine
+from app.core.monitoring import prune_exported
+from app.services import resource_reaper
+from app.services.resource_state import sync_to_database
+from app.tasks.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task
+def sync_resource_state():
+    """Bulk-write cached usage values and last_seen of changed resources to Postgres"""
+    synced = sync_to_database(engine)
+    return {"synced": synced}
+
+
+@celery_app.task
+def reap_stale_resources():
+    """Mark resources that missed their heartbeat OFFLINE, raise heartbeat alerts and prune long-silent series"""
+    if settings.RESOURCE_STATE_ENABLED:
+        # last_seen lives in Redis first; bring the rows up to date before
+        # judging them, and skip the round if that is not possible
+        try:
+            sync_to_database(engine)
+        except RedisError as e:
+            logger.warning(f"Skipping stale-resource reaping, resource state unavailable: {e}")
+            return {"offline": 0, "skipped": True}
+
+    db = SessionLocal()
+    try:
+        stale = resource_reaper.reap_stale_resources(db)
+    finally:
+        db.close()
+
+    # Resources silent for much longer (deleted, decommissioned) leave the exported set
+    try:
+        pruned = prune_exported()
+    except RedisError as e:
+        logger.warning(f"Could not prune exported resources: {e}")
+        pruned = 0
+    return {"offline": len(stale), "unexported": pruned}
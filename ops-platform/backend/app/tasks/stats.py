@@ -0,0 +1,20 @@
+"""
+Reconciliation of the stats summary counters
+"""
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.services import stats
+from app.tasks.celery_app import celery_app
+
+
+@celery_app.task
+def reconcile_stats():
+    """Recount resources and alerts and overwrite the counters served by the summaries"""
+    if not settings.STATS_COUNTERS_ENABLED:
+        return {"skipped": True}
+    db = SessionLocal()
+    try:
+        drift = stats.reconcile(db)
+    finally:
+        db.close()
+    return {"drift": drift}
@@ -0,0 +1,121 @@
+"""
+Load benchmark of the API's hot path
+
+Runs concurrent metric ingest (POST /resources/metrics/batch) next to
+dashboard readers (GET /monitoring/dashboard) against a running backend for
+a fixed duration, then reports throughput and p50/p95/p99 latency per
+endpoint. Run it against the sync and the async session builds to compare
+how far one slow query holds up the other requests of a worker.
+
+Ingest samples go to the first --resources resource ids, which must exist
+(create_sample_resources.py).
+
+Usage:
+    python benchmark_api_load.py [--url http://localhost:8000/api/v1]
+        [--username admin --password admin123 | --token TOKEN]
+        [--ingest-clients 16] [--dashboard-clients 16]
+        [--duration 30] [--resources 100] [--batch-size 20]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import defaultdict
+import httpx
+
+
+def percentile(durations, q: float) -> float:
+    ordered = sorted(durations)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def sample(resource_id: int) -> dict:
+    return {
+        "resource_id": resource_id,
+        "cpu_usage": round(random.uniform(0, 100), 1),
+        "memory_usage": round(random.uniform(0, 100), 1),
+        "disk_usage": round(random.uniform(0, 100), 1),
+        "network_in": round(random.uniform(0, 50), 2),
+        "network_out": round(random.uniform(0, 50), 2)
+    }
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/auth/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def worker(client, name: str, request, deadline: float, durations, errors):
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await request()
+            if response.status_code >= 400:
+                errors[name] += 1
+        except httpx.HTTPError:
+            errors[name] += 1
+        durations[name].append((time.perf_counter() - started) * 1000)
+
+
+def report(name: str, durations, errors: int, seconds: float):
+    if not durations:
+        print(f"  {name:<22} no requests completed")
+        return
+    print(f"  {name:<22} {len(durations) / seconds:7.1f} req/s   "
+          f"p50 {statistics.median(durations):7.1f} ms   "
+          f"p95 {percentile(durations, 0.95):7.1f} ms   "
+          f"p99 {percentile(durations, 0.99):7.1f} ms   "
+          f"errors {errors}")
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.ingest_clients + args.dashboard_clients)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        token = args.token or await login(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        def ingest():
+            ids = random.sample(range(1, args.resources + 1), min(args.batch_size, args.resources))
+            return client.post("/resources/metrics/batch", json={"samples": [sample(i) for i in ids]})
+
+        def dashboard():
+            return client.get("/monitoring/dashboard")
+
+        durations, errors = defaultdict(list), defaultdict(int)
+        deadline = time.monotonic() + args.duration
+        started = time.monotonic()
+        await asyncio.gather(
+            *(worker(client, "POST metrics/batch", ingest, deadline, durations, errors)
+              for _ in range(args.ingest_clients)),
+            *(worker(client, "GET dashboard", dashboard, deadline, durations, errors)
+              for _ in range(args.dashboard_clients))
+        )
+        seconds = time.monotonic() - started
+
+    print(f"{args.ingest_clients} ingest + {args.dashboard_clients} dashboard clients "
+          f"for {seconds:.0f}s against {args.url}:")
+    for name in ("POST metrics/batch", "GET dashboard"):
+        report(name, durations[name], errors[name], seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000/api/v1")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--token")
+    parser.add_argument("--ingest-clients", type=int, default=16)
+    parser.add_argument("--dashboard-clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--resources", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=20)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+    print("\n✓ Benchmark finished")
+
+
+if __name__ == "__main__":
+    main()
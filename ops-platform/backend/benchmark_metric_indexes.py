@@ -0,0 +1,242 @@
+"""
+Benchmark metric table indexes
+
+Loads a synthetic dataset (100M metric rows by default) into a scratch schema
+laid out like the production tables (daily range partitions), then runs
+EXPLAIN (ANALYZE, BUFFERS) on the history and top-processes queries twice:
+with the legacy single-column indexes and with the composite
+(resource_id, timestamp DESC) + BRIN(timestamp) indexes.
+
+Usage:
+    python benchmark_metric_indexes.py [--resources 1000] [--days 35] [--interval 30]
+                                       [--process-interval 150] [--keep]
+
+1000 resources reporting every 30s for 35 days is ~100.8M metric rows
+(~20GB with indexes); make sure the database has room for it.
+"""
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+from sqlalchemy import create_engine
+from app.core.config import settings
+
+SCHEMA = "metrics_bench"
+
+TABLES = {
+    "metrics": """
+        id BIGSERIAL NOT NULL,
+        resource_id INTEGER NOT NULL,
+        cpu_usage FLOAT NOT NULL,
+        memory_usage FLOAT NOT NULL,
+        disk_usage FLOAT NOT NULL,
+        network_in FLOAT DEFAULT 0.0,
+        network_out FLOAT DEFAULT 0.0,
+        extra_data JSON DEFAULT '{{}}',
+        timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL
+    """,
+    "process_metrics": """
+        id BIGSERIAL NOT NULL,
+        resource_id INTEGER NOT NULL,
+        process_name VARCHAR(255) NOT NULL,
+        process_pid INTEGER NOT NULL,
+        cpu_percent FLOAT DEFAULT 0.0,
+        memory_percent FLOAT DEFAULT 0.0,
+        timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL
+    """,
+}
+
+LEGACY_INDEXES = [
+    "CREATE INDEX ix_{table}_resource_id ON {schema}.{table} (resource_id)",
+    "CREATE INDEX ix_{table}_timestamp ON {schema}.{table} (timestamp)",
+]
+
+NEW_INDEXES = [
+    "CREATE INDEX ix_{table}_resource_id_timestamp ON {schema}.{table} (resource_id, timestamp DESC)",
+    "CREATE INDEX ix_{table}_timestamp_brin ON {schema}.{table} USING brin (timestamp)",
+]
+
+# The queries issued by GET /resources/{id}/metrics/history (raw resolution)
+# and GET /resources/{id}/processes
+QUERIES = {
+    "history (24h raw)": """
+        SELECT * FROM {schema}.metrics
+        WHERE resource_id = %(resource_id)s
+          AND timestamp >= %(until)s::timestamp - INTERVAL '24 hours'
+          AND timestamp <= %(until)s::timestamp
+        ORDER BY timestamp ASC
+    """,
+    "top processes (5m)": """
+        SELECT * FROM {schema}.process_metrics
+        WHERE resource_id = %(resource_id)s
+          AND timestamp >= %(until)s::timestamp - INTERVAL '5 minutes'
+          AND timestamp <= %(until)s::timestamp
+        ORDER BY timestamp DESC
+        LIMIT 10
+    """,
+    "fleet range (1h)": """
+        SELECT resource_id, avg(cpu_usage) FROM {schema}.metrics
+        WHERE timestamp >= %(until)s::timestamp - INTERVAL '1 hour'
+          AND timestamp < %(until)s::timestamp
+        GROUP BY resource_id
+    """,
+}
+
+
+def execute(cur, sql, params=None):
+    cur.execute(sql.format(schema=SCHEMA), params)
+
+
+def create_schema(cur, first_day, days):
+    """Partitioned copies of the metric tables, one partition per day"""
+    execute(cur, "DROP SCHEMA IF EXISTS {schema} CASCADE")
+    execute(cur, "CREATE SCHEMA {schema}")
+    for table, columns in TABLES.items():
+        execute(cur, f"""
+            CREATE TABLE {{schema}}.{table} (
+                {columns},
+                PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        """)
+        for offset in range(days + 1):
+            day = first_day + timedelta(days=offset)
+            execute(
+                cur,
+                f"CREATE TABLE {{schema}}.{table}_p{day:%Y%m%d} PARTITION OF {{schema}}.{table} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            )
+
+
+def load_data(conn, first_day, days, resources, interval, process_interval):
+    """Fill the tables one day at a time, in time order like the real ingest path"""
+    cur = conn.cursor()
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        started = time.perf_counter()
+        execute(cur, """
+            INSERT INTO {schema}.metrics
+                (resource_id, cpu_usage, memory_usage, disk_usage, network_in, network_out, timestamp)
+            SELECT r, random() * 100, random() * 100, 40 + random() * 20, random() * 10, random() * 10, ts
+            FROM generate_series(%(day)s::timestamp,
+                                 %(day)s::timestamp + INTERVAL '1 day' - make_interval(secs => %(step)s),
+                                 make_interval(secs => %(step)s)) AS ts
+            CROSS JOIN generate_series(1, %(resources)s) AS r
+            ORDER BY ts
+        """, {"day": day, "step": interval, "resources": resources})
+        metric_rows = cur.rowcount
+        execute(cur, """
+            INSERT INTO {schema}.process_metrics
+                (resource_id, process_name, process_pid, cpu_percent, memory_percent, timestamp)
+            SELECT r, 'proc' || p, 1000 + p, random() * 50, random() * 20, ts
+            FROM generate_series(%(day)s::timestamp,
+                                 %(day)s::timestamp + INTERVAL '1 day' - make_interval(secs => %(step)s),
+                                 make_interval(secs => %(step)s)) AS ts
+            CROSS JOIN generate_series(1, %(resources)s) AS r
+            CROSS JOIN generate_series(1, 5) AS p
+            ORDER BY ts
+        """, {"day": day, "step": process_interval, "resources": resources})
+        conn.commit()
+        print(f"  {day}: {metric_rows:,} metric rows, {cur.rowcount:,} process rows "
+              f"({time.perf_counter() - started:.1f}s)")
+
+
+def build_indexes(conn, statements):
+    cur = conn.cursor()
+    for table in TABLES:
+        execute(cur, f"DROP INDEX IF EXISTS {{schema}}.ix_{table}_resource_id")
+        execute(cur, f"DROP INDEX IF EXISTS {{schema}}.ix_{table}_timestamp")
+        execute(cur, f"DROP INDEX IF EXISTS {{schema}}.ix_{table}_resource_id_timestamp")
+        execute(cur, f"DROP INDEX IF EXISTS {{schema}}.ix_{table}_timestamp_brin")
+        for statement in statements:
+            started = time.perf_counter()
+            execute(cur, statement.format(table=table, schema="{schema}"))
+            index_name = statement.split()[2].format(table=table)
+            print(f"  {index_name} ({time.perf_counter() - started:.1f}s)")
+        execute(cur, f"ANALYZE {{schema}}.{table}")
+    conn.commit()
+
+
+def index_sizes(conn):
+    cur = conn.cursor()
+    execute(cur, """
+        SELECT c.relname, sum(pg_relation_size(i.inhrelid))
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_inherits i ON i.inhparent = c.oid
+        WHERE n.nspname = %(schema)s AND c.relkind = 'I'
+        GROUP BY c.relname ORDER BY c.relname
+    """, {"schema": SCHEMA})
+    for name, size in cur.fetchall():
+        print(f"  {name}: {size / 1024 / 1024:,.0f} MB")
+
+
+def explain_queries(conn, params):
+    cur = conn.cursor()
+    timings = {}
+    for name, sql in QUERIES.items():
+        execute(cur, "EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+        plan = [row[0] for row in cur.fetchall()]
+        timings[name] = next(
+            (float(line.split(":")[1].split()[0]) for line in plan if line.startswith("Execution Time")),
+            None
+        )
+        print(f"\n--- {name} ---")
+        print("\n".join(plan))
+    conn.rollback()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=35)
+    parser.add_argument("--interval", type=int, default=30, help="metric sample interval (seconds)")
+    parser.add_argument("--process-interval", type=int, default=150,
+                        help="top-process sample interval (seconds), 5 processes per sample")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema afterwards")
+    args = parser.parse_args()
+
+    if not settings.DATABASE_URL.startswith("postgresql"):
+        print("This benchmark needs PostgreSQL")
+        sys.exit(1)
+
+    engine = create_engine(settings.DATABASE_URL)
+    conn = engine.raw_connection()
+    first_day = date.today() - timedelta(days=args.days)
+    params = {
+        "resource_id": args.resources // 2,
+        # Mid-afternoon of the last loaded day
+        "until": f"{(first_day + timedelta(days=args.days - 1)).isoformat()} 15:00:00",
+    }
+
+    try:
+        expected = args.resources * args.days * 86400 // args.interval
+        print(f"Loading ~{expected:,} metric rows into {SCHEMA}...")
+        create_schema(conn.cursor(), first_day, args.days)
+        conn.commit()
+        load_data(conn, first_day, args.days, args.resources, args.interval, args.process_interval)
+
+        print("\nBuilding legacy single-column indexes...")
+        build_indexes(conn, LEGACY_INDEXES)
+        index_sizes(conn)
+        before = explain_queries(conn, params)
+
+        print("\nBuilding composite + BRIN indexes...")
+        build_indexes(conn, NEW_INDEXES)
+        index_sizes(conn)
+        after = explain_queries(conn, params)
+
+        print("\nExecution time (ms)        before      after")
+        for name in QUERIES:
+            print(f"  {name:<22} {before[name]:>10.2f} {after[name]:>10.2f}")
+    finally:
+        if not args.keep:
+            execute(conn.cursor(), "DROP SCHEMA IF EXISTS {schema} CASCADE")
+            conn.commit()
+        conn.close()
+
+    print("\n✓ Benchmark finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark the /metrics scrape
+
+Fills the per-resource metrics snapshot with synthetic resources (20k by
+default, no Redis needed) and measures, per scrape:
+  - the text rendering used by /metrics (ResourceSnapshotStore.render)
+  - the generic Collector path (GaugeMetricFamily + generate_latest)
+along with the payload size and the memory held by the snapshot.
+
+Usage:
+    python benchmark_metrics_scrape.py [--resources 20000] [--scrapes 20]
+"""
+import argparse
+import random
+import statistics
+import time
+import tracemalloc
+from prometheus_client import CollectorRegistry, generate_latest
+from app.core.monitoring import RESOURCE_METRICS, SnapshotCollector, render_metrics
+import app.core.monitoring as monitoring
+
+
+def fill(collector: SnapshotCollector, resources: int):
+    now = time.time()
+    for resource_id in range(1, resources + 1):
+        collector.store.update(
+            resource_id,
+            (str(resource_id), f"host-{resource_id:05d}", f"10.{resource_id // 65536}.{resource_id // 256 % 256}.{resource_id % 256}"),
+            [random.uniform(0, 100) for _ in RESOURCE_METRICS],
+            now
+        )
+    # Serve the filled store as is instead of refreshing it from Redis
+    collector._refreshed_at = time.monotonic()
+
+
+def timed(func, scrapes: int):
+    durations = []
+    result = None
+    for _ in range(scrapes):
+        started = time.perf_counter()
+        result = func()
+        durations.append((time.perf_counter() - started) * 1000)
+    return result, durations
+
+
+def report(name: str, durations, payload: bytes):
+    print(f"  {name:<24} median {statistics.median(durations):8.1f} ms   "
+          f"max {max(durations):8.1f} ms   {len(payload) / 1024 / 1024:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=20000)
+    parser.add_argument("--scrapes", type=int, default=20)
+    args = parser.parse_args()
+
+    collector = SnapshotCollector(ttl=3600, max_resources=max(args.resources, 1))
+    monitoring.RESOURCE_COLLECTOR = collector
+
+    tracemalloc.start()
+    fill(collector, args.resources)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"Snapshot of {args.resources:,} resources "
+          f"({args.resources * len(RESOURCE_METRICS):,} series): {held / 1024 / 1024:.1f} MB")
+
+    print("\nPer scrape:")
+    payload, durations = timed(render_metrics, args.scrapes)
+    report("/metrics (snapshot)", durations, payload)
+
+    registry = CollectorRegistry()
+    registry.register(collector)
+    generic, durations = timed(lambda: generate_latest(registry), args.scrapes)
+    report("Collector + generate_latest", durations, generic)
+
+    tracemalloc.start()
+    render_metrics()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"\nPeak allocation of one /metrics render: {peak / 1024 / 1024:.1f} MB")
+
+    print("\n✓ Benchmark finished")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Test the content-addressed agent bundle and the upload it saves
+"""
+import os
+import tarfile
+import threading
+from app.core.config import settings
+from app.services import agent_bundle, agent_deployer
+from app.services.agent_deployer import AgentDeployer
+from app.services.resource_detector import SSHCredentials
+
+FILES = {"agent.py": "print('agent')\n", "opspro-agent.service": "[Unit]\n"}
+
+
+def _fake_pip(monkeypatch, ok=True):
+    downloads = []
+
+    def download(packages, target):
+        downloads.append(tuple(packages))
+        if ok:
+            with open(os.path.join(target, "psutil-5.9.8-cp36-abi3-linux_x86_64.whl"), "wb") as f:
+                f.write(b"wheel")
+        return ok
+
+    monkeypatch.setattr(agent_bundle, "_download_wheels", download)
+    monkeypatch.setattr(agent_bundle, "_bundles", {})
+    return downloads
+
+
+def test_bundle_is_built_once_and_reproducible(monkeypatch, tmp_path):
+    """Test that a bundle is downloaded once per inputs and has the same bytes when rebuilt"""
+    monkeypatch.setattr(settings, "AGENT_BUNDLE_DIR", str(tmp_path / "first"))
+    downloads = _fake_pip(monkeypatch)
+
+    bundle = agent_bundle.get_bundle(FILES, ["psutil"])
+    assert agent_bundle.get_bundle(FILES, ["psutil"]) == bundle
+    assert downloads == [("psutil",)]
+    assert bundle.wheels and bundle.sha256 == agent_bundle.file_sha256(bundle.path)
+    with tarfile.open(bundle.path) as tar:
+        assert tar.getnames() == ["agent.py", "opspro-agent.service", "wheels/psutil-5.9.8-cp36-abi3-linux_x86_64.whl"]
+        assert tar.getmember("agent.py").mode == 0o755
+
+    # Another cache directory, same inputs: the same archive
+    monkeypatch.setattr(settings, "AGENT_BUNDLE_DIR", str(tmp_path / "second"))
+    monkeypatch.setattr(agent_bundle, "_bundles", {})
+    assert agent_bundle.get_bundle(FILES, ["psutil"]).sha256 == bundle.sha256
+
+    # A changed script is a new bundle
+    changed = agent_bundle.get_bundle({**FILES, "agent.py": "print('v2')\n"}, ["psutil"])
+    assert changed.sha256 != bundle.sha256
+    assert len(downloads) == 3
+
+
+def test_bundle_without_wheels_is_retried_later(monkeypatch, tmp_path):
+    """Test that a failed download is not repeated on every deploy, but after the retry delay"""
+    monkeypatch.setattr(settings, "AGENT_BUNDLE_DIR", str(tmp_path))
+    downloads = _fake_pip(monkeypatch, ok=False)
+
+    bundle = agent_bundle.get_bundle(FILES, ["psutil"])
+    assert not bundle.wheels
+    assert agent_bundle.get_bundle(FILES, ["psutil"]) == bundle
+    assert len(downloads) == 1
+
+    monkeypatch.setattr(settings, "AGENT_BUNDLE_RETRY_SECONDS", 0)
+    agent_bundle.get_bundle(FILES, ["psutil"])
+    assert len(downloads) == 2
+
+
+def test_slow_build_does_not_block_other_bundles(monkeypatch, tmp_path):
+    """Test that a download holds back only callers of the same bundle, which is built once"""
+    monkeypatch.setattr(settings, "AGENT_BUNDLE_DIR", str(tmp_path))
+    downloads = _fake_pip(monkeypatch)
+    fast = agent_bundle._download_wheels
+    started, release = threading.Event(), threading.Event()
+
+    def download(packages, target):
+        if "slow" in packages:
+            started.set()
+            release.wait(5)
+        return fast(packages, target)
+
+    monkeypatch.setattr(agent_bundle, "_download_wheels", download)
+    results = []
+    slow = [threading.Thread(target=lambda: results.append(agent_bundle.get_bundle(FILES, ["slow"]))) for _ in range(2)]
+    for thread in slow:
+        thread.start()
+    assert started.wait(5)
+
+    assert agent_bundle.get_bundle(FILES, ["psutil"]).wheels
+    assert not results
+    release.set()
+    for thread in slow:
+        thread.join(5)
+    assert results[0] == results[1]
+    assert downloads == [("psutil",), ("slow",)]
+
+
+class FakeClient:
+    def close(self):
+        pass
+
+
+def _deployer(monkeypatch, installed_sha, failing=""):
+    """A deployer whose SSH commands are recorded; the host reports `installed_sha`"""
+    commands, uploads = [], []
+    deployer = AgentDeployer(
+        SSHCredentials(host="10.0.0.5", port=22, username="root", password="s3cret"),
+        resource_id=7, api_token="agent-token", backend_url="http://api"
+    )
+
+    def execute(command):
+        commands.append(command)
+        if command.startswith("cat "):
+            return installed_sha
+        return "active" if "is-active" in command else ""
+
+    def pipe(command, chunks):
+        uploads.append((command, b"".join(chunks)))
+        if failing and failing in command:
+            raise RuntimeError(f"'{command}' exited with 1")
+
+    monkeypatch.setattr(deployer, "connect", lambda: setattr(deployer, "client", FakeClient()))
+    monkeypatch.setattr(deployer, "execute", execute)
+    monkeypatch.setattr(deployer, "_pipe", pipe)
+    monkeypatch.setattr(agent_deployer.time, "sleep", lambda seconds: None)
+    return deployer, commands, uploads
+
+
+def test_deploy_skips_upload_when_host_has_the_bundle(monkeypatch, tmp_path):
+    """Test that the bundle is streamed once and a host already holding it only gets its config"""
+    monkeypatch.setattr(settings, "AGENT_BUNDLE_DIR", str(tmp_path))
+    _fake_pip(monkeypatch)
+    bundle = agent_deployer.agent_bundle()
+
+    deployer, commands, uploads = _deployer(monkeypatch, installed_sha="")
+    assert deployer.deploy()
+    assert "tar -xzf - -C /opt/opspro" in uploads[0][0]
+    assert uploads[0][1] == open(bundle.path, "rb").read()
+    assert uploads[1][0].endswith("cat > /opt/opspro/agent.json && chmod 600 /opt/opspro/agent.json")
+    assert b'"api_token": "agent-token"' in uploads[1][1]
+    # The marker is written only once the dependencies are installed
+    assert uploads[3][0].endswith(f"; }} && echo {bundle.sha256} > {agent_deployer.BUNDLE_MARKER}")
+
+    deployer, commands, uploads = _deployer(monkeypatch, installed_sha=bundle.sha256)
+    assert deployer.deploy()
+    assert [command for command, _ in uploads] == [
+        "mkdir -p /opt/opspro && umask 077 && cat > /opt/opspro/agent.json && chmod 600 /opt/opspro/agent.json"
+    ]
+    assert not any("pip" in command for command in commands)
+
+
+def test_failed_steps_are_not_marked_installed(monkeypatch, tmp_path):
+    """Test that a failed service install fails the deploy, and failed dependencies leave no marker"""
+    monkeypatch.setattr(settings, "AGENT_BUNDLE_DIR", str(tmp_path))
+    _fake_pip(monkeypatch)
+
+    deployer, commands, uploads = _deployer(monkeypatch, installed_sha="", failing="install -m 644")
+    assert not deployer.deploy()
+    assert "exited with 1" in deployer.error
+    assert not any("pip" in command for command, _ in uploads)
+
+    # Native mode: the agent still starts, the next deploy installs again
+    deployer, commands, uploads = _deployer(monkeypatch, installed_sha="", failing="pip install")
+    assert deployer.deploy()
+    assert any("restart opspro-agent" in command for command in commands)
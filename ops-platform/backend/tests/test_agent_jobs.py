@@ -0,0 +1,172 @@
+"""
+Test background agent jobs and their step progress
+"""
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import app.models  # noqa: F401  (register every mapper)
+from app.core.config import settings
+from app.models.agent_job import AgentJob, AgentJobAction
+from app.models.resource import Resource, ResourceStatus, ResourceType
+from app.models.task import TaskStatus
+from app.services import agent_jobs, stats
+from app.services.agent_deployer import AgentDeployer
+from app.services.resource_detector import SSHCredentials
+from app.services.ssh_executor import SSHBusy
+from app.tasks import agent_jobs as agent_tasks
+
+CREDENTIALS = SSHCredentials(host="10.0.0.5", port=22, username="root", password="s3cret")
+
+
+def _session(monkeypatch):
+    monkeypatch.setattr(stats, "apply_changes", lambda pending: None)
+    monkeypatch.setattr(agent_jobs, "hold_host", lambda host, wait: nullcontext())
+    engine = create_engine("sqlite://")
+    Resource.__table__.create(engine)
+    AgentJob.__table__.create(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(agent_tasks, "SessionLocal", factory)
+    db = factory()
+    db.add(Resource(id=1, name="web-1", type=ResourceType.VIRTUAL, status=ResourceStatus.INACTIVE))
+    db.commit()
+    return db
+
+
+def _deploy_until(monkeypatch, failing_step=None):
+    """Replace the SSH work with one that walks the steps, failing at `failing_step`"""
+    seen = {}
+
+    def deploy(self):
+        seen["password"] = self.credentials.password
+        seen["token"] = self.api_token
+        for step in AgentDeployer.DEPLOY_STEPS:
+            self._step(step)
+            if step == failing_step:
+                self.error = f"{step} broke"
+                return False
+        return True
+
+    monkeypatch.setattr(AgentDeployer, "deploy", deploy)
+    return seen
+
+
+def _new_job(db):
+    job = agent_jobs.create_job(
+        db, AgentJobAction.DEPLOY, CREDENTIALS, 1, "admin", api_token="agent-token", backend_url="http://api"
+    )
+    db.commit()
+    return job
+
+
+def test_successful_deploy_reports_every_step(monkeypatch):
+    """Test that a job walks its steps, activates the resource and forgets the credentials"""
+    db = _session(monkeypatch)
+    seen = _deploy_until(monkeypatch)
+    job = _new_job(db)
+    assert job.status == TaskStatus.PENDING
+    assert "s3cret" not in job.secrets_enc
+
+    agent_jobs.run_job(db, job.id)
+
+    assert seen == {"password": "s3cret", "token": "agent-token"}
+    assert job.status == TaskStatus.SUCCESS
+    assert [step["status"] for step in job.steps] == ["success"] * 5
+    assert job.current_step == "verify"
+    assert job.secrets_enc is None and job.finished_at is not None
+    assert db.get(Resource, 1).status == ResourceStatus.ACTIVE
+
+
+def test_failed_step_stops_the_job(monkeypatch):
+    """Test that the failing step is marked, later ones stay pending and reruns are ignored"""
+    db = _session(monkeypatch)
+    _deploy_until(monkeypatch, failing_step="upload")
+    job = _new_job(db)
+
+    agent_jobs.run_job(db, job.id)
+    # A redelivered message does not run the job again
+    agent_jobs.run_job(db, job.id)
+
+    assert job.status == TaskStatus.FAILED
+    assert job.error == "upload broke"
+    assert [step["status"] for step in job.steps] == ["success", "failed", "pending", "pending", "pending"]
+    assert db.get(Resource, 1).status == ResourceStatus.INACTIVE
+
+
+def test_unqueued_job_fails_right_away(monkeypatch):
+    """Test that a job the broker refused is not left pending"""
+    db = _session(monkeypatch)
+    job = _new_job(db)
+
+    def refuse(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(agent_jobs.celery_app, "send_task", refuse)
+    agent_jobs.submit_job(db, job)
+
+    assert job.status == TaskStatus.FAILED
+    assert "broker down" in job.error
+    assert job.secrets_enc is None
+
+
+def test_busy_host_leaves_the_job_pending(monkeypatch):
+    """Test that a busy host raises SSHBusy before the job is claimed, so it can be retried"""
+    db = _session(monkeypatch)
+    _deploy_until(monkeypatch)
+    job = _new_job(db)
+
+    def busy(host, wait):
+        raise SSHBusy(f"Host {host} is busy with another SSH job")
+
+    monkeypatch.setattr(agent_jobs, "hold_host", busy)
+    with pytest.raises(SSHBusy):
+        agent_jobs.run_job(db, job.id)
+    assert job.status == TaskStatus.PENDING and job.secrets_enc is not None
+
+    agent_jobs.fail_pending(db, job.id, "Host stayed busy")
+    assert job.status == TaskStatus.FAILED and job.secrets_enc is None
+
+
+def test_jobs_of_a_lost_worker_are_failed(monkeypatch):
+    """Test that RUNNING jobs past the timeout are failed and recent ones are left running"""
+    db = _session(monkeypatch)
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    stale, recent = _new_job(db), _new_job(db)
+    for job, age in ((stale, settings.AGENT_JOB_TIMEOUT_SECONDS + 60), (recent, 60)):
+        job.status = TaskStatus.RUNNING
+        job.started_at = now - timedelta(seconds=age)
+    db.commit()
+
+    assert agent_jobs.reap_stale_jobs(db, now=now) == 1
+    assert stale.status == TaskStatus.FAILED and "Worker lost" in stale.error
+    assert recent.status == TaskStatus.RUNNING
+
+
+def test_task_reports_the_final_status(monkeypatch):
+    """Test that the Celery task runs the job and returns its status"""
+    db = _session(monkeypatch)
+    _deploy_until(monkeypatch)
+    job = _new_job(db)
+
+    assert agent_tasks.run_agent_job(job.id) == {"job_id": job.id, "status": "success"}
+    assert agent_tasks.run_agent_job(12345) == {"job_id": 12345, "missing": True}
+
+
+def test_no_connection_is_held_while_waiting_for_the_host(monkeypatch):
+    """Test that the session has no open transaction while the host lease is awaited"""
+    db = _session(monkeypatch)
+    _deploy_until(monkeypatch)
+    job = _new_job(db)
+    in_transaction = []
+
+    def hold(host, wait):
+        in_transaction.append(db.in_transaction())
+        return nullcontext()
+
+    monkeypatch.setattr(agent_jobs, "hold_host", hold)
+    db.get(AgentJob, job.id)
+    agent_jobs.run_job(db, job.id, wait=5)
+
+    assert in_transaction == [False]
+    assert job.status == TaskStatus.SUCCESS
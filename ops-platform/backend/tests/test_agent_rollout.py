@@ -0,0 +1,199 @@
+"""
+Test fleet-wide agent rollouts
+"""
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest
+from celery.exceptions import SoftTimeLimitExceeded
+from pydantic import ValidationError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import app.models  # noqa: F401  (register every mapper)
+from app.core.encryption import encrypt_string
+from app.models.agent_job import AgentJob, AgentRollout
+from app.models.resource import Resource, ResourceStatus, ResourceType
+from app.models.task import TaskStatus
+from app.schemas.agent_job import RolloutCreate, RolloutSelector
+from app.services import agent_jobs, agent_rollout, stats
+from app.services.agent_deployer import AgentDeployer
+from app.tasks import agent_jobs as agent_tasks
+
+
+def _fleet(monkeypatch, tmp_path, hosts=10):
+    monkeypatch.setattr(stats, "apply_changes", lambda pending: None)
+    monkeypatch.setattr(agent_jobs, "hold_host", lambda host, wait: nullcontext())
+    # A file database: the rollout runs its jobs on threads with their own sessions
+    engine = create_engine(f"sqlite:///{tmp_path / 'ops.db'}")
+    for model in (Resource, AgentJob, AgentRollout):
+        model.__table__.create(engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add_all([
+        Resource(
+            id=i, name=f"web-{i}", type=ResourceType.VIRTUAL, status=ResourceStatus.INACTIVE,
+            ip_address=f"10.0.0.{i}", ssh_password_enc=encrypt_string("pw"),
+            tags=["web"] if i % 2 else ["web", "edge"], labels={"zone": "a" if i <= 5 else "b"}
+        )
+        for i in range(1, hosts + 1)
+    ])
+    db.add(Resource(
+        id=100, name="no-ip", type=ResourceType.VIRTUAL, status=ResourceStatus.INACTIVE,
+        ssh_password_enc=encrypt_string("pw")
+    ))
+    db.commit()
+    return db, factory
+
+
+def _deploys(monkeypatch, failing=()):
+    """Fake deploys (failing on the given hosts), recording how many run at once"""
+    state = {"running": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def deploy(self):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        self._step("connect")
+        time.sleep(0.02)
+        with lock:
+            state["running"] -= 1
+        if self.credentials.host in failing:
+            self.error = "connection refused"
+            return False
+        return True
+
+    monkeypatch.setattr(AgentDeployer, "deploy", deploy)
+    return state
+
+
+def _start(db, **settings):
+    request = RolloutCreate(selector=RolloutSelector(type=ResourceType.VIRTUAL), **settings)
+    rollout = agent_rollout.create_rollout(db, request, "admin", "token", "http://api")
+    db.commit()
+    return rollout
+
+
+def test_selector_and_batch_plan(monkeypatch, tmp_path):
+    """Test that tags and labels narrow the selection and batches start with the canary"""
+    db, _ = _fleet(monkeypatch, tmp_path)
+
+    selected = agent_rollout.select_resources(db, RolloutSelector(tags=["edge"], labels={"zone": "b"}))
+
+    assert [r.id for r in selected] == [6, 8, 10]
+    assert agent_rollout.plan_batches(10, 1, 4) == [1, 4, 4, 1]
+    assert agent_rollout.plan_batches(3, 0, 4) == [3]
+    with pytest.raises(ValidationError):
+        RolloutSelector()
+
+
+def test_rollout_runs_batches_in_parallel(monkeypatch, tmp_path):
+    """Test that every host is deployed, batch by batch, up to `parallelism` at once"""
+    db, factory = _fleet(monkeypatch, tmp_path)
+    state = _deploys(monkeypatch)
+    rollout = _start(db, parallelism=4, canary_size=1, batch_size=5)
+
+    assert rollout.total_hosts == 10 and rollout.batches == 3
+    assert [s["reason"] for s in rollout.skipped] == ["No IP address"]
+    agent_rollout.run_rollout(db, rollout.id, factory)
+
+    report = agent_rollout.rollout_report(db, db.get(AgentRollout, rollout.id))
+    assert report["status"] == TaskStatus.SUCCESS
+    assert report["counts"]["success"] == 10
+    assert [b["hosts"] for b in report["batch_reports"]] == [1, 5, 4]
+    assert report["failures"] == []
+    assert 1 < state["peak"] <= 4
+    assert db.query(Resource).filter(Resource.status == ResourceStatus.ACTIVE).count() == 10
+
+
+def test_failed_canary_stops_the_rollout(monkeypatch, tmp_path):
+    """Test that a canary failure cancels every other host"""
+    db, factory = _fleet(monkeypatch, tmp_path)
+    _deploys(monkeypatch, failing={"10.0.0.1"})
+    rollout = _start(db, parallelism=4, canary_size=1, batch_size=5)
+
+    agent_rollout.run_rollout(db, rollout.id, factory)
+
+    report = agent_rollout.rollout_report(db, db.get(AgentRollout, rollout.id))
+    assert report["status"] == TaskStatus.FAILED
+    assert report["stop_reason"].startswith("Canary batch failed")
+    assert report["counts"]["failed"] == 1 and report["counts"]["cancelled"] == 9
+    assert report["failures"][0]["host"] == "10.0.0.1"
+    assert report["failures"][0]["error"] == "connection refused"
+
+
+def test_failure_rate_stops_the_rollout(monkeypatch, tmp_path):
+    """Test that the rollout stops after the batch that pushed failures over the limit"""
+    db, factory = _fleet(monkeypatch, tmp_path)
+    _deploys(monkeypatch, failing={"10.0.0.3", "10.0.0.4"})
+    rollout = _start(db, parallelism=2, canary_size=1, batch_size=4, max_failure_rate=0.3)
+
+    agent_rollout.run_rollout(db, rollout.id, factory)
+
+    report = agent_rollout.rollout_report(db, db.get(AgentRollout, rollout.id))
+    assert report["status"] == TaskStatus.FAILED
+    assert "above the 30% limit after batch 1" in report["stop_reason"]
+    assert report["counts"] == {"pending": 0, "running": 0, "success": 3, "failed": 2, "cancelled": 5}
+    assert report["failure_rate"] == 0.4
+
+
+def test_parallelism_is_not_bounded_by_the_database_pool(monkeypatch, tmp_path):
+    """Test that more hosts than pooled connections deploy at once: SSH work holds no connection"""
+    db, _ = _fleet(monkeypatch, tmp_path)
+    db.close()
+    state = _deploys(monkeypatch)
+    monkeypatch.setattr(agent_rollout.settings, "DB_POOL_SIZE", 2)
+    monkeypatch.setattr(agent_rollout.settings, "DB_MAX_OVERFLOW", 0)
+    engine = create_engine(f"sqlite:///{tmp_path / 'ops.db'}", pool_size=2, max_overflow=0, pool_timeout=5)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    rollout = _start(db, parallelism=8, canary_size=0, batch_size=10)
+
+    agent_rollout.run_rollout(db, rollout.id, factory)
+
+    assert state["peak"] > 2
+    assert db.get(AgentRollout, rollout.id).status == TaskStatus.SUCCESS
+
+
+def test_soft_time_limit_does_not_wait_for_the_batch(monkeypatch, tmp_path):
+    """Test that the pool is shut down without waiting, the task closes the rollout and tolerates a missing one"""
+    db, factory = _fleet(monkeypatch, tmp_path)
+    _deploys(monkeypatch)
+    rollout = _start(db, parallelism=4, canary_size=0, batch_size=10)
+    shutdowns = []
+
+    class Interrupted(agent_rollout.ThreadPoolExecutor):
+        def map(self, fn, *iterables):
+            raise SoftTimeLimitExceeded()
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            shutdowns.append((wait, cancel_futures))
+            super().shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    monkeypatch.setattr(agent_rollout, "ThreadPoolExecutor", Interrupted)
+    monkeypatch.setattr(agent_tasks, "SessionLocal", factory)
+    result = agent_tasks.run_agent_rollout(rollout.id)
+
+    assert shutdowns == [(False, True)]
+    assert result == {"rollout_id": rollout.id, "status": "failed"}
+    db.expire_all()
+    assert db.get(AgentRollout, rollout.id).stop_reason == "Rollout time limit reached"
+
+    monkeypatch.setattr(agent_tasks, "run_rollout", Mock(side_effect=SoftTimeLimitExceeded()))
+    assert agent_tasks.run_agent_rollout(999) == {"rollout_id": 999, "missing": True}
+
+
+def test_rollouts_of_a_killed_worker_are_failed(monkeypatch, tmp_path):
+    """Test that a RUNNING rollout past its time limit is closed and its pending jobs cancelled"""
+    db, _ = _fleet(monkeypatch, tmp_path)
+    rollout = _start(db, parallelism=4, canary_size=0, batch_size=10)
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    rollout.status = TaskStatus.RUNNING
+    rollout.started_at = now - timedelta(seconds=agent_rollout.settings.ROLLOUT_TIME_LIMIT_SECONDS + 120)
+    db.commit()
+
+    assert agent_rollout.reap_stale_rollouts(db, now=now) == 1
+    assert rollout.status == TaskStatus.FAILED
+    assert agent_rollout.job_counts(db, rollout.id)[0] == {"cancelled": 10}
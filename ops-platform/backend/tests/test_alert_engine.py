@@ -0,0 +1,109 @@
+"""
+Test in-memory alert rule evaluation
+"""
+from datetime import datetime, timedelta
+from app.models.alert import AlertSeverity
+from app.services.alert_engine import (
+    AlertEngine, CompiledRule, CONDITIONS, FIRING, REFRESH, RESOLVED, alert_fingerprint
+)
+
+
+def _rule(rule_id=1, metric="cpu_usage", condition=">", threshold=80.0, duration=60):
+    return CompiledRule(
+        id=rule_id, name=f"rule{rule_id}", metric=metric, condition=condition,
+        threshold=threshold, duration=duration, severity=AlertSeverity.WARNING,
+        check=CONDITIONS[condition]
+    )
+
+
+def _engine(*rules, open_alerts=(), alert_refresh=60):
+    engine = AlertEngine(alert_refresh=alert_refresh)
+    engine.set_rules(rules, open_alerts)
+    return engine
+
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def test_fires_only_after_duration():
+    """Test that a rule fires once the condition held for its duration, and only once"""
+    engine = _engine(_rule(duration=60))
+
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0) == []
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0 + timedelta(seconds=30)) == []
+
+    transitions = engine.evaluate(1, {"cpu_usage": 96}, T0 + timedelta(seconds=60))
+    assert [t.kind for t in transitions] == [FIRING]
+    assert transitions[0].value == 96
+
+    # Still breaching: no new writes
+    assert engine.evaluate(1, {"cpu_usage": 97}, T0 + timedelta(seconds=90)) == []
+
+
+def test_recovery_resets_pending_state():
+    """Test that a dip below threshold restarts the duration timer"""
+    engine = _engine(_rule(duration=60))
+
+    engine.evaluate(1, {"cpu_usage": 95}, T0)
+    engine.evaluate(1, {"cpu_usage": 50}, T0 + timedelta(seconds=30))
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0 + timedelta(seconds=60)) == []
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0 + timedelta(seconds=120))[0].kind == FIRING
+
+
+def test_resolves_open_alert():
+    """Test that an alert already open in the DB resolves on recovery"""
+    engine = _engine(_rule(), open_alerts=[(1, 7)])
+
+    # First sample after loading refreshes the open alert
+    assert [t.kind for t in engine.evaluate(7, {"cpu_usage": 95}, T0)] == [REFRESH]
+    engine.evaluate(7, {"cpu_usage": 96}, T0 + timedelta(seconds=10))
+    transitions = engine.evaluate(7, {"cpu_usage": 10}, T0 + timedelta(seconds=30))
+    assert [(t.kind, t.resource_id, t.count) for t in transitions] == [(RESOLVED, 7, 1)]
+    assert engine.evaluate(7, {"cpu_usage": 10}, T0 + timedelta(seconds=60)) == []
+
+
+def test_rules_are_per_metric_and_resource():
+    """Test that rules only see their metric and keep state per resource"""
+    engine = _engine(_rule(1, "cpu_usage", duration=0), _rule(2, "disk_usage", "<", 10, duration=0))
+
+    transitions = engine.evaluate(1, {"cpu_usage": 90, "disk_usage": 50, "memory_usage": 99}, T0)
+    assert [t.rule.id for t in transitions] == [1]
+
+    transitions = engine.evaluate(2, {"cpu_usage": 10, "disk_usage": 5}, T0)
+    assert [t.rule.id for t in transitions] == [2]
+
+
+def test_reload_keeps_pending_timers():
+    """Test that reloading rules does not restart pending durations"""
+    rule = _rule(duration=60)
+    engine = _engine(rule)
+    engine.evaluate(1, {"cpu_usage": 95}, T0)
+
+    engine.set_rules([rule])
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0 + timedelta(seconds=60))[0].kind == FIRING
+
+
+def test_refresh_is_throttled_and_counts_occurrences():
+    """Test that a firing alert is refreshed at most once per interval with the hits since"""
+    engine = _engine(_rule(duration=0), alert_refresh=60)
+
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0)[0].kind == FIRING
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0 + timedelta(seconds=30)) == []
+
+    refresh = engine.evaluate(1, {"cpu_usage": 97}, T0 + timedelta(seconds=60))
+    assert [(t.kind, t.count, t.value) for t in refresh] == [(REFRESH, 2, 97)]
+
+    assert engine.evaluate(1, {"cpu_usage": 95}, T0 + timedelta(seconds=90)) == []
+    refresh = engine.evaluate(1, {"cpu_usage": 99}, T0 + timedelta(seconds=120))
+    assert [(t.kind, t.count) for t in refresh] == [(REFRESH, 2)]
+
+
+def test_fingerprint_is_stable_and_label_order_independent():
+    """Test that fingerprints depend on rule, resource and labels only"""
+    a = alert_fingerprint(1, 2, {"metric": "cpu_usage", "env": "prod"})
+    b = alert_fingerprint(1, 2, {"env": "prod", "metric": "cpu_usage"})
+
+    assert a == b
+    assert len(a) == 64
+    assert a != alert_fingerprint(1, 3, {"metric": "cpu_usage", "env": "prod"})
+    assert a != alert_fingerprint(2, 2, {"metric": "cpu_usage", "env": "prod"})
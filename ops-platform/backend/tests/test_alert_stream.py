@@ -0,0 +1,30 @@
+"""
+Test alert stream encoding and shard assignment
+"""
+from datetime import datetime
+from app.services.alert_stream import decode_sample, encode_sample, shard_for, stream_key
+from app.tasks.alert_worker import target_shards
+
+
+def test_sample_round_trip():
+    """Test that samples survive encoding to stream fields"""
+    sample = (42, "web-01", {"cpu_usage": 91.5, "network_in": None}, datetime(2024, 1, 1, 12, 0, 30))
+    fields = encode_sample(sample)
+
+    assert all(isinstance(v, str) for v in fields.values())
+    assert decode_sample(fields) == sample
+
+
+def test_resource_always_maps_to_same_shard():
+    """Test that a resource's samples go to one stream, keeping them ordered"""
+    assert shard_for(42, 16) == shard_for(42, 16) == 10
+    assert {shard_for(r, 4) for r in range(100)} == {0, 1, 2, 3}
+    assert stream_key(3).endswith(":3")
+
+
+def test_target_shards_covers_every_shard():
+    """Test that the per-worker share always adds up to at least all shards"""
+    for workers in range(1, 20):
+        assert target_shards(16, workers) * workers >= 16
+    assert target_shards(16, 0) == 16
+    assert target_shards(16, 3) == 6
@@ -0,0 +1,53 @@
+"""
+Test dashboard composition and request coalescing
+"""
+import asyncio
+from app.core.cache import SingleFlight
+from app.services.dashboard import compose_dashboard
+
+
+def _vector(value, **labels):
+    return {"metric": labels, "value": [1700000000, str(value)]}
+
+
+def test_compose_dashboard_from_query_results():
+    """Test that scalars, heatmap and top list are built from the query vectors"""
+    payload = compose_dashboard({
+        "total_online": [_vector(2)],
+        "avg_cpu": [_vector(55.55)],
+        "total_net_in": [_vector(1.5)],
+        "total_net_out": [_vector(2)],
+        "top_cpu": [_vector(40, resource_id="2"), _vector(90, resource_id="1")],
+        "all_nodes": [_vector(90, resource_id="1", resource_name="a"), _vector(40, resource_id="2")],
+    }, total_resources=3)
+
+    assert payload["total_resources"] == 3
+    assert payload["online_resources"] == 2
+    assert payload["average_cpu_usage"] == round(55.55, 1)
+    assert payload["average_memory_usage"] == 0
+    assert payload["total_network_traffic"] == 3.5
+    assert [r["id"] for r in payload["top_cpu_resources"]] == ["1", "2"]
+    assert [r["status"] for r in payload["all_resources_status"]] == ["critical", "normal"]
+
+
+def test_singleflight_shares_one_call():
+    """Test that concurrent callers of a key share a single computation"""
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": 42}
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("dashboard", compute) for _ in range(10)))
+        # Finished calls are forgotten; the next caller computes again
+        assert "dashboard" not in flights
+        return results
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(value == {"value": 42} for value, _ in results)
+    assert sum(shared for _, shared in results) == 9
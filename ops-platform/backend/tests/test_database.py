@@ -0,0 +1,11 @@
+"""
+Test the database engine configuration
+"""
+from app.core.database import async_database_url
+
+
+def test_async_database_url_uses_asyncpg():
+    """Test that PostgreSQL URLs get the asyncpg driver and keep their credentials"""
+    assert async_database_url("postgresql://ops:s3cret@db:5432/ops") == "postgresql+asyncpg://ops:s3cret@db:5432/ops"
+    assert async_database_url("postgresql+psycopg2://ops@db/ops") == "postgresql+asyncpg://ops@db/ops"
+    assert async_database_url("sqlite://") == "sqlite://"
@@ -0,0 +1,83 @@
+"""
+Test history downsampling helpers
+"""
+import math
+import random
+from app.services.downsampling import bucket_width, lttb_indices
+from app.services.metric_history import _lttb
+from app.services.metric_rollups import ROLLUP_METRICS
+
+
+def test_bucket_width_is_multiple_of_step():
+    """Test that buckets fit the budget and align to the source step"""
+    # 24h of 30s samples into 500 points
+    width = bucket_width(24 * 3600, 500, 30)
+    assert width % 30 == 0
+    assert 24 * 3600 / width <= 500
+    # Never narrower than the source step
+    assert bucket_width(600, 500, 30) == 30
+
+
+def test_lttb_keeps_endpoints_and_threshold():
+    """Test that LTTB returns exactly threshold sorted indices including both ends"""
+    xs = list(range(1000))
+    ys = [math.sin(x / 20) for x in xs]
+    indices = lttb_indices(xs, ys, 100)
+
+    assert len(indices) == 100
+    assert indices[0] == 0
+    assert indices[-1] == 999
+    assert indices == sorted(set(indices))
+
+
+def test_lttb_preserves_spike():
+    """Test that a single spike survives downsampling"""
+    xs = list(range(1000))
+    ys = [1.0] * 1000
+    ys[517] = 100.0
+
+    assert 517 in lttb_indices(xs, ys, 50)
+
+
+def test_lttb_short_series_untouched():
+    """Test that series within the budget are returned as-is"""
+    assert lttb_indices([0, 1, 2], [5, 6, 7], 10) == [0, 1, 2]
+
+
+def _history_points():
+    return [
+        {
+            "timestamp": f"2024-01-01T{i // 60:02d}:{i % 60:02d}:00",
+            "cpu_usage": float(i % 7),
+            "memory_usage": float(i % 11),
+            "disk_usage": 50.0,
+            "network_in": float(i % 13),
+            "network_out": None,
+        }
+        for i in range(1200)
+    ]
+
+
+def test_history_lttb_respects_budget():
+    """Test that the per-metric LTTB union stays within max_points"""
+    points = _history_points()
+    thinned = _lttb(points, 100)
+
+    assert len(thinned) <= 100
+    assert thinned[0] is points[0]
+    assert thinned[-1] is points[-1]
+
+
+def test_history_lttb_respects_small_budgets():
+    """Test that budgets too small for three points per metric are not exceeded either"""
+    # Independent noise per metric, so each picks its own points
+    rng = random.Random(7)
+    points = [
+        {"timestamp": p["timestamp"], **{metric: rng.random() for metric in ROLLUP_METRICS}}
+        for p in _history_points()
+    ]
+    for max_points in range(3, 16):
+        thinned = _lttb(points, max_points)
+        assert len(thinned) <= max_points
+        assert thinned[0] is points[0]
+        assert thinned[-1] is points[-1]
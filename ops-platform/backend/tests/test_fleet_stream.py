@@ -0,0 +1,76 @@
+"""
+Test the live fleet stream: aggregation, deltas and resynchronisation
+"""
+import asyncio
+import json
+from app.services import fleet_stream
+from app.services.fleet_stream import RESYNC, build_fleet, diff_fleet, stream_events, summarize
+
+
+def _events(chunks):
+    return [chunk.split("\n")[0] for chunk in chunks]
+
+
+def test_build_fleet_quantizes_and_skips_resources_without_state():
+    """Test that values are rounded to the resolution and missing state is skipped"""
+    exported = {"1": "web-1\t10.0.0.1", "2": "web-2\t10.0.0.2"}
+    fleet = build_fleet(exported, [["1700000000", "81.26", "40.04", "55.4"], [None, None, None, None]], {"1"})
+
+    assert list(fleet) == ["1"]
+    assert fleet["1"] == {
+        "id": "1", "name": "web-1", "ip": "10.0.0.1", "cpu": 81.0, "memory": 40.0, "disk": 55.0, "status": "critical",
+        "online": True
+    }
+
+
+def test_diff_fleet_reports_changes_and_removals():
+    """Test that only changed, new and removed resources make up a delta"""
+    previous = build_fleet({"1": "a\t", "2": "b\t"}, [["1", "10", "10", "50"], ["1", "20", "20", "70"]], {"1", "2"})
+    current = build_fleet({"1": "a\t", "3": "c\t"}, [["2", "10.2", "10", "50"], ["2", "60", "30", "70"]], {"1", "2"})
+
+    changed, removed = diff_fleet(previous, current)
+
+    # Jitter below the resolution is not a change
+    assert [entry["id"] for entry in changed] == ["3"]
+    assert changed[0]["status"] == "warning"
+    assert removed == ["2"]
+    # Only resources with status ACTIVE count as online
+    assert summarize(current) == {
+        "online_resources": 1, "average_cpu_usage": 35.0, "average_memory_usage": 20.0, "average_disk_usage": 60.0
+    }
+    assert summarize({})["online_resources"] == 0
+
+    # A status change alone is a change
+    changed, _ = diff_fleet(current, build_fleet({"1": "a\t", "3": "c\t"}, [["3", "10", "10", "50"], ["3", "60", "30", "70"]], {"1", "3"}))
+    assert [entry["id"] for entry in changed] == ["3"]
+
+
+def test_stream_events_resyncs_on_gap(monkeypatch):
+    """Test that deltas follow the snapshot in order and a gap sends a new snapshot"""
+    snapshots = [
+        {"type": "snapshot", "version": 5, "summary": {}, "resources": {}},
+        {"type": "snapshot", "version": 9, "summary": {}, "resources": {}},
+        {"type": "snapshot", "version": 9, "summary": {}, "resources": {}},
+    ]
+
+    async def fresh_snapshot():
+        return snapshots.pop(0)
+
+    monkeypatch.setattr(fleet_stream, "_fresh_snapshot", fresh_snapshot)
+
+    async def run():
+        queue = asyncio.Queue()
+        for version in (5, 6, 8):
+            queue.put_nowait({"type": "delta", "version": version})
+        queue.put_nowait(RESYNC)
+        events = stream_events(queue, keepalive=0.01)
+        chunks = [await events.__anext__() for _ in range(4)]
+        await events.aclose()
+        return chunks
+
+    chunks = asyncio.run(run())
+
+    # 5 is already in the first snapshot, 8 skips 7, the resync finds nothing newer than 9
+    assert _events(chunks) == ["event: snapshot", "event: delta", "event: snapshot", ": keep-alive"]
+    assert json.loads(chunks[1].split("\n")[1][len("data: "):])["version"] == 6
+    assert snapshots == []
@@ -0,0 +1,102 @@
+"""
+Test the write-behind buffer batching, retries and backpressure
+"""
+import asyncio
+import threading
+from prometheus_client import REGISTRY
+from app.services import metric_buffer
+from app.services.metric_buffer import MetricWriteBuffer
+
+
+def _sample(i):
+    return ({"resource_id": i}, [])
+
+
+def _recorder(monkeypatch, fail=0, gate=None):
+    """write_samples recording its batches; the first `fail` calls raise, `gate` holds them"""
+    batches, writing = [], threading.Event()
+
+    def write(samples):
+        writing.set()
+        if gate is not None:
+            gate.wait(5)
+        if len(batches) + write.failures < fail:
+            write.failures += 1
+            raise RuntimeError("COPY failed")
+        batches.append([metric["resource_id"] for metric, _ in samples])
+
+    write.failures = 0
+    monkeypatch.setattr(metric_buffer, "write_samples", write)
+    return batches, writing
+
+
+async def _until(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition() and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+def _counter(name):
+    return REGISTRY.get_sample_value(name) or 0.0
+
+
+def test_flushes_on_size_then_on_interval(monkeypatch):
+    """Test that full batches are written at once and a partial one after the interval"""
+    batches, _ = _recorder(monkeypatch)
+    buffer = MetricWriteBuffer(max_size=100, flush_size=3, flush_interval=0.5, put_timeout=0.1)
+
+    async def run():
+        await buffer.start()
+        assert await buffer.put_many([_sample(i) for i in range(7)]) == 7
+        await _until(lambda: len(batches) == 2)
+        # Two full batches at once; the seventh sample waits for the interval
+        assert batches == [[0, 1, 2], [3, 4, 5]]
+        await _until(lambda: len(batches) == 3)
+        assert batches[-1] == [6]
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert not buffer.running
+
+
+def test_failed_copy_is_retried_then_dropped(monkeypatch):
+    """Test that a failed write is retried with the same batch, and dropped after FLUSH_RETRIES"""
+    batches, _ = _recorder(monkeypatch, fail=1)
+    buffer = MetricWriteBuffer(max_size=100, flush_size=2, flush_interval=0.05, put_timeout=0.1)
+    dropped = _counter("opspro_ingest_dropped_samples_total")
+
+    async def run(samples):
+        await buffer.start()
+        await buffer.put_many(samples)
+        await buffer.stop()
+
+    asyncio.run(run([_sample(1), _sample(2)]))
+    assert batches == [[1, 2]]
+
+    batches, _ = _recorder(monkeypatch, fail=10)
+    monkeypatch.setattr(metric_buffer, "FLUSH_RETRIES", 1)
+    asyncio.run(run([_sample(3)]))
+    assert batches == []
+    assert _counter("opspro_ingest_dropped_samples_total") == dropped + 1
+
+
+def test_full_queue_rejects_after_put_timeout(monkeypatch):
+    """Test that ingest waits for space only up to put_timeout, and nothing queued is lost"""
+    gate = threading.Event()
+    batches, writing = _recorder(monkeypatch, gate=gate)
+    buffer = MetricWriteBuffer(max_size=2, flush_size=2, flush_interval=10, put_timeout=0.05)
+    rejected = _counter("opspro_ingest_rejected_samples_total")
+
+    async def run():
+        await buffer.start()
+        assert await buffer.put_many([_sample(0), _sample(1)]) == 2
+        # The flusher is stuck writing the first batch, the queue fills up
+        assert await asyncio.to_thread(writing.wait, 5)
+        assert await buffer.put_many([_sample(i) for i in range(2, 5)]) == 2
+        gate.set()
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert _counter("opspro_ingest_rejected_samples_total") == rejected + 1
+    assert batches == [[0, 1], [2, 3]]
@@ -0,0 +1,70 @@
+"""
+Test batch metric ingest validation and row building
+"""
+from datetime import datetime, timedelta
+from app.services.metric_ingest import (
+    validate_batch, latest_per_resource, build_process_rows, MAX_PROCESSES_PER_SAMPLE
+)
+
+
+def _sample(resource_id, **overrides):
+    sample = {"resource_id": resource_id, "cpu_usage": 10, "memory_usage": 20, "disk_usage": 30}
+    sample.update(overrides)
+    return sample
+
+
+def test_validate_batch_reports_per_item_status():
+    """Test that invalid items are rejected without rejecting the batch"""
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    valid, results = validate_batch([
+        _sample(1),
+        _sample(2, cpu_usage=150),
+        "not-an-object",
+        _sample(3, timestamp=(now + timedelta(hours=1)).isoformat()),
+        _sample(4, timestamp=(now - timedelta(days=365)).isoformat()),
+    ], now)
+
+    assert [index for index, _ in valid] == [0]
+    assert [r["status"] for r in results] == ["accepted", "rejected", "rejected", "rejected", "rejected"]
+    assert results[1]["resource_id"] == 2
+    assert "cpu_usage" in results[1]["error"]
+    assert results[2]["resource_id"] is None
+    assert "future" in results[3]["error"]
+    assert "retention" in results[4]["error"]
+
+
+def test_validate_batch_normalizes_timestamps():
+    """Test that missing timestamps default to now and aware ones become naive UTC"""
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    valid, _ = validate_batch([
+        _sample(1),
+        _sample(1, timestamp="2024-01-01T13:00:00+02:00"),
+    ], now)
+
+    assert valid[0][1].timestamp == now
+    assert valid[1][1].timestamp == datetime(2024, 1, 1, 11, 0, 0)
+
+
+def test_latest_per_resource_picks_newest_sample():
+    """Test that the newest sample wins regardless of order in the batch"""
+    now = datetime(2024, 1, 1, 12, 0, 0)
+    valid, _ = validate_batch([
+        _sample(1, cpu_usage=50, timestamp=now.isoformat()),
+        _sample(1, cpu_usage=10, timestamp=(now - timedelta(minutes=1)).isoformat()),
+        _sample(2, cpu_usage=70),
+    ], now)
+
+    latest = latest_per_resource(sample for _, sample in valid)
+    assert latest[1].cpu_usage == 50
+    assert latest[2].cpu_usage == 70
+
+
+def test_build_process_rows_limits_top_processes():
+    """Test that only the top processes are stored"""
+    now = datetime(2024, 1, 1)
+    processes = [{"name": f"proc{i}", "pid": i} for i in range(10)]
+    rows = build_process_rows(1, processes, now)
+
+    assert len(rows) == MAX_PROCESSES_PER_SAMPLE
+    assert rows[0]["process_name"] == "proc0"
+    assert rows[0]["cpu_percent"] == 0
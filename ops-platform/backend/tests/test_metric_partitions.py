@@ -0,0 +1,66 @@
+"""
+Test the daily partition ranges kept for the metrics tables
+"""
+import re
+from datetime import date
+from sqlalchemy import create_engine
+from app.core.config import settings
+from app.services.metric_partitions import (
+    drop_expired_partitions, ensure_partitions, maintain_partitions, partition_day, partition_name
+)
+
+
+class FakeConnection:
+    """Partitions of one table, changed by the DDL the helpers execute"""
+
+    def __init__(self, *partitions):
+        self.partitions = list(partitions)
+        self.ranges = {}
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if "pg_inherits" in sql:
+            return [(name,) for name in self.partitions]
+        create = re.match(r"CREATE TABLE IF NOT EXISTS (\w+) .* FROM \('([\d-]+)'\) TO \('([\d-]+)'\)", sql)
+        if create:
+            self.partitions.append(create.group(1))
+            self.ranges[create.group(1)] = (create.group(2), create.group(3))
+        drop = re.match(r"DROP TABLE IF EXISTS (\w+)", sql)
+        if drop:
+            self.partitions.remove(drop.group(1))
+
+
+def test_partition_names_round_trip():
+    """Test that the day is recovered from a partition name and other tables are ignored"""
+    assert partition_name("metrics", date(2024, 1, 31)) == "metrics_p20240131"
+    assert partition_day("process_metrics_p20240229") == date(2024, 2, 29)
+    assert partition_day("metrics_default") is None
+    assert partition_day("metrics_p2024013") is None
+
+
+def test_partitions_cover_whole_days_through_the_end():
+    """Test that [start, end] gets one [day, next day) partition per missing day"""
+    conn = FakeConnection("metrics_p20240228")
+
+    created = ensure_partitions(conn, "metrics", date(2024, 2, 28), date(2024, 3, 1))
+
+    assert created == ["metrics_p20240229", "metrics_p20240301"]
+    assert conn.ranges == {
+        "metrics_p20240229": ("2024-02-29", "2024-03-01"),
+        "metrics_p20240301": ("2024-03-01", "2024-03-02"),
+    }
+    assert ensure_partitions(conn, "metrics", date(2024, 2, 28), date(2024, 3, 1)) == []
+
+
+def test_only_days_before_retention_are_dropped():
+    """Test that the first retained day stays and unrecognized partitions are left alone"""
+    conn = FakeConnection("metrics_p20240101", "metrics_p20240102", "metrics_p20240103", "metrics_default")
+
+    assert drop_expired_partitions(conn, "metrics", keep_from=date(2024, 1, 2)) == ["metrics_p20240101"]
+    assert conn.partitions == ["metrics_p20240102", "metrics_p20240103", "metrics_default"]
+
+
+def test_maintenance_skips_other_databases(monkeypatch):
+    """Test that non-PostgreSQL databases (tests, sqlite setups) are left untouched"""
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DAYS", 30)
+    assert maintain_partitions(create_engine("sqlite://"), today=date(2024, 3, 1)) == {"created": [], "dropped": []}
@@ -0,0 +1,180 @@
+"""
+Test rollup bucket alignment, the refresh of late buckets and the history resolution thresholds
+"""
+from datetime import datetime, timedelta
+import pytest
+from app.core.config import settings
+from app.services import metric_rollups
+from app.services.metric_history import select_resolution
+from app.services.metric_rollups import (
+    BUCKET_ORIGIN, ROLLUP_LEVELS_BY_NAME, floor_to_bucket, mark_touched, refresh_rollups, touched_key
+)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeRedis:
+    """The sorted set commands used for touched buckets, in memory"""
+
+    def __init__(self):
+        self.zsets = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrange(self, key, start, end):
+        return sorted(self.zsets.get(key, {}), key=self.zsets.get(key, {}).get)
+
+    def delete(self, key):
+        self.zsets.pop(key, None)
+
+
+class FakeResult:
+    def __init__(self, value=None, rowcount=0):
+        self.value, self.rowcount = value, rowcount
+
+    def scalar(self):
+        return self.value
+
+
+class FakeEngine:
+    """Answers the watermark query and records the ranges re-aggregated"""
+
+    def __init__(self, watermark):
+        self.watermark = watermark
+        self.ranges = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    connect = begin = lambda self: self
+
+    def execute(self, statement, params=None):
+        if params is None:
+            return FakeResult(self.watermark)
+        self.ranges.append((params["start"], params["end"]))
+        return FakeResult(rowcount=1)
+
+
+def test_buckets_start_on_their_boundary():
+    """Test that a bucket holds [start, start + width): the boundary opens the next one"""
+    boundary = datetime(2024, 3, 1, 12, 5, 0)
+    assert floor_to_bucket(boundary, 300) == boundary
+    assert floor_to_bucket(boundary - timedelta(microseconds=1), 300) == datetime(2024, 3, 1, 12, 0, 0)
+    assert floor_to_bucket(boundary + timedelta(seconds=299, microseconds=999999), 300) == boundary
+
+    assert floor_to_bucket(datetime(2024, 3, 1, 12, 59, 59), 60) == datetime(2024, 3, 1, 12, 59, 0)
+    assert floor_to_bucket(datetime(2024, 3, 1, 12, 59, 59), 3600) == datetime(2024, 3, 1, 12, 0, 0)
+    # Midnight across a month end
+    assert floor_to_bucket(datetime(2024, 3, 1, 0, 0, 30), 3600) == datetime(2024, 3, 1)
+    assert floor_to_bucket(datetime(2024, 2, 29, 23, 59, 59), 3600) == datetime(2024, 2, 29, 23, 0, 0)
+
+
+def test_buckets_are_aligned_to_the_origin():
+    """Test that every level counts its buckets from BUCKET_ORIGIN, as date_bin does"""
+    ts = datetime(2031, 7, 19, 8, 47, 13, 500000)
+    for seconds in (60, 300, 3600, 7 * 60):
+        start = floor_to_bucket(ts, seconds)
+        assert (start - BUCKET_ORIGIN).total_seconds() % seconds == 0
+        assert start <= ts < start + timedelta(seconds=seconds)
+
+
+def test_resolution_steps_up_at_the_point_budget(monkeypatch):
+    """Test raw -> 1m -> 5m -> 1h at the windows where the finer source exceeds the budget"""
+    monkeypatch.setattr(settings, "METRIC_HISTORY_MAX_POINTS", 2500)
+    monkeypatch.setattr(settings, "AGENT_REPORT_INTERVAL", 30)
+    step = timedelta(seconds=30)
+
+    raw_limit = timedelta(seconds=2500 * 30)
+    assert select_resolution(raw_limit) is None
+    assert select_resolution(raw_limit + step) is ROLLUP_LEVELS_BY_NAME["1m"]
+
+    one_minute_limit = timedelta(seconds=2500 * 60)
+    assert select_resolution(one_minute_limit) is ROLLUP_LEVELS_BY_NAME["1m"]
+    assert select_resolution(one_minute_limit + step) is ROLLUP_LEVELS_BY_NAME["5m"]
+
+    five_minute_limit = timedelta(seconds=2500 * 300)
+    assert select_resolution(five_minute_limit) is ROLLUP_LEVELS_BY_NAME["5m"]
+    assert select_resolution(five_minute_limit + step) is ROLLUP_LEVELS_BY_NAME["1h"]
+
+    # Beyond every budget the coarsest level is used anyway
+    assert select_resolution(timedelta(days=1000)) is ROLLUP_LEVELS_BY_NAME["1h"]
+
+
+def test_resolution_skips_sources_not_covering_the_window(monkeypatch):
+    """Test that a level whose retention is shorter than the window is skipped"""
+    monkeypatch.setattr(settings, "METRIC_HISTORY_MAX_POINTS", 1_000_000)
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DAYS", 30)
+
+    assert select_resolution(timedelta(days=30)) is None
+    one_minute_days = ROLLUP_LEVELS_BY_NAME["1m"].retention_days
+    assert one_minute_days < 31
+    assert select_resolution(timedelta(days=31)) is ROLLUP_LEVELS_BY_NAME["5m"]
+
+
+def test_samples_behind_the_watermark_are_rolled_up(monkeypatch):
+    """Test that a backfilled sample's bucket is re-aggregated by the next run, once"""
+    redis = FakeRedis()
+    monkeypatch.setattr(metric_rollups, "redis_client", redis)
+    level = ROLLUP_LEVELS_BY_NAME["1m"]
+    now = datetime(2024, 3, 1, 12, 0, 30)
+    engine = FakeEngine(watermark=datetime(2024, 3, 1, 12, 0))
+
+    # Two adjacent buckets three hours back and one in the trailing window
+    mark_touched([
+        datetime(2024, 3, 1, 9, 0, 10), datetime(2024, 3, 1, 9, 1, 50), datetime(2024, 3, 1, 11, 59, 0)
+    ])
+    refresh_rollups(engine, level, now=now)
+
+    assert engine.ranges == [
+        (datetime(2024, 3, 1, 9, 0), datetime(2024, 3, 1, 9, 2)),
+        (datetime(2024, 3, 1, 11, 58), now),
+    ]
+    assert touched_key(level) not in redis.zsets
+    # The coarser levels keep their own record
+    assert redis.zsets[touched_key(ROLLUP_LEVELS_BY_NAME["1h"])]
+
+    engine.ranges = []
+    refresh_rollups(engine, level, now=now)
+    assert engine.ranges == [(datetime(2024, 3, 1, 11, 58), now)]
+
+
+def test_touched_buckets_survive_a_failed_run(monkeypatch):
+    """Test that buckets taken by a run that fails are left for the next one"""
+    redis = FakeRedis()
+    monkeypatch.setattr(metric_rollups, "redis_client", redis)
+    level = ROLLUP_LEVELS_BY_NAME["1m"]
+    engine = FakeEngine(watermark=datetime(2024, 3, 1, 12, 0))
+    mark_touched([datetime(2024, 3, 1, 9, 0, 10)])
+
+    def fail(statement, params=None):
+        if params is None:
+            return FakeResult(engine.watermark)
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(engine, "execute", fail)
+    with pytest.raises(RuntimeError):
+        refresh_rollups(engine, level, now=datetime(2024, 3, 1, 12, 0, 30))
+    assert list(redis.zsets[touched_key(level)]) == [str(metric_rollups.bucket_offset(datetime(2024, 3, 1, 9), 60))]
@@ -0,0 +1,161 @@
+"""
+Test the registration and pruning of exported resource labels
+"""
+import asyncio
+from redis.exceptions import ConnectionError as RedisConnectionError
+from app.core import monitoring
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def _run(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+    def execute(self):
+        return self._run()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeAsyncPipeline(FakePipeline):
+    async def execute(self):
+        if self.redis.down:
+            raise RedisConnectionError("Redis is down")
+        return self._run()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeRedis:
+    """The hash and sorted set commands used by the exporter, in memory"""
+
+    def __init__(self):
+        self.hashes, self.zsets = {}, {}
+        self.writes = []
+        self.down = False
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def hset(self, key, mapping):
+        self.writes.append(dict(mapping))
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.hashes.get(key, {}).pop(field, None)
+
+    def hlen(self, key):
+        return len(self.hashes.get(key, {}))
+
+    def hkeys(self, key):
+        return list(self.hashes.get(key, {}))
+
+    def zadd(self, key, mapping, nx=False):
+        zset = self.zsets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not (nx and member in zset):
+                zset[member] = score
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    def zrangebyscore(self, key, low, high):
+        return [member for member, score in self.zsets.get(key, {}).items() if score <= high]
+
+
+class FakeAsyncRedis(FakeRedis):
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+
+def _fake_redis(monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(monitoring, "async_redis_client", redis)
+    monkeypatch.setattr(monitoring, "_registered_labels", {})
+    monkeypatch.setattr(monitoring, "_export_retry_at", 0.0)
+    return redis
+
+
+def test_labels_are_written_once_until_they_change(monkeypatch):
+    """Test that only new or changed labels are written, in one HSET per call"""
+    redis = _fake_redis(monkeypatch)
+
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1"), (2, "web-2", None)]))
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1"), (2, "web-2", None)]))
+    asyncio.run(monitoring.update_metrics("2", "web-2b", "10.0.0.2", {}))
+
+    assert redis.writes == [
+        {"1": "web-1\t10.0.0.1", "2": "web-2\t"},
+        {"2": "web-2b\t10.0.0.2"},
+    ]
+
+
+def test_labels_are_rewritten_after_the_refresh_interval(monkeypatch):
+    """Test that registered labels are written again once LABELS_REFRESH_SECONDS passed"""
+    redis = _fake_redis(monkeypatch)
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1")]))
+
+    monkeypatch.setattr(monitoring, "LABELS_REFRESH_SECONDS", 0)
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1")]))
+
+    assert redis.writes == [{"1": "web-1\t10.0.0.1"}] * 2
+
+
+def test_redis_outage_backs_off(monkeypatch):
+    """Test that a failed write is not retried on every sample, and succeeds after the backoff"""
+    redis = _fake_redis(monkeypatch)
+    redis.down = True
+    attempts = []
+    pipeline = redis.pipeline
+    monkeypatch.setattr(redis, "pipeline", lambda transaction=True: attempts.append(1) or pipeline())
+
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1")]))
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1")]))
+    assert len(attempts) == 1
+    assert "1" not in monitoring._registered_labels
+
+    redis.down = False
+    monkeypatch.setattr(monitoring, "_export_retry_at", 0.0)
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1")]))
+    assert redis.writes == [{"1": "web-1\t10.0.0.1"}]
+
+
+def test_silent_and_deleted_resources_leave_the_exported_set(monkeypatch):
+    """Test that pruning drops resources by last-seen time (aging ones never timed) and deletes drop theirs"""
+    redis = _fake_redis(monkeypatch)
+    sync = FakeRedis()
+    sync.hashes, sync.zsets = redis.hashes, redis.zsets
+    monkeypatch.setattr(monitoring, "redis_client", sync)
+    asyncio.run(monitoring.export_resources([(1, "web-1", "10.0.0.1"), (2, "web-2", "10.0.0.2")]))
+    redis.zsets[monitoring.EXPORTED_SEEN_KEY]["1"] = 1000.0
+    # Exported before last-seen times were kept
+    redis.hashes[monitoring.EXPORTED_KEY]["3"] = "legacy\t"
+
+    assert monitoring.prune_exported(max_age=600, now=2000.0) == 1
+    assert set(redis.hashes[monitoring.EXPORTED_KEY]) == {"2", "3"}
+    assert redis.zsets[monitoring.EXPORTED_SEEN_KEY]["3"] == 2000.0
+    assert monitoring.prune_exported(max_age=600, now=2700.0) == 1
+    assert set(redis.hashes[monitoring.EXPORTED_KEY]) == {"2"}
+
+    asyncio.run(monitoring.unexport_resource(2))
+    assert redis.hashes[monitoring.EXPORTED_KEY] == {}
+    assert redis.zsets[monitoring.EXPORTED_SEEN_KEY] == {}
@@ -0,0 +1,65 @@
+"""
+Test the Prometheus client circuit breaker
+"""
+import asyncio
+import httpx
+import pytest
+from app.services.prometheus import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, PrometheusClient, PrometheusUnavailable
+)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    """Test that only consecutive failures open the breaker"""
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_lets_one_trial_through_after_reset():
+    """Test that a half-open breaker allows a single trial request"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    # A failed trial opens it again, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_client_fails_fast_while_open():
+    """Test that requests stop reaching Prometheus once the breaker opens"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(503)
+
+    async def run():
+        client = PrometheusClient("http://prometheus")
+        client.breaker = CircuitBreaker(failure_threshold=2, reset_seconds=60)
+        client._client = httpx.AsyncClient(base_url="http://prometheus", transport=httpx.MockTransport(handler))
+        for _ in range(4):
+            with pytest.raises(PrometheusUnavailable):
+                await client.get("query", {"query": "up"})
+        await client.stop()
+        return client
+
+    client = asyncio.run(run())
+
+    assert calls == ["/api/v1/query", "/api/v1/query"]
+    assert not client.available
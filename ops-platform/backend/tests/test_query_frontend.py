@@ -0,0 +1,69 @@
+"""
+Test range query alignment, splitting and merging
+"""
+from app.services.query_frontend import (
+    HOUR, SubQuery, align, is_cacheable, merge_matrices, split_range, trim_matrix
+)
+
+
+def test_align_rounds_down_to_step():
+    """Test that both ends land on the step grid"""
+    assert align(1700000123.7, 1700003661, 60) == (1700000100, 1700003640)
+
+
+def test_split_range_covers_every_step_once():
+    """Test that sub-queries split at hour boundaries and cover the range exactly"""
+    start, end = align(3 * HOUR - 600, 6 * HOUR + 900, 60)
+    parts = split_range(start, end, 60)
+
+    # The first part is widened to its hour so it caches across sliding windows
+    assert parts[0] == SubQuery(2 * HOUR, 3 * HOUR - 60)
+    assert parts[1] == SubQuery(3 * HOUR, 4 * HOUR - 60)
+    assert parts[-1] == SubQuery(6 * HOUR, 6 * HOUR + 900)
+
+    timestamps = [t for part in parts for t in range(part.start, part.end + 1, 60)]
+    assert timestamps == list(range(2 * HOUR, end + 1, 60))
+
+
+def test_split_points_stay_on_odd_steps():
+    """Test that a step not dividing an hour still splits on its own grid"""
+    start, end = align(0, 3 * HOUR, 7)
+    parts = split_range(start, end, 7)
+
+    assert all(part.start % 7 == 0 and part.end % 7 == 0 for part in parts)
+    timestamps = [t for part in parts for t in range(part.start, part.end + 1, 7)]
+    assert timestamps == list(range(parts[0].start, end + 1, 7))
+
+
+def test_only_settled_parts_are_cacheable():
+    """Test that recent sub-results are never cached"""
+    now = 10 * HOUR
+    assert is_cacheable(SubQuery(0, HOUR - 60), now)
+    assert not is_cacheable(SubQuery(9 * HOUR, 10 * HOUR), now)
+
+
+def test_merge_matrices_concatenates_series():
+    """Test that per-part series are joined by their label set"""
+    a = {"metric": {"resource_id": "1"}}
+    b = {"metric": {"resource_id": "2"}}
+    merged = merge_matrices([
+        {"status": "success", "data": {"resultType": "matrix", "result": [
+            dict(a, values=[[0, "1"]]), dict(b, values=[[0, "5"]])
+        ]}},
+        {"status": "success", "data": {"resultType": "matrix", "result": [
+            dict(a, values=[[60, "2"]])
+        ]}},
+    ])
+
+    result = {item["metric"]["resource_id"]: item["values"] for item in merged["data"]["result"]}
+    assert result == {"1": [[0, "1"], [60, "2"]], "2": [[0, "5"]]}
+
+
+def test_trim_matrix_drops_samples_before_start():
+    """Test that the widened first part is cut back to the requested start"""
+    trimmed = trim_matrix({"status": "success", "data": {"resultType": "matrix", "result": [
+        {"metric": {"a": "1"}, "values": [[0, "1"], [60, "2"]]},
+        {"metric": {"a": "2"}, "values": [[0, "3"]]},
+    ]}}, 60)
+
+    assert trimmed["data"]["result"] == [{"metric": {"a": "1"}, "values": [[60, "2"]]}]
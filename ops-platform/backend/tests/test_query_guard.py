@@ -0,0 +1,73 @@
+"""
+Test PromQL normalization and cost estimation
+"""
+import asyncio
+from contextlib import asynccontextmanager
+import pytest
+from app.api.v1 import monitoring as monitoring_api
+from app.core.config import settings
+from app.models.user import User
+from app.services import query_guard
+from app.services.query_guard import (
+    QueryRejected, estimate_cost, normalize_query, selectors
+)
+
+
+def test_normalize_query_keeps_string_literals():
+    """Test that whitespace is collapsed everywhere but inside strings"""
+    assert normalize_query('  sum( rate(x{a="b  c"}[5m] ) )\n') == 'sum( rate(x{a="b  c"}[5m] ) )'
+    assert normalize_query("avg(\n  opspro_cpu_usage_percent\n)") == "avg( opspro_cpu_usage_percent )"
+
+
+def test_selectors_skip_functions_labels_and_grouping():
+    """Test that only metric names count as selectors"""
+    query = 'sum by (resource_id) (rate(opspro_network_in_mb{resource_name="web"}[5m])) > bool 10'
+    assert selectors(query) == ["opspro_network_in_mb"]
+
+
+def test_cost_grows_with_range_window_and_fleet():
+    """Test that steps, range windows and per-resource series multiply"""
+    cost = estimate_cost("rate(opspro_cpu_usage_percent[5m])", 0, 3600, 60, fleet_size=1000)
+
+    assert cost.series == 1000
+    assert cost.steps == 61
+    assert cost.samples_per_step == 300 // settings.QUERY_COST_SCRAPE_INTERVAL_SECONDS
+
+
+def test_expensive_range_query_is_clamped_or_rejected(monkeypatch):
+    """Test that a 1s step over a month is clamped, or rejected when clamping is off"""
+    monkeypatch.setattr(query_guard, "_fleet_size", (float("inf"), 20000))
+    month = 30 * 86400
+
+    step, warning = asyncio.run(query_guard.check_range("opspro_cpu_usage_percent", 0, month, 1))
+    cost = estimate_cost("opspro_cpu_usage_percent", 0, month, step, 20000)
+    assert step > 1 and "step raised" in warning
+    assert cost.steps <= settings.QUERY_MAX_POINTS
+    assert cost.samples <= settings.QUERY_MAX_SAMPLES
+
+    monkeypatch.setattr(settings, "QUERY_COST_CLAMP_STEP", False)
+    with pytest.raises(QueryRejected) as exc_info:
+        asyncio.run(query_guard.check_range("opspro_cpu_usage_percent", 0, month, 1))
+    assert exc_info.value.status_code == 422
+
+
+def test_instant_query_time_is_pinned_only_when_omitted(monkeypatch):
+    """Test that "now" is floored to the second while an explicit time is kept as given"""
+    async def allow(query):
+        return None
+
+    @asynccontextmanager
+    async def slot(user_id):
+        yield
+
+    async def coalesce(kind, key, fetch):
+        return key
+
+    monkeypatch.setattr(monitoring_api, "check_instant", allow)
+    monkeypatch.setattr(monitoring_api, "user_slot", slot)
+    monkeypatch.setattr(monitoring_api, "coalesce", coalesce)
+    monkeypatch.setattr(monitoring_api, "clock", lambda: 1700000000.75)
+    user = User(id=1, username="alice")
+
+    assert asyncio.run(monitoring_api.query_prometheus("up", None, user)) == "1700000000:up"
+    assert asyncio.run(monitoring_api.query_prometheus("up", 1699999999.5, user)) == "1699999999.5:up"
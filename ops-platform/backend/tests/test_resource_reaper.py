@@ -0,0 +1,70 @@
+"""
+Test the stale-resource reaper
+"""
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import app.models  # noqa: F401  (register every mapper)
+from app.models.resource import Resource, ResourceStatus, ResourceType
+from app.services import resource_reaper
+from app.services.alert_engine import HEARTBEAT_METRIC, metric_values
+from app.schemas.resource import ResourceMetrics
+
+NOW = datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Resource.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+
+def test_reaper_flips_only_stale_active_resources(monkeypatch):
+    """Test that stale active resources go OFFLINE, clear their series and raise heartbeat samples"""
+    cleared, submitted = [], []
+    monkeypatch.setattr(resource_reaper, "clear_resources_metrics", lambda ids: cleared.extend(ids))
+    monkeypatch.setattr(resource_reaper, "submit_samples_sync", lambda db, samples: submitted.extend(samples))
+
+    db = _session()
+    cutoff = resource_reaper.offline_cutoff(NOW)
+    db.add_all([
+        Resource(id=1, name="stale", type=ResourceType.VIRTUAL, status=ResourceStatus.ACTIVE,
+                 last_seen=cutoff - timedelta(seconds=30)),
+        Resource(id=2, name="fresh", type=ResourceType.VIRTUAL, status=ResourceStatus.ACTIVE,
+                 last_seen=cutoff + timedelta(seconds=30)),
+        Resource(id=3, name="maintenance", type=ResourceType.VIRTUAL, status=ResourceStatus.MAINTENANCE,
+                 last_seen=cutoff - timedelta(hours=1)),
+        Resource(id=4, name="never-reported", type=ResourceType.VIRTUAL, status=ResourceStatus.ACTIVE),
+    ])
+    db.commit()
+
+    stale = resource_reaper.reap_stale_resources(db, NOW)
+
+    assert [r.id for r in stale] == [1]
+    statuses = dict(db.query(Resource.id, Resource.status).all())
+    assert statuses == {
+        1: ResourceStatus.OFFLINE, 2: ResourceStatus.ACTIVE,
+        3: ResourceStatus.MAINTENANCE, 4: ResourceStatus.ACTIVE,
+    }
+    assert cleared == [1]
+    resource_id, _, values, timestamp = submitted[0]
+    assert resource_id == 1
+    assert values[HEARTBEAT_METRIC] > 0
+    assert timestamp.tzinfo is None
+
+    # A second pass finds nothing left to do
+    assert resource_reaper.reap_stale_resources(db, NOW) == []
+
+
+def test_reporting_resource_comes_back_online():
+    """Test that a sample brings a reaped resource back and resets the heartbeat age"""
+    db = _session()
+    resource = Resource(id=1, name="back", type=ResourceType.VIRTUAL, status=ResourceStatus.OFFLINE)
+    db.add(resource)
+    db.commit()
+
+    resource_reaper.mark_online(db, [resource])
+    db.commit()
+
+    assert db.query(Resource.status).scalar() == ResourceStatus.ACTIVE
+    assert metric_values(ResourceMetrics(cpu_usage=1, memory_usage=1, disk_usage=1))[HEARTBEAT_METRIC] == 0
@@ -0,0 +1,33 @@
+"""
+Test live resource state encoding
+"""
+from datetime import datetime, timezone
+from app.schemas.resource import ResourceMetrics
+from app.services.resource_state import STATE_FIELDS, _store_args, build_state, decode_state
+
+
+def test_state_round_trip_through_hash_fields():
+    """Test that a state survives the Redis hash representation"""
+    metrics = ResourceMetrics(cpu_usage=12.5, memory_usage=40, disk_usage=70, network_in=None)
+    state = build_state(metrics, datetime(2024, 1, 1, 12, 0, 0))
+
+    assert state["last_seen"] == datetime(2024, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+    # Build the hash the Lua script would write
+    args = _store_args(7, state)
+    fields = {"ts": str(args[0])}
+    pairs = args[3:]
+    fields.update({str(k): str(v) for k, v in zip(pairs[::2], pairs[1::2])})
+
+    decoded = decode_state(fields)
+    assert decoded["last_seen"] == state["last_seen"]
+    assert decoded["cpu_usage"] == 12.5
+    assert decoded["disk_usage"] == 70
+    assert "network_in" not in decoded
+    assert set(decoded) <= set(STATE_FIELDS) | {"last_seen"}
+
+
+def test_decode_state_ignores_missing_hash():
+    """Test that an empty or partial hash is treated as no cached state"""
+    assert decode_state({}) is None
+    assert decode_state({"cpu_usage": "10"}) is None
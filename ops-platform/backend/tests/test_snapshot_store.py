@@ -0,0 +1,57 @@
+"""
+Test the per-resource metric snapshot store
+"""
+from app.core.snapshot_store import ResourceSnapshotStore
+
+LABELS = ["resource_id", "resource_name", "ip_address"]
+FAMILIES = [("opspro_cpu_usage_percent", "CPU"), ("opspro_memory_usage_percent", "Memory")]
+
+
+def test_render_skips_missing_values_and_escapes_labels():
+    """Test that missing values are not exported and label values are escaped"""
+    store = ResourceSnapshotStore(2, LABELS, max_resources=10)
+    store.update(1, ("1", 'web "a"\\1', "10.0.0.1"), [12.5, None], 100.0)
+
+    text = store.render(FAMILIES)
+
+    assert "# TYPE opspro_cpu_usage_percent gauge\n" in text
+    assert 'opspro_cpu_usage_percent{resource_id="1",resource_name="web \\"a\\"\\\\1",ip_address="10.0.0.1"} 12.5\n' in text
+    assert "opspro_memory_usage_percent{" not in text
+
+
+def test_removed_slots_are_reused():
+    """Test that a removed resource's slot is handed to the next one"""
+    store = ResourceSnapshotStore(1, LABELS, max_resources=10)
+    store.update(1, ("1", "a", "ip"), [1.0], 100.0)
+    store.update(2, ("2", "b", "ip"), [2.0], 100.0)
+
+    assert store.remove(1)
+    store.update(3, ("3", "c", "ip"), [3.0], 100.0)
+
+    assert len(store) == 2
+    assert len(store._ids) == 2
+    assert [labels[0] for labels, _ in store.iter_samples(0)] == ["3", "2"]
+
+
+def test_cardinality_limit_refuses_new_resources():
+    """Test that resources beyond the limit are refused but known ones still update"""
+    store = ResourceSnapshotStore(1, LABELS, max_resources=2)
+    assert store.update(1, ("1", "a", "ip"), [1.0], 100.0)
+    assert store.update(2, ("2", "b", "ip"), [2.0], 100.0)
+
+    assert not store.update(3, ("3", "c", "ip"), [3.0], 100.0)
+    assert store.update(1, ("1", "a", "ip"), [5.0], 101.0)
+    assert store.refused == 1
+    assert 3 not in store
+
+
+def test_expire_and_retain_drop_series():
+    """Test that stale and no longer exported resources are dropped"""
+    store = ResourceSnapshotStore(1, LABELS, max_resources=10)
+    store.update(1, ("1", "a", "ip"), [1.0], 100.0)
+    store.update(2, ("2", "b", "ip"), [2.0], 200.0)
+    store.update(3, ("3", "c", "ip"), [3.0], 200.0)
+
+    assert store.expire(older_than=150.0) == 1
+    assert store.retain([2]) == 1
+    assert 2 in store and len(store) == 1
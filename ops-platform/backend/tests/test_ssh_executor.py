@@ -0,0 +1,100 @@
+"""
+Test the SSH job executor
+"""
+import asyncio
+import threading
+import time
+import pytest
+from app.services import ssh_executor as executor_module
+from app.services.ssh_executor import SSHBusy, SSHExecutor
+
+
+async def _no_lease(host):
+    return None
+
+
+def test_jobs_for_one_host_are_serialized(monkeypatch):
+    """Test that jobs on a host never overlap while other hosts run in parallel"""
+    monkeypatch.setattr(executor_module, "_acquire_lease", _no_lease)
+    executor = SSHExecutor(workers=4, max_queued=10)
+    events = []
+    guard = threading.Lock()
+    a_running = threading.Event()
+
+    def job(host):
+        with guard:
+            events.append(("start", host))
+        if host == "a":
+            a_running.set()
+            time.sleep(0.02)
+        else:
+            # Only finishes in time if a job on "a" runs alongside
+            a_running.wait(5)
+        with guard:
+            events.append(("end", host))
+        return a_running.is_set()
+
+    async def run():
+        return await asyncio.gather(*(
+            executor.run("probe", host, job, host) for host in ("a", "a", "a", "b")
+        ))
+
+    results = asyncio.run(run())
+    executor.shutdown()
+
+    assert results == [True] * 4
+    # Each job on "a" ends before the next one starts
+    assert [kind for kind, host in events if host == "a"] == ["start", "end"] * 3
+    assert executor.queued == 0 and executor.busy == 0
+    assert executor._hosts == {}
+
+
+def test_full_queue_is_refused(monkeypatch):
+    """Test that jobs beyond the queue limit are refused instead of piling up"""
+    monkeypatch.setattr(executor_module, "_acquire_lease", _no_lease)
+    executor = SSHExecutor(workers=1, max_queued=1)
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(executor.run("deploy", "a", release.wait))
+        while executor.busy < 1:
+            await asyncio.sleep(0.01)
+        # Waits for the only thread
+        second = asyncio.ensure_future(executor.run("deploy", "b", release.wait))
+        await asyncio.sleep(0.01)
+        assert executor.queued == 1
+        with pytest.raises(SSHBusy):
+            await executor.run("deploy", "c", release.wait)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == [True, True]
+    executor.shutdown()
+    assert executor.queued == 0 and executor.busy == 0
+
+
+def test_shutdown_unqueues_cancelled_jobs(monkeypatch):
+    """Test that jobs dropped by shutdown() before starting leave the queue count"""
+    monkeypatch.setattr(executor_module, "_acquire_lease", _no_lease)
+    executor = SSHExecutor(workers=1, max_queued=5)
+    release = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(executor.run("deploy", "a", release.wait))
+        while executor.busy < 1:
+            await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(executor.run("deploy", "b", release.wait))
+        while not executor.pool._work_queue.qsize():
+            await asyncio.sleep(0.01)
+        assert executor.queued == 1
+
+        executor.shutdown()
+        queued = executor.queued
+        release.set()
+        return queued, await asyncio.gather(first, second, return_exceptions=True)
+
+    queued, (first, second) = asyncio.run(run())
+    assert queued == 0
+    assert first is True
+    assert isinstance(second, asyncio.CancelledError)
+    assert executor.queued == 0 and executor.busy == 0
@@ -0,0 +1,117 @@
+"""
+Test the stats summaries and their incrementally maintained counters
+"""
+import threading
+from collections import Counter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import app.models  # noqa: F401  (register every mapper)
+from app.models.resource import Resource, ResourceStatus, ResourceType
+from app.services import stats
+from app.services.resource_reaper import mark_online
+
+
+def _session():
+    engine = create_engine("sqlite://")
+    Resource.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+
+def _applied(monkeypatch):
+    applied = []
+    monkeypatch.setattr(stats, "apply_changes", applied.append)
+    return applied
+
+
+def _commit(db):
+    db.commit()
+    stats.counter_writer.flush()
+
+
+def test_resource_summary_from_group_by(monkeypatch):
+    """Test that the summary is built from one GROUP BY over status and type"""
+    _applied(monkeypatch)
+    db = _session()
+    db.add_all([
+        Resource(name="a", type=ResourceType.VIRTUAL, status=ResourceStatus.ACTIVE),
+        Resource(name="b", type=ResourceType.VIRTUAL, status=ResourceStatus.INACTIVE),
+        Resource(name="c", type=ResourceType.PHYSICAL, status=ResourceStatus.ACTIVE),
+        Resource(name="d", type=ResourceType.CLOUD, status=ResourceStatus.OFFLINE),
+    ])
+    db.commit()
+
+    counts = stats.count_from_db(db, stats.RESOURCES)
+
+    assert counts == {"ACTIVE:VIRTUAL": 1, "INACTIVE:VIRTUAL": 1, "ACTIVE:PHYSICAL": 1, "OFFLINE:CLOUD": 1}
+    assert stats.summarize_resources(counts) == {
+        "total": 4, "active": 2, "inactive": 1,
+        "by_type": {"physical": 1, "virtual": 2, "container": 0, "cloud": 1},
+    }
+
+
+def test_committed_changes_adjust_counters(monkeypatch):
+    """Test that inserts and status changes are applied on commit and dropped on rollback"""
+    applied = _applied(monkeypatch)
+    db = _session()
+    db.add(Resource(name="a", type=ResourceType.VIRTUAL))
+    _commit(db)
+    assert applied == [{"resources": {"ACTIVE:VIRTUAL": 1}}]
+
+    resource = db.query(Resource).one()
+    resource.status = ResourceStatus.MAINTENANCE
+    _commit(db)
+    assert applied[-1] == {"resources": {"ACTIVE:VIRTUAL": -1, "MAINTENANCE:VIRTUAL": 1}}
+
+    # Changes not touching status or type, and rolled back ones, are not counted
+    resource.name = "b"
+    _commit(db)
+    resource.type = ResourceType.CLOUD
+    db.flush()
+    db.rollback()
+    assert len(applied) == 2
+
+    # The old status of an expired object is unknown: the counters are dropped
+    resource.status = ResourceStatus.ACTIVE
+    _commit(db)
+    assert applied[-1] == {"resources": None}
+
+
+def test_bulk_status_changes_are_recorded(monkeypatch):
+    """Test that resources brought back by a sample are moved from OFFLINE to ACTIVE"""
+    applied = _applied(monkeypatch)
+    db = _session()
+    db.add(Resource(name="a", type=ResourceType.PHYSICAL, status=ResourceStatus.OFFLINE))
+    _commit(db)
+
+    resource = db.query(Resource).one()
+    mark_online(db, [resource])
+    _commit(db)
+
+    assert applied[-1] == {"resources": {"OFFLINE:PHYSICAL": -1, "ACTIVE:PHYSICAL": 1}}
+    assert stats.count_from_db(db, stats.RESOURCES) == {"ACTIVE:PHYSICAL": 1}
+
+
+def test_queued_changes_are_merged():
+    """Test that commits queued behind a slow write are summed, and a dropped counter stays dropped"""
+    merged = stats.merge_changes([
+        {"resources": Counter({"ACTIVE:VIRTUAL": 1})},
+        {"resources": Counter({"ACTIVE:VIRTUAL": -1, "OFFLINE:VIRTUAL": 1}), "alerts": Counter({"FIRING:HIGH": 1})},
+        {"alerts": None},
+        {"alerts": Counter({"FIRING:HIGH": 1})},
+    ])
+    assert merged == {"resources": {"ACTIVE:VIRTUAL": 0, "OFFLINE:VIRTUAL": 1}, "alerts": None}
+
+
+def test_commit_does_not_wait_for_redis(monkeypatch):
+    """Test that the commit returns while the counters are still being written"""
+    release = threading.Event()
+    applied = []
+    monkeypatch.setattr(stats, "apply_changes", lambda pending: release.wait(5) and applied.append(pending))
+    db = _session()
+    db.add(Resource(name="a", type=ResourceType.VIRTUAL))
+    db.commit()
+    assert applied == []
+
+    release.set()
+    stats.counter_writer.flush()
+    assert applied == [{"resources": {"ACTIVE:VIRTUAL": 1}}]
@@ -0,0 +1,71 @@
+"""
+Test the single-use tickets authenticating live streams
+"""
+import asyncio
+import pytest
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError as RedisConnectionError
+import app.models  # noqa: F401  (register every mapper)
+from app.api.v1 import auth
+from app.models.user import User
+
+USER = User(username="alice", email="alice@example.com", hashed_password="x", is_active=True)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+        self.down = False
+
+    async def set(self, key, value, ex=None):
+        if self.down:
+            raise RedisConnectionError("Redis is down")
+        self.values[key] = value
+
+    async def getdel(self, key):
+        if self.down:
+            raise RedisConnectionError("Redis is down")
+        return self.values.pop(key, None)
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def scalar(self, statement):
+        return USER
+
+
+def _fake(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr(auth, "async_redis_client", redis)
+    monkeypatch.setattr(auth, "AsyncSessionLocal", FakeSession)
+    return redis
+
+
+def test_ticket_opens_one_stream(monkeypatch):
+    """Test that a ticket authenticates its user once and is then refused"""
+    _fake(monkeypatch)
+    issued = asyncio.run(auth.create_stream_ticket(USER))
+    assert issued["expires_in"] == auth.settings.STREAM_TICKET_TTL_SECONDS
+
+    assert asyncio.run(auth.get_stream_user(issued["ticket"])) is USER
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.get_stream_user(issued["ticket"]))
+    assert exc_info.value.status_code == 401
+
+
+def test_unknown_ticket_and_redis_outage_are_refused(monkeypatch):
+    """Test that unknown tickets are unauthorized and an unreachable store is a 503"""
+    redis = _fake(monkeypatch)
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.get_stream_user("forged"))
+    assert exc_info.value.status_code == 401
+
+    redis.down = True
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(auth.get_stream_user("any"))
+    assert exc_info.value.status_code == 503
@@ -6,6 +6,13 @@ export const monitoringApi = {
         return api.get('/monitoring/dashboard')
     },
 
+    // Live fleet heatmap (server-sent events: snapshot, then deltas).
+    // Opened with a single-use ticket so the access token stays out of URLs.
+    async openStream() {
+        const { data } = await api.post('/auth/stream-ticket')
+        return new EventSource(`/api/v1/monitoring/stream?ticket=${encodeURIComponent(data.ticket)}`)
+    },
+
     // Prometheus Proxy: Instant query
     query(query: string, time?: number) {
         return api.get('/monitoring/query', { params: { query, time } })
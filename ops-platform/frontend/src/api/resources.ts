@@ -44,6 +44,10 @@ export const resourceApi = {
         return api.post(`/resources/${id}/deploy-agent`, credentials)
     },
 
+    getAgentJob(jobId: number) {
+        return api.get(`/automation/agent-jobs/${jobId}`)
+    },
+
     getHistory(id: number, hours: number = 24) {
         return api.get(`/resources/${id}/metrics/history`, { params: { hours } })
     },
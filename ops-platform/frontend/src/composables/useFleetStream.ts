@@ -0,0 +1,77 @@
+import { onMounted, onUnmounted } from 'vue'
+import { monitoringApi } from '@/api/monitoring'
+
+// Live fleet (server-sent events: a snapshot, then deltas) for the lifetime
+// of the calling component. `onUpdate` gets the latest summary after every
+// event; `fleet` holds the heatmap entries by resource id.
+export function useFleetStream(onUpdate: (summary: any, fleet: Map<string, any>) => void) {
+  const fleet = new Map<string, any>()
+  let stream: EventSource | null = null
+  let reconnectTimer: ReturnType<typeof setTimeout> | null = null
+  let unmounted = false
+
+  const scheduleReconnect = () => {
+    stream?.close()
+    stream = null
+    if (!unmounted && !reconnectTimer) {
+      reconnectTimer = setTimeout(() => {
+        reconnectTimer = null
+        connect()
+      }, 5000)
+    }
+  }
+
+  const connect = async () => {
+    let opened: EventSource
+    try {
+      opened = await monitoringApi.openStream()
+    } catch (error) {
+      console.error('Failed to open the live fleet stream:', error)
+      scheduleReconnect()
+      return
+    }
+    if (unmounted) {
+      opened.close()
+      return
+    }
+    stream = opened
+
+    stream.addEventListener('snapshot', (event: MessageEvent) => {
+      const snapshot = JSON.parse(event.data)
+      fleet.clear()
+      Object.values(snapshot.resources).forEach((r: any) => fleet.set(r.id, r))
+      onUpdate(snapshot.summary, fleet)
+    })
+
+    stream.addEventListener('delta', (event: MessageEvent) => {
+      const delta = JSON.parse(event.data)
+      delta.changed.forEach((r: any) => fleet.set(r.id, r))
+      delta.removed.forEach((id: string) => fleet.delete(id))
+      onUpdate(delta.summary, fleet)
+    })
+    // Tickets are single-use, so EventSource cannot reconnect by itself:
+    // reopen with a new ticket (the server starts again with a snapshot)
+    stream.onerror = scheduleReconnect
+  }
+
+  // Start over from a fresh snapshot
+  const reconnect = () => {
+    stream?.close()
+    stream = null
+    if (reconnectTimer) {
+      clearTimeout(reconnectTimer)
+      reconnectTimer = null
+    }
+    connect()
+  }
+
+  onMounted(connect)
+
+  onUnmounted(() => {
+    unmounted = true
+    if (reconnectTimer) clearTimeout(reconnectTimer)
+    stream?.close()
+  })
+
+  return { fleet, reconnect }
+}